@@ -0,0 +1,64 @@
+import time
+import numpy as np
+import pandas as pd
+from reconciliation import reconciliation_ratio, reconciliation_totals_ratio
+
+
+GROUP_COLS = ['product_lvl_id', 'location_lvl_id', 'customer_lvl_id', 'distr_channel_lvl_id', 'PERIOD_DT']
+
+
+def generate_t1(num_series, num_periods, seed=0):
+    rng = np.random.default_rng(seed)
+    series = np.arange(num_series)
+    df_t1 = pd.DataFrame({
+        'product_lvl_id': np.repeat(series % 1000, num_periods),
+        'location_lvl_id': np.repeat(series // 1000, num_periods),
+        'customer_lvl_id': 1,
+        'distr_channel_lvl_id': 1,
+        'PERIOD_DT': np.tile(pd.date_range('2024-01-01', periods=num_periods, freq='7D'), num_series),
+        'TS_FORECAST_VALUE': rng.uniform(0, 100, num_series * num_periods),
+        'ML_FORECAST_VALUE': rng.uniform(0, 100, num_series * num_periods)
+    })
+    df_t1.loc[rng.random(len(df_t1)) < 0.05, 'ML_FORECAST_VALUE'] = np.nan
+    df_t1.loc[rng.random(len(df_t1)) < 0.05, 'TS_FORECAST_VALUE'] = 0.0
+    return df_t1
+
+
+def totals_ratio_groupby(df_t1):
+    """previous implementation: two groupbys, an outer merge and a merge back"""
+    ml_totals = df_t1.groupby(GROUP_COLS, as_index=False)['ML_FORECAST_VALUE'].sum()
+    ts_totals = df_t1.groupby(GROUP_COLS, as_index=False)['TS_FORECAST_VALUE'].sum()
+    df_totals = ml_totals.merge(ts_totals, on=GROUP_COLS, how='outer', suffixes=('_ml', '_ts'))
+    df_totals['reconciliation_ratio'] = reconciliation_ratio(
+        df_totals['ML_FORECAST_VALUE'], df_totals['TS_FORECAST_VALUE']
+    )
+    df_t2 = df_t1.merge(df_totals[GROUP_COLS + ['reconciliation_ratio']], on=GROUP_COLS, how='left')
+    return df_t2['reconciliation_ratio'].to_numpy()
+
+
+def best_time(func, *args, repeat=3):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def benchmark_totals(num_series=100000, num_periods=13):
+
+    df_t1 = generate_t1(num_series, num_periods).sort_values(GROUP_COLS, ignore_index=True)
+    print(f"df_t1 {len(df_t1)} rows")
+
+    time_groupby, ratio_groupby = best_time(totals_ratio_groupby, df_t1)
+    time_direct, ratio_direct = best_time(reconciliation_totals_ratio, df_t1)
+
+    assert np.array_equal(ratio_groupby, ratio_direct)
+
+    print(f"groupby + merge totals {time_groupby:.3f}s")
+    print(f"single aggregation totals {time_direct:.3f}s")
+    print(f"saving {time_groupby - time_direct:.3f}s ({time_groupby / time_direct:.0f}x)")
+
+
+if __name__ == '__main__':
+    benchmark_totals()
@@ -0,0 +1,235 @@
+import os
+import json
+import shutil
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from dense_demand import DenseDemand, restore_demand
+from hierarchy import key_hashes
+
+
+MANIFEST_FILE = 'manifest.json'
+
+SERIES_FILE = 'series.parquet'
+
+# cubes attached by this process, see attach_cube
+_attached = {}
+
+
+def _array_file(path, kind, name):
+    return os.path.join(path, f'{kind}.{name}.npy')
+
+
+class DemandCube(DenseDemand):
+    """
+    DenseDemand stored on disk (restored demand history), opened with memory-mapped matrices
+
+    Every value matrix, packed flag and the present bits are separate .npy files that
+    np.load maps read-only, so processes opening the same cube share the OS page cache instead
+    of holding a copy each. The sidecar key index (series keys in parquet and their sorted 64-bit
+    hashes) maps series keys to matrix rows without a merge.
+    """
+    def __init__(self, path, series, calendar, values, flags, present, series_hashes, series_order):
+        super().__init__(series, calendar, values, flags, present)
+        self.path = path
+        self.series_hashes = series_hashes
+        self.series_order = series_order
+
+
+    def rows(self, keys):
+        """
+        Matrix rows of series keys
+
+        Parameters
+        ----------
+        keys : pd.DataFrame
+            Series key columns (int and float ids match)
+
+        Returns
+        -------
+        np.ndarray
+            Row of every key tuple, -1 for series not in the cube
+        """
+        hashes = key_hashes(keys, list(self.series.columns))
+        pos = np.minimum(np.searchsorted(self.series_hashes, hashes), max(len(self.series_hashes) - 1, 0))
+        found = self.series_hashes[pos] == hashes if len(self.series_hashes) else np.zeros(len(hashes), dtype=bool)
+        return np.where(found, self.series_order[pos], -1)
+
+
+def save_cube(dense, path):
+    """
+    Write dense as a cube directory, replacing an existing one
+
+    path/
+        value.<name>.npy    float32 (n_series, n_days) matrices
+        flag.<name>.npy     bit-packed flags
+        present.npy         bit-packed present series-days
+        calendar.npy        days of the matrix columns
+        series.parquet      series keys, row i is matrix row i
+        series_hashes.npy   sorted key hashes and
+        series_order.npy    their rows
+        manifest.json       shape and names, written last
+
+    Parameters
+    ----------
+    dense : DenseDemand
+        E.g. restore_demand output or DenseDemand.from_long(RESTORED_DEMAND, values=[..., 'TGT_QTY_R'])
+    path : str
+        Cube directory
+    """
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.makedirs(path)
+
+    for name, matrix in dense.values.items():
+        np.save(_array_file(path, 'value', name), np.ascontiguousarray(matrix))
+    for name, packed in dense.flags.items():
+        np.save(_array_file(path, 'flag', name), np.ascontiguousarray(packed))
+    np.save(os.path.join(path, 'present.npy'), np.ascontiguousarray(dense.present))
+    np.save(os.path.join(path, 'calendar.npy'), dense.calendar.to_numpy())
+
+    dense.series.to_parquet(os.path.join(path, SERIES_FILE), index=False)
+    hashes = key_hashes(dense.series, list(dense.series.columns))
+    order = np.argsort(hashes, kind='stable')
+    np.save(os.path.join(path, 'series_hashes.npy'), hashes[order])
+    np.save(os.path.join(path, 'series_order.npy'), order.astype(np.int64))
+
+    manifest = {
+        'shape': list(dense.shape),
+        'keys': list(dense.series.columns),
+        'values': list(dense.values),
+        'flags': list(dense.flags)
+    }
+    with open(os.path.join(path, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+
+def open_cube(path, mmap_mode='r'):
+    """
+    Cube written by save_cube
+
+    Parameters
+    ----------
+    path : str
+        Cube directory
+    mmap_mode : str
+        np.load mmap_mode of the matrices, None reads them into memory
+
+    Returns
+    -------
+    DemandCube
+    """
+    with open(os.path.join(path, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+
+    values = {name: np.load(_array_file(path, 'value', name), mmap_mode=mmap_mode) for name in manifest['values']}
+    flags = {name: np.load(_array_file(path, 'flag', name), mmap_mode=mmap_mode) for name in manifest['flags']}
+    present = np.load(os.path.join(path, 'present.npy'), mmap_mode=mmap_mode)
+    calendar = pd.DatetimeIndex(np.load(os.path.join(path, 'calendar.npy')))
+    series = pd.read_parquet(os.path.join(path, SERIES_FILE))
+
+    return DemandCube(path, series, calendar, values, flags, present,
+                      np.load(os.path.join(path, 'series_hashes.npy')),
+                      np.load(os.path.join(path, 'series_order.npy')))
+
+
+def attach_cube(path):
+    """
+    Cube opened once per process and reused by every later call with the same path
+
+    Pass it as the pool initializer (initializer=attach_cube, initargs=(path,)) so that
+    every worker maps the cube once, tasks then call attach_cube(path) to get it.
+    A cube rewritten by save_cube is opened again
+    """
+    path = os.path.abspath(path)
+    written = os.stat(os.path.join(path, MANIFEST_FILE)).st_mtime_ns
+    if path not in _attached or _attached[path][0] != written:
+        _attached[path] = (written, open_cube(path))
+    return _attached[path][1]
+
+
+def series_partitions(cube, n_partitions, by=None):
+    """
+    Matrix rows split into n_partitions
+
+    Without by the partitions are contiguous slices (views of the mapped matrices),
+    with by (e.g. 'LOCATION_ID') the series with equal by values are kept together
+    """
+    n_partitions = max(min(n_partitions, len(cube.series)), 1)
+    if by is None:
+        bounds = np.linspace(0, len(cube.series), n_partitions + 1).astype(np.int64)
+        return [slice(bounds[i], bounds[i + 1]) for i in range(n_partitions)]
+
+    codes = cube.series.groupby(by, sort=False, dropna=False).ngroup().to_numpy() % n_partitions
+    return [np.flatnonzero(codes == part) for part in range(n_partitions) if (codes == part).any()]
+
+
+def _run_partition(task):
+    func, path, rows, args = task
+    return func(attach_cube(path), rows, *args)
+
+
+def map_cube(func, path, n_workers=None, n_partitions=None, by=None, args=()):
+    """
+    Run func(cube, rows, *args) for every series partition of the cube at path in worker processes
+
+    Workers attach the cube once and read it through the shared page cache, only the
+    partition rows and the results are pickled
+
+    Parameters
+    ----------
+    func : callable
+        Module-level function of the attached cube and the partition rows
+    path : str
+        Cube directory
+    n_workers : int
+        Number of worker processes, defaults to the number of CPUs
+    n_partitions : int
+        Number of series partitions, defaults to n_workers
+    by : str or list
+        Series key columns kept in one partition, see series_partitions
+    args : tuple
+        Extra arguments of func
+
+    Returns
+    -------
+    list
+        Results in partition order
+    """
+    n_workers = n_workers or os.cpu_count() or 1
+    path = os.path.abspath(path)
+    partitions = series_partitions(attach_cube(path), n_partitions or n_workers, by)
+    tasks = [(func, path, rows, args) for rows in partitions]
+
+    with ProcessPoolExecutor(max_workers=min(n_workers, len(tasks)), initializer=attach_cube, initargs=(path,)) as executor:
+        return list(executor.map(_run_partition, tasks))
+
+
+def restore_partition(cube, rows, DR_PARAMETERS, HIGH_TURNOVER_TRSHD, columns=None):
+    """
+    restore_demand of the series at rows of the cube, as a long table
+
+    The location-day sales of CLOSED_FLG are summed over the partition, partition by
+    'LOCATION_ID' to get the values of the whole cube
+    """
+    dense = restore_demand(cube.take(rows), DR_PARAMETERS, HIGH_TURNOVER_TRSHD)
+    if columns is None:
+        return dense.to_long()
+    return dense.to_long(values=[col for col in columns if col in dense.values],
+                         flags=[col for col in columns if col in dense.flags])
+
+
+def parallel_restore_demand(path, DR_PARAMETERS, HIGH_TURNOVER_TRSHD, n_workers=None, columns=None):
+    """
+    Steps 3.4.1 - 3.4.3 (dense_demand.restore_demand) of the sales cube at path in worker
+    processes, partitioned by location
+
+    Returns
+    -------
+    pd.DataFrame
+        Long table ordered by series and PERIOD_DT
+    """
+    results = map_cube(restore_partition, path, n_workers, by='LOCATION_ID',
+                       args=(DR_PARAMETERS, HIGH_TURNOVER_TRSHD, columns))
+    keys = list(attach_cube(path).series.columns)
+    return pd.concat(results, ignore_index=True).sort_values(keys + ['PERIOD_DT'], kind='stable', ignore_index=True)
@@ -1,6 +1,9 @@
 import pandas as pd
 import numpy as np
 import datetime
+from intervals import interval_lookup
+from synthetic import cartesian
+from storage import read_input, write_table
 import warnings
 warnings.filterwarnings('ignore')
 
@@ -53,27 +56,20 @@ def generate_data(DR_PARAMETERS : dict, TGT_VAR_CONFIG : dict,
     LOCATION = hierarchies['LOCATION']
     CUSTOMER = hierarchies['CUSTOMER']
     DISTR_CHANNEL = hierarchies['DISTR_CHANNEL']
-    SALES = pd.DataFrame()
-    SALES['PERIOD_DT'] = pd.date_range(IB_HIST_START_DT, IB_HIST_END_DT)
-    product_df = pd.DataFrame(PRODUCT['PRODUCT_ID']).drop_duplicates()
-    SALES = pd.merge(SALES, product_df, 'cross')
-    location_df = pd.DataFrame(LOCATION['LOCATION_ID']).drop_duplicates()
-    SALES = pd.merge(SALES, location_df, 'cross')
-    customer_df = pd.DataFrame(CUSTOMER['CUSTOMER_ID']).drop_duplicates()
-    SALES = pd.merge(SALES, customer_df, 'cross')
-    distr_channel_df = pd.DataFrame(DISTR_CHANNEL['DISTR_CHANNEL_ID']).drop_duplicates()
-    SALES = pd.merge(SALES, distr_channel_df, 'cross')
+    SALES = pd.DataFrame(cartesian({
+        'PERIOD_DT': pd.date_range(IB_HIST_START_DT, IB_HIST_END_DT),
+        'PRODUCT_ID': PRODUCT['PRODUCT_ID'].unique(),
+        'LOCATION_ID': LOCATION['LOCATION_ID'].unique(),
+        'CUSTOMER_ID': CUSTOMER['CUSTOMER_ID'].unique(),
+        'DISTR_CHANNEL_ID': DISTR_CHANNEL['DISTR_CHANNEL_ID'].unique()
+    }))
     SALES['SALES_QTY'] = np.random.randint(1000, size=SALES.shape[0])
     SALES['PROMO_FLG'] = np.random.choice([0, 1], p=[0.8, 0.2], size=SALES.shape[0])
     SALES.loc[SALES['PROMO_FLG'] == 1, 'PROMO_ID'] = np.random.choice(PROMO['PROMO_ID'].tolist())
 
-    FORECAST_FLAG = pd.DataFrame()
-    FORECAST_FLAG['PERIOD_START_DT'] = [IB_HIST_START_DT]
-    FORECAST_FLAG['PERIOD_END_DT'] = [IB_HIST_START_DT]
-
-    for key in hierarchies:
-        key_df = hierarchies[key][f"{key}_ID"]
-        FORECAST_FLAG = pd.merge(FORECAST_FLAG, key_df, 'cross')
+    FORECAST_FLAG = pd.DataFrame(cartesian({f"{key}_ID": hierarchies[key][f"{key}_ID"] for key in hierarchies}))
+    FORECAST_FLAG.insert(0, 'PERIOD_START_DT', pd.Timestamp(IB_HIST_START_DT))
+    FORECAST_FLAG.insert(1, 'PERIOD_END_DT', pd.Timestamp(IB_HIST_START_DT))
 
     FORECAST_FLAG['STATUS'] = np.random.choice(['maturity', 'new', 'end-of-life'], size=FORECAST_FLAG.shape[0])
     FORECAST_FLAG.loc[(FORECAST_FLAG['PRODUCT_ID'] == PROMO['PRODUCT_ID'][0]) &
@@ -81,12 +77,13 @@ def generate_data(DR_PARAMETERS : dict, TGT_VAR_CONFIG : dict,
                      (FORECAST_FLAG['CUSTOMER_ID'] == PROMO['CUSTOMER_ID'][0]) &
                      (FORECAST_FLAG['DISTR_CHANNEL_ID'] == PROMO['DISTR_CHANNEL_ID'][0]), 'STATUS'] = 'maturity'
 
-    RESTORED_DEMAND = pd.DataFrame()
-    RESTORED_DEMAND['PERIOD_DT'] = pd.date_range(IB_HIST_START_DT, IB_HIST_END_DT)
-    RESTORED_DEMAND = pd.merge(RESTORED_DEMAND, PRODUCT['PRODUCT_ID'], 'cross')
-    RESTORED_DEMAND = pd.merge(RESTORED_DEMAND, LOCATION['LOCATION_ID'], 'cross')
-    RESTORED_DEMAND = pd.merge(RESTORED_DEMAND, CUSTOMER['CUSTOMER_ID'], 'cross')
-    RESTORED_DEMAND = pd.merge(RESTORED_DEMAND, DISTR_CHANNEL['DISTR_CHANNEL_ID'], 'cross')
+    RESTORED_DEMAND = pd.DataFrame(cartesian({
+        'PERIOD_DT': pd.date_range(IB_HIST_START_DT, IB_HIST_END_DT),
+        'PRODUCT_ID': PRODUCT['PRODUCT_ID'],
+        'LOCATION_ID': LOCATION['LOCATION_ID'],
+        'CUSTOMER_ID': CUSTOMER['CUSTOMER_ID'],
+        'DISTR_CHANNEL_ID': DISTR_CHANNEL['DISTR_CHANNEL_ID']
+    }))
     RESTORED_DEMAND['TGT_QTY'] = abs(np.random.normal(500, 300, RESTORED_DEMAND.shape[0]))
     RESTORED_DEMAND['TGT_QTY_R'] = RESTORED_DEMAND['TGT_QTY'] + np.random.normal(50, 30, RESTORED_DEMAND.shape[0])
     RESTORED_DEMAND['STOCK_QTY'] = abs(np.random.normal(500, 300, RESTORED_DEMAND.shape[0]))
@@ -212,7 +209,11 @@ def add_stock_data_and_promo_flag(T1 : pd.DataFrame, STOCK : pd.DataFrame, PROMO
     Returns
     -------
     pd.DataFrame
-        T3 table
+        T3 table: T1 rows with stock and the promo window covering PERIOD_DT (PERIOD_START_DT,
+        PERIOD_END_DT_promo, PROMO_PRICE), missing outside promo windows
+    
+    Promo windows are found with a keyed interval lookup (intervals.interval_lookup), so a row
+    gets at most one window and T3 keeps the rows of T2 in their order.
     """
     STOCK['PERIOD_DT'] = pd.to_datetime(STOCK['PERIOD_DT'])
     keys = ['PRODUCT_ID', 'LOCATION_ID', 'PERIOD_DT']
@@ -220,19 +221,14 @@ def add_stock_data_and_promo_flag(T1 : pd.DataFrame, STOCK : pd.DataFrame, PROMO
 
     ## Step 3.3
 
+    # promo window of every row: same series and promo, PERIOD_START_DT <= PERIOD_DT <= PERIOD_END_DT
     keys = ['PRODUCT_ID', 'LOCATION_ID', 'CUSTOMER_ID', 'DISTR_CHANNEL_ID', 'PROMO_ID']
-    T3 = T2[T2['PROMO_ID'].notna()]
-    T3['PROMO_ID'] = T3['PROMO_ID'].astype(int)
-    T3 = pd.merge(T3, PROMO[keys + ['PERIOD_START_DT', 'PERIOD_END_DT', 'PROMO_PRICE']], on=keys, how='left', suffixes=['', '_promo'])
-    T3 = T3[(T3['PERIOD_DT'] >= T3['PERIOD_START_DT']) & (T3['PERIOD_DT'] <= T3['PERIOD_END_DT_promo'])]
-    keys = ['PRODUCT_ID', 'LOCATION_ID', 'CUSTOMER_ID', 'DISTR_CHANNEL_ID']
-    group = T3.groupby(keys).mean()[['TGT_QTY', 'STOCK_QTY']].reset_index()
-    T3 = pd.merge(T3, group, on=keys, suffixes=['_x', ''])
-    group = T3.groupby(keys).max()[['PROMO_FLG', 'PROMO_ID']].reset_index()
-    T3 = pd.merge(T3, group, on=keys, suffixes=['_x', ''])
-    T3 = T3.drop(['TGT_QTY_x', 'STOCK_QTY_x', 'PROMO_FLG_x', 'PROMO_ID_x'], axis=1)
-    keys = T2.columns.tolist()
-    T3 = pd.merge(T2, T3, how='left', on=keys)
+    T3 = T2.reset_index(drop=True)
+    promo_pos = interval_lookup(T3, PROMO, keys, 'PERIOD_DT', 'PERIOD_START_DT', 'PERIOD_END_DT')
+    PROMO = PROMO.reset_index(drop=True)
+    T3['PERIOD_START_DT'] = PROMO['PERIOD_START_DT'].reindex(promo_pos).to_numpy()
+    T3['PERIOD_END_DT_promo'] = PROMO['PERIOD_END_DT'].reindex(promo_pos).to_numpy()
+    T3['PROMO_PRICE'] = PROMO['PROMO_PRICE'].reindex(promo_pos).to_numpy()
     return T3
 
 
@@ -263,8 +259,85 @@ def primiry_deficit_flg_def(T3 : pd.DataFrame, DR_PARAMETERS : dict) -> pd.DataF
 
 
 
+# months of the calendar history_extending fills with the median demand
+EXTENSION_MONTHS = 24
+
+ROLLING_STATE_COLS = ['PRODUCT_ID', 'LOCATION_ID', 'CUSTOMER_ID', 'DISTR_CHANNEL_ID', 'PERIOD_DT', 'TGT_QTY', 'DEFICIT_FLG1']
+
+
+def _update_start(IB_HIST_START_DT : datetime.datetime, IB_HIST_END_DT : datetime.datetime,
+                  IB_UPDATE_HISTORY_DEPTH : int) -> datetime.datetime:
+    """First date recalculated by the run"""
+    if IB_UPDATE_HISTORY_DEPTH <= 0:
+        return IB_HIST_START_DT
+    return IB_HIST_END_DT - datetime.timedelta(IB_UPDATE_HISTORY_DEPTH)
+
+
+def _seasonal_products(PRODUCT_ATTR : pd.DataFrame, SEASONAL_FLAG_CONFIG : pd.DataFrame) -> list:
+    """Products whose demand series are extended by history_extending"""
+    return pd.merge(PRODUCT_ATTR, SEASONAL_FLAG_CONFIG, on=['PRODUCT_ATTR_NAME', 'PRODUCT_ATTR_VALUE'])['PRODUCT_ID'].tolist()
+
+
+def _month_number(dates : pd.Series) -> np.ndarray:
+    """year * 12 + month - 1 of every date"""
+    dates = pd.to_datetime(dates)
+    return dates.dt.year.to_numpy(dtype=np.int64) * 12 + dates.dt.month.to_numpy(dtype=np.int64) - 1
+
+
+def rolling_deficit_stats(df : pd.DataFrame, keys : list, window_days : int) -> pd.DataFrame:
+    """
+    Trailing window statistics of every series, computed for all series in one rolling pass
+    
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Table with keys, PERIOD_DT, TGT_QTY and DEFICIT_FLG1 columns
+    keys : list
+        Series key columns
+    window_days : int
+        Window length in days, the window of a row covers (PERIOD_DT - window_days, PERIOD_DT]
+    
+    Returns
+    -------
+    pd.DataFrame
+        mean and std of TGT_QTY and COUNT_NONDEFECIT_DAYS (days with DEFICIT_FLG1 == 0)
+        over the window, aligned with df by index (one row per (keys, PERIOD_DT) row of df)
+    """
+    # series are laid out one after another on a single time axis, far enough apart
+    # that no window spans two series, so one ungrouped rolling pass serves all of them
+    codes = df.groupby(keys, sort=False, dropna=False).ngroup().to_numpy(dtype=np.int64)
+    days = (df['PERIOD_DT'] - df['PERIOD_DT'].min()).dt.days.to_numpy(dtype=np.int64)
+    span = days.max() + window_days + 1 if len(df) else 1
+    axis = (codes * span + days) * 86400
+    order = np.argsort(axis, kind='stable')
+    axis = pd.DatetimeIndex(axis[order].astype('datetime64[s]'))
+    
+    window = f'{window_days}D'
+    tgt_qty = pd.Series(df['TGT_QTY'].to_numpy(dtype=np.float64)[order], index=axis).rolling(window)
+    nondeficit = pd.Series(1 - df['DEFICIT_FLG1'].to_numpy(dtype=np.float64)[order], index=axis).rolling(window)
+    
+    stats = np.empty((len(df), 3))
+    stats[order, 0] = tgt_qty.mean().to_numpy()
+    stats[order, 1] = tgt_qty.std().to_numpy()
+    stats[order, 2] = nondeficit.sum().to_numpy()
+    return pd.DataFrame(stats, index=df.index, columns=['mean', 'std', 'COUNT_NONDEFECIT_DAYS'])
+
+
+def _fill_tgt_qty(T42 : pd.DataFrame, keys : list, history : pd.DataFrame = None) -> np.ndarray:
+    """
+    TGT_QTY of T42 with a missing value replaced by the last known TGT_QTY of the same series
+    (by PERIOD_DT), the days of history (earlier than T42) are searched first
+    """
+    cols = keys + ['PERIOD_DT', 'TGT_QTY']
+    df = T42[cols] if history is None else pd.concat([T42[cols], history[cols]], ignore_index=True)
+    df = df.sort_values(keys + ['PERIOD_DT'], kind='stable')
+    filled = df.groupby(keys, sort=False, dropna=False)['TGT_QTY'].ffill().sort_index()
+    return filled.to_numpy()[:len(T42)]
+
+
 def secondary_deficit_flg_def(T41 : pd.DataFrame, IB_HIST_START_DT : datetime.datetime, IB_HIST_END_DT : datetime.datetime,
-                             IB_UPDATE_HISTORY_DEPTH : int, HIGH_TURNOVER_TRSHD : float, DR_PARAMETERS : dict):
+                             IB_UPDATE_HISTORY_DEPTH : int, HIGH_TURNOVER_TRSHD : float, DR_PARAMETERS : dict,
+                             ROLLING_STATE : pd.DataFrame = None):
     """
     Step 3.4.2
     Function adding secondary deficit flag and calculating mean std and count
@@ -284,29 +357,30 @@ def secondary_deficit_flg_def(T41 : pd.DataFrame, IB_HIST_START_DT : datetime.da
         Parameter
     DR_PARAMETERS : dict
         Configuration parameters used within the step
+    ROLLING_STATE : pd.DataFrame
+        Rolling state of the previous run (see build_rolling_state). Its days before
+        the update window are used as window history of the first recalculated days
+        and as the last known TGT_QTY of their series
         
     Returns
     -------
     pd.DataFrame
         T42 table
     """
-    if IB_UPDATE_HISTORY_DEPTH <= 0:
-        d = IB_HIST_START_DT
-    else:
-        d = IB_HIST_END_DT - datetime.timedelta(IB_UPDATE_HISTORY_DEPTH)
+    d = _update_start(IB_HIST_START_DT, IB_HIST_END_DT, IB_UPDATE_HISTORY_DEPTH)
 
-    T42 = T41[T41['PERIOD_DT'] >= d]
-    T42['DEFICIT_FLG1'] = 1 - T42['DEFICIT_FLG1']
+    T42 = T41[T41['PERIOD_DT'] >= d].reset_index(drop=True)
     keys = ['PRODUCT_ID', 'LOCATION_ID', 'CUSTOMER_ID', 'DISTR_CHANNEL_ID']
-    lfdf = T42.groupby(keys).apply(
-        lambda x : x.set_index('PERIOD_DT')[['TGT_QTY', 'DEFICIT_FLG1']].rolling(
-            window=str(DR_PARAMETERS['DR_PERIOD_LENGTH']) + 'd').agg(
-            {'TGT_QTY' : ['mean', 'std'], 'DEFICIT_FLG1' : 'count'})
-    )
-    T42['DEFICIT_FLG1'] = 1 - T42['DEFICIT_FLG1']
-    lfdf.columns = ['mean', 'std', 'COUNT_NONDEFECIT_DAYS']
-    T42 = pd.merge(T42, lfdf, on=keys)
-    T42 = T42.ffill()
+    window = T42[ROLLING_STATE_COLS]
+    history = None
+    if ROLLING_STATE is not None:
+        history = ROLLING_STATE[ROLLING_STATE['PERIOD_DT'] < d]
+        in_window = history['PERIOD_DT'] > d - datetime.timedelta(DR_PARAMETERS['DR_PERIOD_LENGTH'])
+        window = pd.concat([window, history.loc[in_window, ROLLING_STATE_COLS]], ignore_index=True)
+    # statistics of the raw TGT_QTY, missing days are left out of the window
+    lfdf = rolling_deficit_stats(window, keys, DR_PARAMETERS['DR_PERIOD_LENGTH']).iloc[:len(T42)]
+    T42 = T42.join(lfdf)
+    T42['TGT_QTY'] = _fill_tgt_qty(T42, keys, history)
     T42['mean'] = T42['mean'].fillna(0)
     T42['std'] = T42['std'].fillna(1)
     T42['Threshold'] = T42['mean'] - 2 * T42['std']
@@ -346,7 +420,12 @@ def history_extending(T43 : pd.DataFrame, PRODUCT_ATTR : pd.DataFrame, SEASONAL_
     """
     Step 3.4.5
     Function extending demand series for short and seasonal time series
-    
+
+    Series of seasonal products with a history depth (in calendar months) between
+    MIN_PROLONG_HIST_MONTH and MAX_PROLONG_HIST_MONTH that ended less than 12 months before
+    IB_HIST_END_DT are replaced by their median TGT_QTY_R on the first day of each of the
+    EXTENSION_MONTHS months up to IB_HIST_END_DT. The result depends only on the inputs.
+
     Parameters
     ----------
     T43 : pd.DataFrame
@@ -366,30 +445,30 @@ def history_extending(T43 : pd.DataFrame, PRODUCT_ATTR : pd.DataFrame, SEASONAL_
         Restored demand table
     
     """
-    products = pd.merge(PRODUCT_ATTR, SEASONAL_FLAG_CONFIG, on=['PRODUCT_ATTR_NAME', 'PRODUCT_ATTR_VALUE'])['PRODUCT_ID'].tolist()
-    df = T43[T43['PRODUCT_ID'].isin(products)]
     keys = ['PRODUCT_ID', 'LOCATION_ID', 'CUSTOMER_ID', 'DISTR_CHANNEL_ID']
-    df['intnx1'] = df['PERIOD_DT'] - np.timedelta64(1, "M")
-    df['intnx2'] = df['PERIOD_END_DT']
-    df.loc[df['intnx2'] > IB_HIST_END_DT, 'intnx2'] = IB_HIST_END_DT
-    df['intnx2'] = df['intnx2'] - np.timedelta64(1, "M")
-    group = df.groupby(keys).agg({'intnx1' : 'min', 'intnx2' : 'max'})
-    group['HISTORY_DEPTH'] = ((group['intnx2'] - group['intnx1']) / np.timedelta64(1, 'M')).astype(int)
-    group = group.rename(columns={'intnx1' : 'MIN_MONTH_DT', 'intnx2' : 'MAX_MONTH_DT'})
-    df = pd.merge(T43, group.reset_index(), on=keys)
-    df = df[(df['HISTORY_DEPTH'] >= DR_PARAMETERS['MIN_PROLONG_HIST_MONTH']) &
-       (df['HISTORY_DEPTH'] <= DR_PARAMETERS['MAX_PROLONG_HIST_MONTH']) &
-           (abs(df['MAX_MONTH_DT'] - datetime.datetime.today()) / np.timedelta64(1, 'M') < 12)]
-    medians = df.groupby(keys)[['TGT_QTY_R']].median().reset_index()
-    calendar = pd.DataFrame()
-    today = datetime.datetime.today()
-    calendar['PERIOD_DT'] = (pd.date_range(today.replace(year=today.year - 2), today, freq='M') + datetime.timedelta(days=1))
-    calendar['PERIOD_DT'] = pd.to_datetime(calendar['PERIOD_DT']).dt.date
-    for key in keys:
-        calendar = pd.merge(calendar, medians[[key]], how='cross')
-    calendar = pd.merge(calendar, medians, on=keys)
-
-    df = pd.concat([T43[~T43['PRODUCT_ID'].isin(products)], calendar])
+    products = _seasonal_products(PRODUCT_ATTR, SEASONAL_FLAG_CONFIG)
+    seasonal = T43['PRODUCT_ID'].isin(products)
+    df = T43[seasonal]
+
+    # intnx('month', ., -1) as month numbers, the history ends at IB_HIST_END_DT
+    period_end_dt = pd.to_datetime(df['PERIOD_END_DT']).clip(upper=pd.Timestamp(IB_HIST_END_DT))
+    months = df[keys].assign(MIN_MONTH=_month_number(df['PERIOD_DT']) - 1,
+                             MAX_MONTH=_month_number(period_end_dt) - 1,
+                             TGT_QTY_R=df['TGT_QTY_R'])
+    group = months.groupby(keys).agg(MIN_MONTH=('MIN_MONTH', 'min'), MAX_MONTH=('MAX_MONTH', 'max'),
+                                     TGT_QTY_R=('TGT_QTY_R', 'median'))
+    depth = group['MAX_MONTH'] - group['MIN_MONTH']
+    hist_end_month = _month_number(pd.Series([IB_HIST_END_DT]))[0]
+    group = group[(depth >= DR_PARAMETERS['MIN_PROLONG_HIST_MONTH']) & (depth <= DR_PARAMETERS['MAX_PROLONG_HIST_MONTH']) &
+                  ((group['MAX_MONTH'] - hist_end_month).abs() < 12)]
+
+    # median of every series on the first day of each of the last EXTENSION_MONTHS months
+    month_starts = (np.arange(hist_end_month - EXTENSION_MONTHS + 1, hist_end_month + 1) - 1970 * 12).astype('datetime64[M]')
+    calendar = group.index.to_frame(index=False).iloc[np.tile(np.arange(len(group)), len(month_starts))].reset_index(drop=True)
+    calendar.insert(0, 'PERIOD_DT', pd.to_datetime(np.repeat(month_starts, len(group))))
+    calendar['TGT_QTY_R'] = np.tile(group['TGT_QTY_R'].to_numpy(), len(month_starts))
+
+    df = pd.concat([T43[~seasonal], calendar])
     return df
 
 
@@ -399,7 +478,8 @@ def demand_restoration_algorithm(DR_PARAMETERS : dict, TGT_VAR_CONFIG : dict,
                  hierarchies : dict, STOCK : pd.DataFrame, PROMO : pd.DataFrame, 
                 SALES : pd.DataFrame, FORECAST_FLAG : pd.DataFrame,
                 RESTORED_DEMAND : pd.DataFrame, HIGH_TURNOVER_TRSHD : float,
-                PRODUCT_ATTR : pd.DataFrame, SEASONAL_FLAG_CONFIG : pd.DataFrame) -> pd.DataFrame:
+                PRODUCT_ATTR : pd.DataFrame, SEASONAL_FLAG_CONFIG : pd.DataFrame, return_state : bool = False,
+                output_path : str = None, state_path : str = None, seasonal_path : str = None) -> pd.DataFrame:
     """
     This step defines how sales history should be treated as a demand.
     Particularly, the main purpose of this transformation is to provide downstream steps
@@ -438,11 +518,22 @@ def demand_restoration_algorithm(DR_PARAMETERS : dict, TGT_VAR_CONFIG : dict,
         PRODUCT_ATTR table
     SEASONAL_FLAG_CONFIG : pd.DataFrame
         SEASONAL_FLAG_CONFIG table
+    return_state : bool
+        Also return the rolling state for incremental_demand_restoration
+    output_path : str
+        Optional dataset path the restored demand is written to with storage.write_table
+    state_path : str
+        Optional dataset path the rolling state is written to
+    seasonal_path : str
+        Optional dataset path the extended series of seasonal products are written to instead of
+        output_path, as incremental_demand_restoration needs
         
     Returns
     -------
     pd.DataFrame
         Table containing restored demand
+    pd.DataFrame
+        Rolling state, only if return_state
     """
     T1 = prepare_sales_and_demand(FORECAST_FLAG, DR_PARAMETERS, IB_HIST_END_DT, IB_UPDATE_HISTORY_DEPTH, SALES)
     T3 = add_stock_data_and_promo_flag(T1, STOCK, PROMO)
@@ -451,4 +542,167 @@ def demand_restoration_algorithm(DR_PARAMETERS : dict, TGT_VAR_CONFIG : dict,
     T43 = demand_restoration_on_stock_def(T42, DR_PARAMETERS)
     df = history_extending(T43, PRODUCT_ATTR, SEASONAL_FLAG_CONFIG, DR_PARAMETERS, IB_HIST_END_DT)
     df['PERIOD_DT'] = pd.to_datetime(df['PERIOD_DT']).dt.date
-    return df
\ No newline at end of file
+    if output_path is not None:
+        seasonal = df['PRODUCT_ID'].isin(_seasonal_products(PRODUCT_ATTR, SEASONAL_FLAG_CONFIG))
+        if seasonal_path is None:
+            write_table(df, output_path)
+        else:
+            write_table(df[~seasonal], output_path)
+            write_table(df[seasonal], seasonal_path)
+    if return_state or state_path is not None:
+        state = build_rolling_state(T41, IB_HIST_END_DT, IB_UPDATE_HISTORY_DEPTH, DR_PARAMETERS)
+        if state_path is not None:
+            write_table(state, state_path)
+        if return_state:
+            return df, state
+    return df
+
+
+def build_rolling_state(T41 : pd.DataFrame, IB_HIST_END_DT : datetime.datetime, IB_UPDATE_HISTORY_DEPTH : int,
+                        DR_PARAMETERS : dict, ROLLING_STATE : pd.DataFrame = None) -> pd.DataFrame:
+    """
+    Rolling-window state persisted between runs: daily raw TGT_QTY and DEFICIT_FLG1 of every series
+    for the last DR_PERIOD_LENGTH + IB_UPDATE_HISTORY_DEPTH days and, from the earlier days, the last
+    one with a known TGT_QTY. Window sums, sums of squares and counts of the next run are rebuilt from
+    these days and a missing TGT_QTY is filled from them, so only they have to be kept, not the history
+    
+    Parameters
+    ----------
+    T41 : pd.DataFrame
+        T41 table of the current run
+    IB_HIST_END_DT : datetime.datetime
+        Last known date (i.e. sales and stock information is known)
+    IB_UPDATE_HISTORY_DEPTH : int
+        Number of recalculated days, the state keeps enough days to serve as history of the same depth next run
+    DR_PARAMETERS : dict
+        Configuration parameters used within the step
+    ROLLING_STATE : pd.DataFrame
+        Previous state, its days are overridden by the days of T41
+    
+    Returns
+    -------
+    pd.DataFrame
+        Rolling state table with ROLLING_STATE_COLS
+    """
+    keys = ['PRODUCT_ID', 'LOCATION_ID', 'CUSTOMER_ID', 'DISTR_CHANNEL_ID', 'PERIOD_DT']
+    state = T41[ROLLING_STATE_COLS]
+    if ROLLING_STATE is not None:
+        state = pd.concat([ROLLING_STATE[ROLLING_STATE_COLS], state], ignore_index=True)
+        state = state.drop_duplicates(subset=keys, keep='last')
+    state = state.sort_values(keys, kind='stable')
+    depth = DR_PARAMETERS['DR_PERIOD_LENGTH'] + max(IB_UPDATE_HISTORY_DEPTH, 0)
+    recent = state['PERIOD_DT'] > IB_HIST_END_DT - datetime.timedelta(depth)
+    known = state[~recent & state['TGT_QTY'].notna()].drop_duplicates(subset=keys[:-1], keep='last')
+    state = pd.concat([state[recent], known])
+    return state.sort_values(keys, kind='stable').reset_index(drop=True)
+
+
+def incremental_demand_restoration(DR_PARAMETERS : dict, IB_UPDATE_HISTORY_DEPTH : int,
+                 IB_HIST_START_DT : datetime.datetime, IB_HIST_END_DT : datetime.datetime,
+                 STOCK : pd.DataFrame, PROMO : pd.DataFrame, SALES : pd.DataFrame, FORECAST_FLAG : pd.DataFrame,
+                 HIGH_TURNOVER_TRSHD : float, PRODUCT_ATTR : pd.DataFrame, SEASONAL_FLAG_CONFIG : pd.DataFrame,
+                 RESTORED_DEMAND : pd.DataFrame, ROLLING_STATE : pd.DataFrame,
+                 output_path : str = None, state_path : str = None, seasonal_path : str = None) -> (pd.DataFrame, pd.DataFrame):
+    """
+    Incremental version of demand_restoration_algorithm: only the last IB_UPDATE_HISTORY_DEPTH days
+    are recalculated, the window history of the first recalculated days comes from ROLLING_STATE.
+    Of the stored RESTORED_DEMAND only the days of the month of the first recalculated day are read,
+    and only the months from that one on are rewritten (write_table(..., mode='partitions')).
+    For series of non-seasonal products the cost depends on the update depth, not on the history length.
+
+    Seasonal series are not incremental: history_extending replaces them by the median of their
+    whole history, so they are recalculated over the whole SALES and STOCK history of the seasonal
+    products and rewritten to seasonal_path, with a cost that grows with their history.
+    
+    Parameters
+    ----------
+    DR_PARAMETERS : dict
+        Configuration parameters used within the step
+    IB_UPDATE_HISTORY_DEPTH : int
+        Number of days of historical information that should be recalculated
+    IB_HIST_START_DT : datetime.datetime
+        Minimal date that should be present in Demand Restored
+    IB_HIST_END_DT : datetime.datetime
+        Last known date (i.e. sales and stock information is known)
+    STOCK : pd.DataFrame
+        STOCK table
+    PROMO : pd.DataFrame
+        PROMO table
+    SALES : pd.DataFrame
+        SALES table, the whole history for seasonal products, the update window for the rest
+    FORECAST_FLAG : pd.DataFrame
+        FORECAST_FLAG table
+    HIGH_TURNOVER_TRSHD
+        Parameter
+    PRODUCT_ATTR : pd.DataFrame
+        PRODUCT_ATTR table
+    SEASONAL_FLAG_CONFIG : pd.DataFrame
+        SEASONAL_FLAG_CONFIG table
+    RESTORED_DEMAND : pd.DataFrame or str
+        Restored demand of the previous run, or its dataset path (output_path of the previous run),
+        from which only the days of the month of the update window start before that start are read
+    ROLLING_STATE : pd.DataFrame or str
+        Rolling state of the previous run (demand_restoration_algorithm(..., return_state=True)
+        or incremental_demand_restoration), or its dataset path (state_path of the previous run)
+    output_path : str
+        Optional dataset path (usually the RESTORED_DEMAND path) whose months from the update
+        window start on are replaced by the restored demand of the non-seasonal series
+    state_path : str
+        Optional dataset path the rolling state is written to, it can be the ROLLING_STATE path
+    seasonal_path : str
+        Dataset path the extended seasonal series are written to, required with output_path
+        (the full run writes them there with demand_restoration_algorithm(..., seasonal_path=...))
+        
+    Returns
+    -------
+    pd.DataFrame
+        Restored demand from the first day of the month of the update window start on
+        and the extended seasonal series, earlier days are unchanged
+    pd.DataFrame
+        Rolling state for the next run
+    """
+    if output_path is not None and seasonal_path is None:
+        raise ValueError('seasonal_path is required with output_path, seasonal series span months that are not rewritten')
+
+    d = _update_start(IB_HIST_START_DT, IB_HIST_END_DT, IB_UPDATE_HISTORY_DEPTH)
+    month_start = d.replace(day=1)
+    RESTORED_DEMAND = read_input(RESTORED_DEMAND, start=month_start, end=d - datetime.timedelta(1))
+    ROLLING_STATE = read_input(ROLLING_STATE, columns=ROLLING_STATE_COLS)
+    products = _seasonal_products(PRODUCT_ATTR, SEASONAL_FLAG_CONFIG)
+    seasonal_sales = SALES['PRODUCT_ID'].isin(products)
+    seasonal_stock = STOCK['PRODUCT_ID'].isin(products)
+    seasonal_flag = FORECAST_FLAG['PRODUCT_ID'].isin(products)
+
+    # seasonal series: whole history up to IB_HIST_END_DT, then history_extending as in the full run
+    full_depth = (IB_HIST_END_DT - IB_HIST_START_DT).days
+    T1 = prepare_sales_and_demand(FORECAST_FLAG[seasonal_flag], DR_PARAMETERS, IB_HIST_END_DT, full_depth, SALES[seasonal_sales])
+    T3 = add_stock_data_and_promo_flag(T1, STOCK[seasonal_stock], PROMO)
+    T41 = primiry_deficit_flg_def(T3, DR_PARAMETERS)
+    T42 = secondary_deficit_flg_def(T41, IB_HIST_START_DT, IB_HIST_END_DT, full_depth, HIGH_TURNOVER_TRSHD, DR_PARAMETERS)
+    T43 = demand_restoration_on_stock_def(T42, DR_PARAMETERS)
+    seasonal = history_extending(T43, PRODUCT_ATTR, SEASONAL_FLAG_CONFIG, DR_PARAMETERS, IB_HIST_END_DT)
+
+    # other series: the update window on top of the stored days and the rolling state
+    SALES = SALES[~seasonal_sales & (pd.to_datetime(SALES['PERIOD_DT']) >= d)]
+    STOCK = STOCK[~seasonal_stock & (pd.to_datetime(STOCK['PERIOD_DT']) >= d)]
+    T1 = prepare_sales_and_demand(FORECAST_FLAG[~seasonal_flag], DR_PARAMETERS, IB_HIST_END_DT, IB_UPDATE_HISTORY_DEPTH, SALES)
+    T3 = add_stock_data_and_promo_flag(T1, STOCK, PROMO)
+    T41 = primiry_deficit_flg_def(T3, DR_PARAMETERS)
+    T41 = T41[T41['PERIOD_DT'] >= d]
+    T42 = secondary_deficit_flg_def(T41, IB_HIST_START_DT, IB_HIST_END_DT, IB_UPDATE_HISTORY_DEPTH, HIGH_TURNOVER_TRSHD,
+                                    DR_PARAMETERS, ROLLING_STATE)
+    T43 = demand_restoration_on_stock_def(T42, DR_PARAMETERS)
+
+    # stored days of the first rewritten month, before the update window
+    period_dt = pd.to_datetime(RESTORED_DEMAND['PERIOD_DT'])
+    stored = RESTORED_DEMAND[(period_dt >= month_start) & (period_dt < d) & ~RESTORED_DEMAND['PRODUCT_ID'].isin(products)]
+    df = pd.concat([stored, T43], ignore_index=True)
+    df['PERIOD_DT'] = pd.to_datetime(df['PERIOD_DT']).dt.date
+    seasonal['PERIOD_DT'] = pd.to_datetime(seasonal['PERIOD_DT']).dt.date
+    state = build_rolling_state(T41, IB_HIST_END_DT, IB_UPDATE_HISTORY_DEPTH, DR_PARAMETERS, ROLLING_STATE)
+    if output_path is not None:
+        write_table(df, output_path, mode='partitions')
+        write_table(seasonal, seasonal_path)
+    if state_path is not None:
+        write_table(state, state_path)
+    return pd.concat([df, seasonal], ignore_index=True), state
\ No newline at end of file
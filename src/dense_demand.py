@@ -0,0 +1,253 @@
+import numpy as np
+import pandas as pd
+
+
+SERIES_KEYS = ['PRODUCT_ID', 'LOCATION_ID', 'CUSTOMER_ID', 'DISTR_CHANNEL_ID']
+
+VALUE_COLS = ['TGT_QTY', 'STOCK_QTY']
+
+FLAG_COLS = ['PROMO_FLG', 'DEFICIT_FLG1']
+
+
+def pack_flags(matrix):
+    """bool (n_series, n_days) matrix as 8 days per byte"""
+    return np.packbits(np.asarray(matrix, dtype=bool), axis=1, bitorder='little')
+
+
+def unpack_flags(packed, n_days):
+    """bool (n_series, n_days) matrix of packed flags"""
+    return np.unpackbits(packed, axis=1, count=n_days, bitorder='little').astype(bool)
+
+
+class DenseDemand:
+    """
+    Daily demand of many series as (n_series, n_days) arrays
+
+    Values (TGT_QTY, STOCK_QTY, ...) are float32 matrices with NaN on missing days, flags
+    (PROMO_FLG, DEFICIT_FLG1, ...) are bit-packed along the days. Row i of every matrix is
+    the series series.iloc[i], column j is the day calendar[j]; present marks the series-days
+    that exist in the long table. A series-day takes about 4 bytes per value and a bit per flag
+    instead of the 8 bytes per column (keys and PERIOD_DT included) of the long format.
+    """
+    def __init__(self, series, calendar, values, flags, present):
+        self.series = series
+        self.calendar = calendar
+        self.values = values
+        self.flags = flags
+        self.present = present
+
+
+    @property
+    def shape(self):
+        return len(self.series), len(self.calendar)
+
+
+    @property
+    def nbytes(self):
+        return (sum(matrix.nbytes for matrix in self.values.values()) +
+                sum(packed.nbytes for packed in self.flags.values()) + self.present.nbytes)
+
+
+    def flag(self, name):
+        """Unpacked bool matrix of a flag"""
+        return unpack_flags(self.flags[name], len(self.calendar))
+
+
+    def set_flag(self, name, matrix):
+        self.flags[name] = pack_flags(matrix)
+
+
+    def present_mask(self):
+        return unpack_flags(self.present, len(self.calendar))
+
+
+    def take(self, rows):
+        """
+        DenseDemand of the series at positions rows, on the same calendar
+
+        A slice of rows keeps views of the matrices (of a memory-mapped cube too),
+        an index array copies them
+        """
+        return DenseDemand(self.series.iloc[rows].reset_index(drop=True), self.calendar,
+                           {name: matrix[rows] for name, matrix in self.values.items()},
+                           {name: packed[rows] for name, packed in self.flags.items()},
+                           self.present[rows])
+
+
+    @classmethod
+    def from_long(cls, df, values=VALUE_COLS, flags=FLAG_COLS, keys=SERIES_KEYS, calendar=None):
+        """
+        Dense arrays of a long table with keys, PERIOD_DT, values and flags columns
+
+        Parameters
+        ----------
+        df : pd.DataFrame
+            Long table, one row per series-day (for duplicates the last row is kept)
+        values : list
+            Columns stored as float32 matrices
+        flags : list
+            0/1 columns stored bit-packed, missing values are 0
+        keys : list
+            Series key columns
+        calendar : pd.DatetimeIndex
+            Days of the matrices, by default every day from the first to the last PERIOD_DT.
+            Rows outside of it are dropped
+
+        Returns
+        -------
+        DenseDemand
+        """
+        values = [col for col in values if col in df.columns]
+        flags = [col for col in flags if col in df.columns]
+        period_dt = pd.to_datetime(df['PERIOD_DT']).dt.normalize()
+        if calendar is None:
+            calendar = pd.date_range(period_dt.min(), period_dt.max(), freq='D')
+
+        codes = df.groupby(keys, sort=True, dropna=False).ngroup().to_numpy(dtype=np.int64)
+        n_series = codes.max() + 1 if len(df) else 0
+        first_rows = np.full(n_series, -1, dtype=np.int64)
+        first_rows[codes[::-1]] = np.arange(len(df) - 1, -1, -1)
+        series = df[keys].iloc[first_rows].reset_index(drop=True)
+
+        days = calendar.get_indexer(period_dt)
+        inside = days >= 0
+        codes, days = codes[inside], days[inside]
+        shape = (n_series, len(calendar))
+
+        present = np.zeros(shape, dtype=bool)
+        present[codes, days] = True
+
+        value_matrices = {}
+        for col in values:
+            matrix = np.full(shape, np.nan, dtype=np.float32)
+            matrix[codes, days] = df[col].to_numpy(dtype=np.float32, na_value=np.nan)[inside]
+            value_matrices[col] = matrix
+
+        flag_matrices = {}
+        for col in flags:
+            matrix = np.zeros(shape, dtype=bool)
+            matrix[codes, days] = df[col].fillna(0).to_numpy(dtype=np.float64)[inside] != 0
+            flag_matrices[col] = pack_flags(matrix)
+
+        return cls(series, calendar, value_matrices, flag_matrices, pack_flags(present))
+
+
+    def to_long(self, values=None, flags=None):
+        """
+        Long table of the present series-days, ordered by series and PERIOD_DT
+
+        Values come back as float64 and flags as int8 columns
+        """
+        values = self.values if values is None else values
+        flags = self.flags if flags is None else flags
+        rows, days = np.nonzero(self.present_mask())
+
+        df = self.series.iloc[rows].reset_index(drop=True)
+        df['PERIOD_DT'] = self.calendar[days]
+        for col in values:
+            df[col] = self.values[col][rows, days].astype(np.float64)
+        for col in flags:
+            df[col] = self.flag(col)[rows, days].astype(np.int8)
+        return df
+
+
+def _group_sum(matrix, codes, n_groups):
+    """Sum of the rows of matrix within row groups, NaN counted as 0"""
+    sums = np.zeros((n_groups, matrix.shape[1]), dtype=np.float64)
+    np.add.at(sums, codes, np.nan_to_num(matrix))
+    return sums
+
+
+def primary_deficit_flags(dense, DR_PARAMETERS):
+    """
+    Step 3.4.1 on dense arrays: CLOSED_FLG (location-day sales at least MIN_SALES_QTY_DAY)
+    and DEFICIT_FLG1 (STOCK_QTY < DEF_INV_TRSHD and TGT_QTY < DEF_QTY_TRSHD)
+    """
+    tgt_qty, stock_qty = dense.values['TGT_QTY'], dense.values['STOCK_QTY']
+    present = dense.present_mask()
+
+    locations = dense.series.groupby('LOCATION_ID', sort=False, dropna=False).ngroup().to_numpy()
+    location_sales = _group_sum(np.where(present, tgt_qty, np.nan), locations, locations.max() + 1 if len(locations) else 0)
+    dense.set_flag('CLOSED_FLG', present & (location_sales[locations] >= DR_PARAMETERS['MIN_SALES_QTY_DAY']))
+    # NaN compares as False like in the long tables
+    dense.set_flag('DEFICIT_FLG1', present & (stock_qty < DR_PARAMETERS['DEF_INV_TRSHD']) &
+                   (tgt_qty < DR_PARAMETERS['DEF_QTY_TRSHD']))
+    return dense
+
+
+def _window_sum(matrix, window_days):
+    """Sum over the trailing window (day - window_days, day] along the days"""
+    cumsum = np.zeros((matrix.shape[0], matrix.shape[1] + 1), dtype=np.float64)
+    np.cumsum(matrix, axis=1, out=cumsum[:, 1:])
+    start = np.maximum(np.arange(matrix.shape[1]) + 1 - window_days, 0)
+    return cumsum[:, 1:] - cumsum[:, start]
+
+
+def _ffill_days(matrix):
+    """matrix with every NaN replaced by the last non-NaN value before it along the days"""
+    last = np.where(np.isnan(matrix), 0, np.arange(matrix.shape[1]))
+    np.maximum.accumulate(last, axis=1, out=last)
+    return matrix[np.arange(matrix.shape[0])[:, None], last]
+
+
+def rolling_stats(dense, window_days):
+    """
+    Trailing window statistics of every series, like demand_restoration.rolling_deficit_stats
+
+    Returns
+    -------
+    dict
+        mean and std of TGT_QTY over the present days of the window with a known TGT_QTY and
+        COUNT_NONDEFECIT_DAYS, float32 matrices, NaN on days that are not present
+    """
+    present = dense.present_mask()
+    tgt_qty = dense.values['TGT_QTY'].astype(np.float64)
+    observed = present & ~np.isnan(tgt_qty)
+    tgt_qty = np.where(observed, tgt_qty, 0)
+
+    count = _window_sum(observed, window_days)
+    total = _window_sum(tgt_qty, window_days)
+    squares = _window_sum(tgt_qty ** 2, window_days)
+    nondeficit = _window_sum(present & ~dense.flag('DEFICIT_FLG1'), window_days)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(count > 0, total / count, np.nan)
+        variance = np.where(count > 1, (squares - count * mean ** 2) / (count - 1), np.nan)
+    std = np.sqrt(np.maximum(variance, 0))
+
+    return {
+        'mean': np.where(present, mean, np.nan).astype(np.float32),
+        'std': np.where(present, std, np.nan).astype(np.float32),
+        'COUNT_NONDEFECIT_DAYS': np.where(present, nondeficit, np.nan).astype(np.float32)
+    }
+
+
+def restore_demand(dense, DR_PARAMETERS, HIGH_TURNOVER_TRSHD):
+    """
+    Steps 3.4.1 - 3.4.3 on dense arrays: deficit flags, rolling statistics, secondary
+    deficit flag and restored demand TGT_QTY_R (window mean on deficit days with
+    at least MIN_ND_DAYS non-deficit days in the window)
+
+    Adds DEFICIT_FLG1, CLOSED_FLG and DEFICIT_FLG2 flags and mean, std,
+    COUNT_NONDEFECIT_DAYS and TGT_QTY_R values to dense. As in the long steps, the statistics
+    use the raw TGT_QTY and afterwards a missing TGT_QTY of a present day takes the last
+    known TGT_QTY of the series
+    """
+    primary_deficit_flags(dense, DR_PARAMETERS)
+    stats = rolling_stats(dense, DR_PARAMETERS['DR_PERIOD_LENGTH'])
+    dense.values.update(stats)
+
+    present = dense.present_mask()
+    tgt_qty = np.where(present, _ffill_days(dense.values['TGT_QTY']), np.nan).astype(np.float32)
+    dense.values['TGT_QTY'] = tgt_qty
+    mean = np.where(np.isnan(stats['mean']), 0, stats['mean'])
+    std = np.where(np.isnan(stats['std']), 1, stats['std'])
+
+    deficit2 = dense.flag('DEFICIT_FLG1') | (tgt_qty < mean - 2 * std)
+    deficit2 |= (mean >= HIGH_TURNOVER_TRSHD) & (tgt_qty < mean * 0.1)
+    deficit2 &= present
+    dense.set_flag('DEFICIT_FLG2', deficit2)
+
+    restore = deficit2 & (stats['COUNT_NONDEFECIT_DAYS'] >= DR_PARAMETERS['MIN_ND_DAYS'])
+    dense.values['TGT_QTY_R'] = np.where(restore, mean, tgt_qty).astype(np.float32)
+    return dense
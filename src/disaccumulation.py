@@ -1,24 +1,154 @@
+import numpy as np
 import pandas as pd
-from tqdm.notebook import tqdm
 
 import os
 import sys
+import time
+import logging
 
 project_path = os.path.abspath(os.path.join('..'))
 
 if project_path not in sys.path:
     sys.path.append(project_path)
 
+from time_levels import as_datetime
+from storage import read_input, write_table
+
+
+def _period_ordinals(start, end, out_time_lvl):
+    """
+    Ordinal of the out_time_lvl period containing start and number of periods up to end
+    """
+    first = start.dt.to_period(out_time_lvl).array.asi8
+    last = end.dt.to_period(out_time_lvl).array.asi8
+    valid = start.notna().to_numpy() & end.notna().to_numpy()
+    counts = np.where(valid, np.maximum(last - first + 1, 1), 1)
+    return first, counts
+
+
+def split_periods(data, out_time_lvl):
+    """
+    Split every [PERIOD_DT, PERIOD_END_DT] interval into the out_time_lvl periods it intersects.
+    Rows are repeated once per period and the period bounds are computed on whole arrays.
+    
+    Parameters
+    ----------
+    data : pd.DataFrame
+        Table with ID, Period and Forecast columns
+    
+    out_time_lvl : string
+        Required time granularity level (D, W, W-MON/.../W-SUN, M)
+    
+    Returns
+    -------
+    pd.DataFrame
+        data rows repeated per output period with OUT_PERIOD_DT and OUT_PERIOD_END_DT,
+        the part of [PERIOD_DT, PERIOD_END_DT] falling into that period
+    """
+    start = as_datetime(data['PERIOD_DT']).reset_index(drop=True)
+    end = as_datetime(data['PERIOD_END_DT']).reset_index(drop=True)
+    first, counts = _period_ordinals(start, end, out_time_lvl)
+    
+    rows = np.repeat(np.arange(len(data)), counts)
+    offsets = np.arange(len(rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+    ordinals = first[rows] + offsets
+    
+    unit = start.dt.unit
+    period_start = pd.PeriodIndex.from_ordinals(ordinals, freq=out_time_lvl).start_time.as_unit(unit)
+    period_end = pd.PeriodIndex.from_ordinals(ordinals + 1, freq=out_time_lvl).start_time.as_unit(unit) - pd.Timedelta('1D')
+    
+    df = data.iloc[rows].reset_index(drop=True)
+    df['OUT_PERIOD_DT'] = np.maximum(period_start.to_numpy(), start.to_numpy()[rows])
+    df['OUT_PERIOD_END_DT'] = np.minimum(period_end.to_numpy(), end.dt.as_unit(unit).to_numpy()[rows])
+    
+    return df
+
+
+def _chunk_bounds(counts, chunk_size):
+    """
+    Row boundaries of consecutive input blocks producing about chunk_size output rows each
+    """
+    first_piece = np.cumsum(counts) - counts
+    chunk_id = first_piece // chunk_size
+    boundaries = np.flatnonzero(np.diff(chunk_id)) + 1
+    return np.concatenate([[0], boundaries, [len(counts)]])
+
+
+FORECAST_COLS = ['VF_FORECAST_VALUE', 'ML_FORECAST_VALUE', 'HYBRID_FORECAST_VALUE']
+
+
+def day_fraction(df):
+    """
+    Share of [PERIOD_DT, PERIOD_END_DT] days falling into [OUT_PERIOD_DT, OUT_PERIOD_END_DT]
+    """
+    out_days = (df['OUT_PERIOD_END_DT'] - df['OUT_PERIOD_DT']).dt.days.to_numpy(dtype=np.float64) + 1
+    in_days = (df['PERIOD_END_DT'] - df['PERIOD_DT']).dt.days.to_numpy(dtype=np.float64) + 1
+    return out_days / in_days
+
+
+def logging_progress(logger=None, level=logging.INFO):
+    """
+    Progress callback writing one log record per reported stage
+    
+    Parameters
+    ----------
+    logger : logging.Logger
+        Logger to write to, module logger by default
+    level : int
+        Logging level of the records
+    
+    Returns
+    -------
+    callable
+        Callback for Disaccumulation(progress=...)
+    """
+    logger = logger or logging.getLogger(__name__)
+    
+    def callback(stage, metrics):
+        logger.log(level, '%s: rows in %d, rows out %d, chunks %d, %.3fs', stage,
+                   metrics['rows_in'], metrics['rows_out'], metrics['chunks'], metrics['elapsed'])
+    
+    return callback
+
+
+def tqdm_progress(**tqdm_kwargs):
+    """
+    Progress callback drawing a tqdm bar over input rows (tqdm is imported only here)
+    
+    Parameters
+    ----------
+    **tqdm_kwargs
+        Passed to tqdm.auto.tqdm, e.g. total=len(data) or desc
+    
+    Returns
+    -------
+    callable
+        Callback for Disaccumulation(progress=...)
+    """
+    from tqdm.auto import tqdm
+    
+    bar = tqdm(unit='rows', **tqdm_kwargs)
+    
+    def callback(stage, metrics):
+        if stage == 'chunk':
+            bar.update(metrics['rows_in'])
+        elif stage == 'split_forecasts':
+            bar.update(metrics['rows_in'] - bar.n)
+            bar.set_postfix(rows_out=metrics['rows_out'])
+            bar.close()
+    
+    return callback
+
 
 class Disaccumulation:
-    def __init__(self, data, out_time_lvl):
+    def __init__(self, data, out_time_lvl, forecast_cols=FORECAST_COLS, progress=None, output_path=None):
         """
         Provide forecasts at the required time granularity level.
         
         Parameters
         ----------
-        data : pd.DataFrame
-            Table with ID, Period and Forecast columns
+        data : pd.DataFrame or str
+            Table with ID, Period and Forecast columns, or the path of a dataset written by storage.write_table
         
         out_time_lvl : string
             Required time granularity level
@@ -26,15 +156,41 @@ class Disaccumulation:
             Possible values:
             
             D - days
-            W - weeks (default starting from Sunday)
-            W-MON/W-TUE/.../W-SUN - weeks, starting from specified day of week
+            W - weeks (same as W-SUN)
+            W-MON/W-TUE/.../W-SUN - weeks, ending on specified day of week (pandas anchored weeks)
             M - months
+        
+        forecast_cols : list
+            Forecast columns split proportionally to the number of days,
+            columns missing from data are skipped
+        
+        progress : callable
+            Optional callback progress(stage, metrics) called after every stage
+            ('check_granularity', 'change_granularity', 'share_forecast', 'chunk', 'split_forecasts')
+            with metrics dict of rows_in, rows_out, chunks and elapsed seconds.
+            See logging_progress and tqdm_progress. Nothing is measured when None
+        
+        output_path : str
+            Optional dataset path, split_forecasts writes its result there with storage.write_table
         """
+        data = read_input(data)
         self.data = data
         self.data_splitted = data
         self.out_time_lvl = out_time_lvl
+        self.forecast_cols = [col for col in forecast_cols if col in data.columns]
+        self.progress = progress
+        self.output_path = output_path
         self.FINAL_GRANULARITY_DELIVERED = True
-        
+    
+    
+    def _clock(self):
+        return time.perf_counter() if self.progress is not None else None
+    
+    
+    def _report(self, stage, started, rows_in, rows_out, chunks=1):
+        if self.progress is not None:
+            self.progress(stage, {'rows_in': rows_in, 'rows_out': rows_out, 'chunks': chunks,
+                                  'elapsed': time.perf_counter() - started})
         
     def check_granulatiry(self):
         """
@@ -45,21 +201,22 @@ class Disaccumulation:
         bool
             Returns flag which shows whether forecast split needed or not
         """
+        start = as_datetime(self.data['PERIOD_DT'])
+        end = as_datetime(self.data['PERIOD_END_DT'])
         if self.out_time_lvl == 'D':
-            if (self.data['PERIOD_DT'] != self.data['PERIOD_END_DT']).any():
-                self.FINAL_GRANULARITY_DELIVERED = False
-        elif 'W' in self.out_time_lvl:
-            if (self.data['PERIOD_DT'].apply(lambda x: x - pd.Timedelta(f'{x.dayofweek}D')) != \
-                self.data['PERIOD_END_DT'].apply(lambda x: x - pd.Timedelta(f'{x.dayofweek}D'))).any():
-                self.FINAL_GRANULARITY_DELIVERED = False
-        if self.out_time_lvl == 'M':
-            if (self.data['PERIOD_DT'].apply(lambda x: x - pd.Timedelta(f'{x.day - 1}D')) != \
-                self.data['PERIOD_END_DT'].apply(lambda x: x - pd.Timedelta(f'{x.day - 1}D'))).any():
+            if (start != end).any():
                 self.FINAL_GRANULARITY_DELIVERED = False
+        elif (start.dt.to_period(self.out_time_lvl) != end.dt.to_period(self.out_time_lvl)).any():
+            self.FINAL_GRANULARITY_DELIVERED = False
                 
         return self.FINAL_GRANULARITY_DELIVERED
             
         
+    def _sorted_data(self):
+        id_cols = self.data.columns[self.data.columns.str.contains('_ID')].to_list()
+        return self.data.sort_values(id_cols + ['PERIOD_DT'], kind='stable').reset_index(drop=True)
+    
+    
     def change_granularity(self):
         """
         If FINAL_GRANULARITY_DELIVERED == False then transform original table by splitting forecast periods
@@ -70,54 +227,34 @@ class Disaccumulation:
         pd.DataFrame
             Splitted data to more granular time stamps
         """
-        df = self.data.copy()
-        df['OUT_PERIOD_DT'] = df['PERIOD_DT']
-        df['OUT_PERIOD_END_DT'] = df['PERIOD_END_DT']
-
-        for ind, row in tqdm(self.data.iterrows(), total=self.data.shape[0]):
-            cur_dates = pd.to_datetime(np.array([row['PERIOD_DT'], row['PERIOD_END_DT']]))
-            split_dates = pd.period_range(cur_dates[0], cur_dates[1], freq=self.out_time_lvl).to_timestamp()
-            taken_dates = split_dates[(split_dates > cur_dates[0]) & (split_dates < cur_dates[1])]
-            needed_dates = np.append(taken_dates, cur_dates)
-            needed_dates.sort()
-            start_ind = 1
-            if self.out_time_lvl == 'D':
-                start_ind = 0
-                df.loc[ind, 'OUT_PERIOD_END_DT'] = needed_dates[1] - pd.Timedelta('1D')
-            else:
-                df.loc[ind, 'OUT_PERIOD_END_DT'] = needed_dates[1]
-
-            for i in range(start_ind, len(needed_dates) - 1):        
-                new_row = row.copy()
-                new_row['OUT_PERIOD_DT'] = needed_dates[i] + pd.Timedelta('1D')
-                new_row['OUT_PERIOD_END_DT'] = needed_dates[i + 1]
-                df = df.append(new_row, ignore_index=True)
-
-        self.data_filled = df.sort_values(df.columns[df.columns.str.contains('_ID')].to_list() + ['PERIOD_DT']).reset_index(drop=True)
+        self.data_filled = split_periods(self._sorted_data(), self.out_time_lvl)
         
         return self.data_filled
     
+    
+    def _share_forecast(self, df):
+        share = day_fraction(df)
+        for col in self.forecast_cols:
+            df[col] = df[col] * share
+
+        df = df.drop(['PERIOD_DT', 'PERIOD_END_DT'], axis=1)
+        df = df.rename(columns={'OUT_PERIOD_DT': 'PERIOD_DT', 'OUT_PERIOD_END_DT': 'PERIOD_END_DT'})
+        df = df.set_index(['PERIOD_DT', 'PERIOD_END_DT']).reset_index()
+        
+        return df
+    
+    
     def share_forecast(self):
         """
-        Calculate forecast share and volume of VF_FORECAST_VALUE, ML_FORECAST_VALUE,
-        HYBRID_FORECAST proportionally to number of days in interval [PERIOD_DT, PERIOD_END_DT]
+        Calculate forecast share and volume of forecast_cols (by default VF_FORECAST_VALUE,
+        ML_FORECAST_VALUE, HYBRID_FORECAST_VALUE) proportionally to number of days in interval [PERIOD_DT, PERIOD_END_DT]
         
         Returns
         -------
         pd.DataFrame
             Data with shared forecast
         """
-        def split(x, target):
-            return x[target] * ((x['OUT_PERIOD_END_DT'] - x['OUT_PERIOD_DT']) / np.timedelta64(1, 'D') + 1) / \
-        ((x['PERIOD_END_DT'] - x['PERIOD_DT']) / np.timedelta64(1, 'D') + 1)
-
-        self.data_filled['VF_FORECAST_VALUE'] = self.data_filled.apply(lambda x: split(x, 'VF_FORECAST_VALUE'), axis=1)
-        self.data_filled['ML_FORECAST_VALUE'] = self.data_filled.apply(lambda x: split(x, 'ML_FORECAST_VALUE'), axis=1)
-        self.data_filled['HYBRID_FORECAST_VALUE'] = self.data_filled.apply(lambda x: split(x, 'HYBRID_FORECAST_VALUE'), axis=1)
-
-        self.data_filled = self.data_filled.drop(['PERIOD_DT', 'PERIOD_END_DT'], axis=1)
-        self.data_filled = self.data_filled.rename(columns={'OUT_PERIOD_DT': 'PERIOD_DT', 'OUT_PERIOD_END_DT': 'PERIOD_END_DT'})
-        self.data_filled = self.data_filled.set_index(['PERIOD_DT', 'PERIOD_END_DT']).reset_index()
+        self.data_filled = self._share_forecast(self.data_filled)
         self.data_splitted = self.data_filled
         
         return self.data_filled
@@ -132,11 +269,64 @@ class Disaccumulation:
         pd.DataFrame
             Data with shared forecast
         """
+        started = self._clock()
         self.check_granulatiry()
+        self._report('check_granularity', started, len(self.data), len(self.data))
+        
         if not self.FINAL_GRANULARITY_DELIVERED:
+            stage_started = self._clock()
             self.change_granularity()
+            self._report('change_granularity', stage_started, len(self.data), len(self.data_filled))
+            
+            stage_started = self._clock()
             self.share_forecast()
+            self._report('share_forecast', stage_started, len(self.data_filled), len(self.data_splitted))
+        
+        self._report('split_forecasts', started, len(self.data), len(self.data_splitted))
+        
+        if self.output_path is not None:
+            write_table(self.data_splitted, self.output_path)
         
         return self.data_splitted
     
-    
\ No newline at end of file
+    
+    def iter_split_forecasts(self, chunk_size=1000000):
+        """
+        Streaming version of split_forecasts: yields the shared forecast in chunks,
+        so that the full split table never has to be in memory at once
+        
+        Parameters
+        ----------
+        chunk_size : int
+            Approximate number of output rows per chunk (a chunk never cuts an input row,
+            so it can exceed chunk_size by the number of periods of one input row)
+        
+        Yields
+        ------
+        pd.DataFrame
+            Consecutive parts of the split_forecasts() result
+        """
+        started = self._clock()
+        self.check_granulatiry()
+        self._report('check_granularity', started, len(self.data), len(self.data))
+        
+        if self.FINAL_GRANULARITY_DELIVERED:
+            chunks = range(0, len(self.data), chunk_size)
+            for i in chunks:
+                yield self.data.iloc[i:i + chunk_size]
+            self._report('split_forecasts', started, len(self.data), len(self.data), len(chunks))
+            return
+        
+        data = self._sorted_data()
+        _, counts = _period_ordinals(as_datetime(data['PERIOD_DT']), as_datetime(data['PERIOD_END_DT']), self.out_time_lvl)
+        bounds = _chunk_bounds(counts, chunk_size)
+        
+        rows_out = 0
+        for chunk, (lo, hi) in enumerate(zip(bounds[:-1], bounds[1:]), start=1):
+            chunk_started = self._clock()
+            df = self._share_forecast(split_periods(data.iloc[lo:hi], self.out_time_lvl))
+            rows_out += len(df)
+            self._report('chunk', chunk_started, hi - lo, len(df), chunk)
+            yield df
+        
+        self._report('split_forecasts', started, len(data), rows_out, len(bounds) - 1)
@@ -0,0 +1,310 @@
+import os
+import json
+import hashlib
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+SAS_DTTM_FORMAT = '%d%b%Y:%H:%M:%S'  # 01JUL2021:14:31:07
+SHORT_DATE_FORMAT = '%d-%b-%y'  # 10-Nov-19
+
+# SAS "no end date" value used in close/end date columns, loaded as NaT (open-ended)
+SAS_MAX_DTTM = pd.Timestamp('5999-01-01')
+
+CACHE_DIR = '.dps_cache'
+
+
+def _hierarchy_columns(name, n_levels, nm_names=None):
+    """
+    Columns of a DPS hierarchy table: <NAME>_LVL_ID/NM/DESC<i> for every level, then the member columns
+
+    nm_names overrides the NM/DESC column prefix of single levels (DPS_CUSTOMER has LOCATION_LVL_NM1/2)
+    """
+    nm_names = nm_names or {}
+    columns = {}
+    for lvl in range(1, n_levels + 1):
+        nm_name = nm_names.get(lvl, name)
+        columns[f'{name}_LVL_ID{lvl}'] = 'Int32'
+        columns[f'{nm_name}_LVL_NM{lvl}'] = 'category'
+        columns[f'{nm_name}_LVL_DESC{lvl}'] = 'category'
+    return columns
+
+
+def _member_columns(name, dttm_cols):
+    columns = {f'{name}_ID': 'Int32', f'{name}_NM': 'category', f'{name}_DESC': 'category'}
+    columns.update({col: 'datetime' for col in dttm_cols})
+    return columns
+
+
+DPS_TABLES = {
+    'DPS_PRODUCT': {
+        'columns': {
+            **_hierarchy_columns('PRODUCT', 7),
+            'parent_product_id': 'Int32',
+            **_member_columns('PRODUCT', ['MODIFIED_DTTM']),
+            'DELETE_FLG': 'Int8'
+        },
+        'dates': {'MODIFIED_DTTM': SAS_DTTM_FORMAT},
+        'keys': ['PRODUCT_ID']
+    },
+    'DPS_LOCATION': {
+        'columns': {
+            **_hierarchy_columns('LOCATION', 5),
+            **_member_columns('LOCATION', ['open_dttm', 'close_dttm', 'modified_dttm']),
+            'delete_flg': 'Int8'
+        },
+        'dates': {'open_dttm': SAS_DTTM_FORMAT, 'close_dttm': SAS_DTTM_FORMAT, 'modified_dttm': SAS_DTTM_FORMAT},
+        'keys': ['LOCATION_ID']
+    },
+    'DPS_CUSTOMER': {
+        'columns': {
+            **_hierarchy_columns('CUSTOMER', 5, nm_names={1: 'LOCATION', 2: 'LOCATION'}),
+            **_member_columns('CUSTOMER', ['open_dttm', 'close_dttm', 'modified_dttm']),
+            'delete_flg': 'Int8'
+        },
+        'dates': {'open_dttm': SAS_DTTM_FORMAT, 'close_dttm': SAS_DTTM_FORMAT, 'modified_dttm': SAS_DTTM_FORMAT},
+        'keys': ['CUSTOMER_ID']
+    },
+    'DPS_DISTR_CHANNEL': {
+        'columns': {
+            **_hierarchy_columns('DISTR_CHANNEL', 1),
+            **_member_columns('DISTR_CHANNEL', ['OPEN_DTTM', 'CLOSE_DTTM', 'MODIFIED_DTTM']),
+            'DELETE_FLG': 'Int8'
+        },
+        'dates': {'OPEN_DTTM': SAS_DTTM_FORMAT, 'CLOSE_DTTM': SAS_DTTM_FORMAT, 'MODIFIED_DTTM': SAS_DTTM_FORMAT},
+        'keys': ['DISTR_CHANNEL_ID']
+    },
+    'DPS_PRODUCT_ATTR': {
+        'columns': {'PRODUCT_ID': 'Int32', 'PRODUCT_ATTR_NAME': 'category', 'PRODUCT_ATTR_VALUE': 'str'},
+        'dates': {},
+        'keys': ['PRODUCT_ID', 'PRODUCT_ATTR_NAME']
+    },
+    'DPS_LOCATION_ATTR': {
+        'columns': {'LOCATION_ID': 'Int32', 'LOCATION_ATTR_NAME': 'category', 'LOCATION_ATTR_VALUE': 'str'},
+        'dates': {},
+        'keys': ['LOCATION_ID', 'LOCATION_ATTR_NAME']
+    },
+    'DPS_CUSTOMER_ATTR': {
+        'columns': {'CUSTOMER_ID': 'Int32', 'CUSTOMER_ATTR_NAME': 'category', 'CUSTOMER_ATTR_VALUE': 'str'},
+        'dates': {},
+        'keys': ['CUSTOMER_ID', 'CUSTOMER_ATTR_NAME']
+    },
+    'DPS_DISTR_CHANNEL_ATTR': {
+        'columns': {'DISTR_CHANNEL_ID': 'Int32', 'DISTR_ATTR_NAME': 'category', 'DISTR_ATTR_VALUE': 'str'},
+        'dates': {},
+        'keys': ['DISTR_CHANNEL_ID', 'DISTR_ATTR_NAME']
+    },
+    'DPS_LOCATION_LIFE': {
+        'columns': {
+            'LOCATION_ID': 'Int32', 'CUSTOMER_LVL_ID': 'Int32', 'PRODUCT_LVL_ID': 'Int32', 'DISTR_CHANNEL_LVL_ID': 'Int32',
+            'PERIOD_START_DT': 'datetime', 'PERIOD_END_DT': 'datetime', 'LOCATION_SUCCESSOR_ID': 'Int32',
+            'RELATION_SHARE': 'float64', 'PERIOD_TYPE': 'category'
+        },
+        'dates': {'PERIOD_START_DT': SHORT_DATE_FORMAT, 'PERIOD_END_DT': SHORT_DATE_FORMAT},
+        'keys': ['LOCATION_ID', 'CUSTOMER_LVL_ID', 'PRODUCT_LVL_ID', 'DISTR_CHANNEL_LVL_ID', 'PERIOD_START_DT']
+    },
+    'DPS_ASSORT_MATRIX': {
+        'columns': {
+            'PRODUCT_ID': 'Int32', 'LOCATION_ID': 'Int32', 'CUSTOMER_ID': 'Int32', 'DISTR_CHANNEL_ID': 'Int32',
+            'START_DT': 'datetime', 'END_DT': 'datetime', 'STATUS': 'category',
+            'MODIFIED_DTTM': 'datetime', 'DELETE_FLG': 'Int8'
+        },
+        'dates': {'START_DT': SHORT_DATE_FORMAT, 'END_DT': SHORT_DATE_FORMAT, 'MODIFIED_DTTM': SAS_DTTM_FORMAT},
+        'keys': ['PRODUCT_ID', 'LOCATION_ID', 'CUSTOMER_ID', 'DISTR_CHANNEL_ID', 'START_DT']
+    },
+    'DPS_PRICE': {
+        'columns': {
+            'PRODUCT_ID': 'Int32', 'LOCATION_ID': 'Int32', 'CUSTOMER_ID': 'Int32', 'DISTR_CHANNEL_ID': 'Int32',
+            'PERIOD_START_DT': 'datetime', 'PERIOD_END_DT': 'datetime', 'PRICE': 'float64', 'PRICE_TYPE': 'category',
+            'MODIFIED_DTTM': 'datetime', 'DELETE_FLG': 'Int8'
+        },
+        'dates': {'PERIOD_START_DT': SHORT_DATE_FORMAT, 'PERIOD_END_DT': SHORT_DATE_FORMAT, 'MODIFIED_DTTM': SAS_DTTM_FORMAT},
+        'keys': ['PRODUCT_ID', 'LOCATION_ID', 'CUSTOMER_ID', 'DISTR_CHANNEL_ID', 'PERIOD_START_DT', 'PRICE_TYPE']
+    },
+    'DPS_STOCK': {
+        'columns': {
+            'PRODUCT_ID': 'Int32', 'LOCATION_ID': 'Int32', 'PERIOD_DT': 'datetime', 'STOCK_QTY': 'float64',
+            'MODIFIED_DTTM': 'datetime', 'DELETE_FLG': 'Int8'
+        },
+        'dates': {'PERIOD_DT': SHORT_DATE_FORMAT, 'MODIFIED_DTTM': SAS_DTTM_FORMAT},
+        'keys': ['PRODUCT_ID', 'LOCATION_ID', 'PERIOD_DT']
+    },
+    'DPS_PROMO': {
+        'columns': {
+            'PROMO_ID': 'Int32', 'PRODUCT_ID': 'Int32', 'LOCATION_ID': 'Int32', 'CUSTOMER_ID': 'Int32',
+            'DISTR_CHANNEL_ID': 'Int32', 'PERIOD_START_DT': 'datetime', 'PERIOD_END_DT': 'datetime',
+            'PROMO_PRICE': 'float64', 'PROMO_TYPE': 'Int32', 'MODIFIED_DTTM': 'datetime', 'DELETE_FLG': 'Int8'
+        },
+        'dates': {'PERIOD_START_DT': SHORT_DATE_FORMAT, 'PERIOD_END_DT': SHORT_DATE_FORMAT, 'MODIFIED_DTTM': SAS_DTTM_FORMAT},
+        'keys': ['PROMO_ID', 'PRODUCT_ID', 'LOCATION_ID', 'CUSTOMER_ID', 'DISTR_CHANNEL_ID']
+    },
+    'DPS_PROMO_TYPE': {
+        'columns': {'PROMO_TYPE': 'Int32', 'PROMO_NM': 'category'},
+        'dates': {},
+        'keys': ['PROMO_TYPE']
+    },
+    'DPS_SELL_IN': {
+        'columns': {
+            'PRODUCT_ID': 'Int32', 'LOCATION_ID': 'Int32', 'CUSTOMER_ID': 'Int32', 'DISTR_CHANNEL_ID': 'Int32',
+            'PERIOD_DT': 'datetime', 'ORDERS_QTY': 'float64', 'ORDERS_AMOUNT': 'float64',
+            'SHIPMENTS_QTY': 'float64', 'SHIPMENTS_AMOUNT': 'float64', 'INVOICES_QTY': 'float64',
+            'INVOICES_AMOUNT': 'float64', 'RETURNS_QTY': 'float64', 'RETUNRS_AMOUNT': 'float64',
+            'PROMO_FLG': 'Int8', 'PROMO_ID': 'Int32', 'COST': 'float64', 'MODIFIED_DTTM': 'datetime', 'DELETE_FLG': 'Int8'
+        },
+        'dates': {'PERIOD_DT': SHORT_DATE_FORMAT, 'MODIFIED_DTTM': SAS_DTTM_FORMAT},
+        'keys': ['PRODUCT_ID', 'LOCATION_ID', 'CUSTOMER_ID', 'DISTR_CHANNEL_ID', 'PERIOD_DT']
+    }
+}
+
+
+def _csv_dtypes(schema, columns):
+    """read_csv dtypes: dates are read as strings and parsed with their explicit format afterwards"""
+    return {col: 'str' if dtype == 'datetime' else dtype for col, dtype in schema['columns'].items() if col in columns}
+
+
+def parse_dates(df, dates):
+    """
+    Parse date columns with explicit formats, SAS_MAX_DTTM becomes NaT
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Table with date columns read as strings
+    dates : dict
+        Column name -> strptime format
+
+    Returns
+    -------
+    pd.DataFrame
+        df with parsed date columns
+    """
+    for col, date_format in dates.items():
+        if col in df.columns:
+            parsed = pd.to_datetime(df[col], format=date_format).astype('datetime64[us]')
+            df[col] = parsed.mask(parsed >= SAS_MAX_DTTM)
+    return df
+
+
+def read_dps_csv(path, schema, columns=None):
+    """
+    Read a DPS csv with the pyarrow engine, explicit dtypes and date formats
+
+    Parameters
+    ----------
+    path : str
+        csv path
+    schema : dict
+        DPS_TABLES entry
+    columns : list
+        Columns to read, all by default
+
+    Returns
+    -------
+    pd.DataFrame
+        Typed table
+    """
+    columns = columns or list(schema['columns'])
+    df = pd.read_csv(path, engine='pyarrow', usecols=columns, dtype=_csv_dtypes(schema, columns))
+    return parse_dates(df, schema['dates'])
+
+
+def _cache_key(path, schema):
+    """csv size, mtime and schema hash; the sidecar is valid only while all three match"""
+    stat = os.stat(path)
+    schema_hash = hashlib.md5(json.dumps(schema, sort_keys=True).encode()).hexdigest()
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'schema': schema_hash}
+
+
+def _valid_cache(cache_path, key):
+    """the sidecar exists and was written for this csv and schema"""
+    if not os.path.exists(cache_path):
+        return False
+    metadata = pq.read_schema(cache_path).metadata or {}
+    return json.loads(metadata.get(b'dps_cache_key', b'{}')) == key
+
+
+def load_table(table_name, data_path, columns=None, use_cache=True):
+    """
+    Load a typed DPS_* table
+
+    The csv is parsed once and stored as a parquet sidecar in data_path/.dps_cache,
+    later loads read the sidecar while the csv size, mtime and the schema are unchanged
+
+    Parameters
+    ----------
+    table_name : str
+        Table name, e.g. DPS_PRICE (key of DPS_TABLES)
+    data_path : str
+        Directory with the csv files
+    columns : list
+        Columns to load, all by default
+    use_cache : bool
+        Read and write the parquet sidecar
+
+    Returns
+    -------
+    pd.DataFrame
+        Table with Int32 IDs, categorical names and parsed dates
+    """
+    schema = DPS_TABLES[table_name]
+    path = os.path.join(data_path, table_name + '.csv')
+
+    if not use_cache:
+        return read_dps_csv(path, schema, columns)
+
+    cache_path = os.path.join(data_path, CACHE_DIR, table_name + '.parquet')
+    key = _cache_key(path, schema)
+
+    if _valid_cache(cache_path, key):
+        return pd.read_parquet(cache_path, columns=columns)
+
+    df = read_dps_csv(path, schema)
+    if df.empty:
+        return df[columns] if columns else df
+
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.replace_schema_metadata({**table.schema.metadata, b'dps_cache_key': json.dumps(key).encode()})
+    # written aside and renamed, so a concurrent reader never sees a partial file
+    pq.write_table(table, cache_path + '.tmp')
+    os.replace(cache_path + '.tmp', cache_path)
+
+    return df[columns] if columns else df
+
+
+def iter_table(table_name, data_path, columns=None, chunk_size=100000):
+    """
+    Stream a typed DPS_* table in chunks without materializing it
+
+    Chunks are read from the parquet sidecar when it is valid (see load_table),
+    otherwise from the csv. Categorical columns have the categories of their chunk.
+
+    Parameters
+    ----------
+    table_name : str
+        Table name, e.g. DPS_PRICE (key of DPS_TABLES)
+    data_path : str
+        Directory with the csv files
+    columns : list
+        Columns to read, all by default
+    chunk_size : int
+        Maximum rows per chunk
+
+    Yields
+    ------
+    pd.DataFrame
+        Typed chunk with the requested columns
+    """
+    schema = DPS_TABLES[table_name]
+    path = os.path.join(data_path, table_name + '.csv')
+    cache_path = os.path.join(data_path, CACHE_DIR, table_name + '.parquet')
+    columns = columns or list(schema['columns'])
+
+    if _valid_cache(cache_path, _cache_key(path, schema)):
+        for batch in pq.ParquetFile(cache_path).iter_batches(batch_size=chunk_size, columns=columns):
+            yield batch.to_pandas()
+        return
+
+    for chunk in pd.read_csv(path, usecols=columns, dtype=_csv_dtypes(schema, columns), chunksize=chunk_size):
+        yield parse_dates(chunk, schema['dates'])[columns]
@@ -1,13 +1,97 @@
 import pandas as pd
 import numpy as np
+import itertools
 import os
 import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 project_path = os.path.abspath(os.path.join('..'))
 
 if project_path not in sys.path:
     sys.path.append(project_path)
 
+from dps_schema import DPS_TABLES, load_table, iter_table
+from hierarchy import key_hashes
+
+
+SAMPLE_BUCKETS = 2 ** 20
+
+
+def series_columns(cols):
+    """PRODUCT/LOCATION id columns among cols, the sampled series of the fast mode (all cols if none)"""
+    series = [col for col in cols if 'ID' in col and ('PRODUCT' in col or 'LOCATION' in col)]
+    return series or list(cols)
+
+
+def sample_mask(series, frac):
+    """
+    Rows of the series kept in a hash sample of frac of the series
+    
+    series are the key hashes of the rows' PRODUCT/LOCATION series (key_hashes of series_columns).
+    A series is kept when its hash falls in the first frac of the hash range, so every table and
+    every chunk keeps the same series and key sets stay comparable across tables. This is a
+    Bernoulli cluster sample of series with inclusion probability frac, not a stratified one:
+    the number of series kept per product or location is not controlled, and the rows are
+    read and parsed before the mask is applied, so sampling saves checking work, not I/O.
+    """
+    return series % SAMPLE_BUCKETS < frac * SAMPLE_BUCKETS
+
+
+def rate_margin(checked, violations, frac, z=1.96):
+    """
+    Half width of the approximate 95% confidence interval of the violation rate
+    sum(violations) / sum(checked) of a sample_mask sample
+    
+    checked and violations are per sampled series counts. Ratio estimator variance of a
+    cluster sample with the finite population correction 1 - frac: 0 without sampling
+    (frac None or 1), NaN when fewer than 2 series are sampled
+    """
+    if frac is None or frac >= 1:
+        return 0.0
+    checked, violations = np.asarray(checked, dtype=np.float64), np.asarray(violations, dtype=np.float64)
+    if len(checked) < 2 or checked.sum() == 0:
+        return np.nan
+    residuals = violations - violations.sum() / checked.sum() * checked
+    variance = (1 - frac) * residuals.var(ddof=1) / (len(checked) * checked.mean() ** 2)
+    return z * np.sqrt(variance)
+
+
+class KeyIndex:
+    """
+    Distinct key tuples of a table: positions of their first rows (in table order)
+    and their hashes, also sorted for membership tests
+    """
+    def __init__(self, df, cols):
+        hashes = key_hashes(df, cols)
+        unique, first = np.unique(hashes, return_index=True)
+        self.first_rows = np.sort(first)
+        self.hashes = hashes[self.first_rows]
+        self.sorted_hashes = unique
+    
+    
+    def contains(self, hashes):
+        """Membership of hashes in the index"""
+        if len(self.sorted_hashes) == 0:
+            return np.zeros(len(hashes), dtype=bool)
+        pos = np.minimum(np.searchsorted(self.sorted_hashes, hashes), len(self.sorted_hashes) - 1)
+        return self.sorted_hashes[pos] == hashes
+
+
+# process pool workers keep their own copy of the DQ object with loaded tables
+_worker_dq = None
+
+
+def _init_worker(dq):
+    global _worker_dq
+    _worker_dq = dq
+
+
+def _run_worker_task(task):
+    return _worker_dq.run_task(*task)
+
+
 class DQ:
     def __init__(self, check_id,
                  check_name, client,
@@ -22,9 +106,122 @@ class DQ:
         self.lvl_data = lvl_data
         self.data_path = data_path
         self.data_quality_output = pd.DataFrame()
+        self.results = []
+        self.tables = {}
+        self.key_indexes = {}
+        
+    
+    def table_columns(self, table_name):
+        """
+        Column names of an input table without reading its rows
+        """
+        if table_name in DPS_TABLES:
+            return list(DPS_TABLES[table_name]['columns'])
+        return pd.read_csv(self.data_path + table_name + '.csv', nrows=0).columns.tolist()
+    
+    
+    def read_table(self, table_name, columns=None):
+        """
+        Read input table, registered DPS tables are loaded typed (see dps_schema)
+        """
+        if table_name in DPS_TABLES:
+            return load_table(table_name, self.data_path, columns)
+        return pd.read_csv(self.data_path + table_name + '.csv', usecols=columns)
+    
+    
+    def plan(self):
+        """
+        Columns of every input table needed by the configured checks
+        
+        Returns
+        -------
+        dict
+            Table name -> list of columns (in table order)
+        """
+        needed = {}
+        
+        for table_name, target_col in self.input_tables.get('val_range', []):
+            # violating rows are reported with all their columns
+            needed.setdefault(table_name, set()).update(self.table_columns(table_name))
+        
+        for table_name in self.input_tables.get('cross_consistency', []):
+            cols = self.table_columns(table_name)
+            needed.setdefault(table_name, set()).update(col for col in cols if 'ID' in col)
+        
+        for pair in self.input_tables.get('time_cross_consistency', []):
+            for table_name in pair:
+                cols = self.table_columns(table_name)
+                needed.setdefault(table_name, set()).update(
+                    col for col in cols
+                    if ('ID' in col and ('PRODUCT' in col or 'LOCATION' in col)) or col.endswith('_DT')
+                )
+        
+        return {table_name: [col for col in self.table_columns(table_name) if col in cols]
+                for table_name, cols in needed.items()}
+    
+    
+    def load_tables(self):
+        """
+        Load every table referenced by the checks once, with only the planned columns
+        """
+        self.tables = {table_name: self.read_table(table_name, columns)
+                       for table_name, columns in self.plan().items()}
+        return self.tables
+    
+    
+    def table(self, table_name):
+        """
+        Input table shared by all checks, read on first use if load_tables was not called
+        """
+        if table_name not in self.tables:
+            self.tables[table_name] = self.read_table(table_name)
+        return self.tables[table_name]
+    
+    
+    def iter_table(self, table_name, columns, chunk_size=None):
+        """
+        Columns of an input table in chunks of chunk_size rows streamed from disk,
+        or as a single frame (loaded table if available) when chunk_size is None
+        """
+        if chunk_size is None:
+            if table_name in self.tables and set(columns) <= set(self.tables[table_name].columns):
+                yield self.tables[table_name][columns]
+            else:
+                yield self.read_table(table_name, columns)[columns]
+            return
+        
+        if table_name in DPS_TABLES:
+            yield from iter_table(table_name, self.data_path, columns, chunk_size)
+        else:
+            for chunk in pd.read_csv(self.data_path + table_name + '.csv', usecols=columns, chunksize=chunk_size):
+                yield chunk[columns]
+    
+    
+    def key_index(self, table_name, cols):
+        """
+        KeyIndex of the distinct cols tuples of a table, built once per table and key columns
+        """
+        if (table_name, tuple(cols)) not in self.key_indexes:
+            self.key_indexes[(table_name, tuple(cols))] = KeyIndex(self.table(table_name), cols)
+        return self.key_indexes[(table_name, tuple(cols))]
+    
+    
+    def collect(self):
+        """
+        Concatenate the accumulated check results into data_quality_output at once
+        
+        Returns
+        -------
+        pd.DataFrame
+            data_quality_output table
+        """
+        if self.results:
+            self.data_quality_output = pd.concat([self.data_quality_output] + self.results)
+            self.results = []
+        return self.data_quality_output
         
 
-    def check_val_range(self, tables, th=0):
+    def check_val_range(self, tables, th=0, collect=True):
         """
         Сhecks that the column values are not greater than the specified value 
         (for example, that the prices are not negative).
@@ -36,6 +233,10 @@ class DQ:
         
         th : float
             Rows, where target_col less than th add to data_quality_output
+        
+        collect : bool
+            Concatenate the results into data_quality_output right away,
+            otherwise they stay in results until collect() is called
             
 
         Returns
@@ -45,31 +246,44 @@ class DQ:
         """
         
         
-        for table_name, target_col in tables:            
-            table = pd.read_csv(self.data_path + table_name + '.csv')
-            
-            result = table[table[target_col] < th]
-            
-            if not result.empty:
-                result['INPUT_COLUMN'] = target_col
-                result['INPUT_TABLE'] = table_name
-                result['INPUT_VALUE'] = th
-                result['WARNING_TYPE'] = 'val_range'
-                result['WARNING'] = f'values in column {target_col} are less than {th} in table {table_name}'
-                self.data_quality_output = pd.concat([self.data_quality_output, result])
+        for table_name, target_col in tables:
+            self.results.extend(self._val_range(table_name, target_col, th)[0])
 
-        return self.data_quality_output
+        return self.collect() if collect else self.data_quality_output
+    
     
+    def _val_range(self, table_name, target_col, th):
+        """val_range check of one table column, returns (results, rows scanned)"""
+        table = self.table(table_name)
+        
+        result = table[table[target_col] < th]
+        
+        if result.empty:
+            return [], len(table)
+        
+        result['INPUT_COLUMN'] = target_col
+        result['INPUT_TABLE'] = table_name
+        result['INPUT_VALUE'] = th
+        result['WARNING_TYPE'] = 'val_range'
+        result['WARNING'] = f'values in column {target_col} are less than {th} in table {table_name}'
+        return [result], len(table)
     
-    def check_cross_consistency(self, tables):
+    
+    def check_cross_consistency(self, tables, collect=True):
         """
         Checks that there are no key fields in the first table that are missing in the second table.
         Checking each pair of tables.
         
+        Distinct key tuples of every table are hashed once (key_index), so each pair costs
+        a sorted lookup of the first table's distinct keys in the second one, not a merge.
+        
         Parameters
         ----------
         tables : list
             List of checking tables [table1, table2, table3]
+        
+        collect : bool
+            Concatenate the results into data_quality_output right away
             
 
         Returns
@@ -79,27 +293,36 @@ class DQ:
         """
 
         for df1_name, df2_name in list(itertools.permutations(tables, 2)):
-            df1, df2 = pd.read_csv(self.data_path + df1_name + '.csv'), pd.read_csv(self.data_path + df2_name + '.csv')
-            common_cols = df1.columns.intersection(df2.columns)
-            common_cols = list(common_cols[common_cols.str.contains('ID')])
+            self.results.extend(self._cross_consistency(df1_name, df2_name)[0])
 
-            if common_cols == []:
-                break
+        return self.collect() if collect else self.data_quality_output
+    
+    
+    def _cross_consistency(self, df1_name, df2_name):
+        """cross_consistency check of one ordered table pair, returns (results, rows scanned)"""
+        df1, df2 = self.table(df1_name), self.table(df2_name)
+        common_cols = df1.columns.intersection(df2.columns)
+        common_cols = list(common_cols[common_cols.str.contains('ID')])
 
-            df_merged = df1.drop_duplicates(common_cols).merge(df2.drop_duplicates(common_cols), on=common_cols, 
-                               how='left', indicator=True)
+        if common_cols == []:
+            return [], 0
 
-            result = df_merged[df_merged['_merge'] == 'left_only'][common_cols]
+        keys1, keys2 = self.key_index(df1_name, common_cols), self.key_index(df2_name, common_cols)
+        missing = np.flatnonzero(~keys2.contains(keys1.hashes))
 
-            if not result.empty:
-                result['INPUT_TABLE'] = df1_name + ' && ' + df2_name
-                result['WARNING_TYPE'] = 'cross_consistency'
-                result['WARNING'] = f'id rows from table {df1_name} doesnot appear in table {df2_name}'
-                self.data_quality_output = pd.concat([self.data_quality_output, result])
+        result = df1.iloc[keys1.first_rows[missing]][common_cols]
+        result.index = missing
 
-        return self.data_quality_output
+        if result.empty:
+            return [], len(df1) + len(df2)
+        
+        result['INPUT_TABLE'] = df1_name + ' && ' + df2_name
+        result['WARNING_TYPE'] = 'cross_consistency'
+        result['WARNING'] = f'id rows from table {df1_name} doesnot appear in table {df2_name}'
+        return [result], len(df1) + len(df2)
     
-    def check_time_cross_consistency(self, tables, th):
+    
+    def check_time_cross_consistency(self, tables, th, collect=True):
         """
         Checks tables for time cross-consistency (i.e. finding prodict_id - location_id pairs
         that have been in the SALES table and not in the STOCK table for some period)
@@ -111,6 +334,9 @@ class DQ:
             
         th : int
             Threshold value showing how many rows shouldnot be in table2 to add it to data_quality_output
+        
+        collect : bool
+            Concatenate the results into data_quality_output right away
             
 
         Returns
@@ -120,42 +346,51 @@ class DQ:
         """
         
         for df1_name, df2_name in tables:
-            df1, df2 = pd.read_csv(self.data_path + df1_name + '.csv'), pd.read_csv(self.data_path + df2_name + '.csv')
-            common_cols = df1.columns.intersection(df2.columns)
-            common_id_cols = common_cols[common_cols.str.contains('ID')]
-            common_id_cols = list(common_id_cols[(common_id_cols.str.contains('PRODUCT')) | (common_id_cols.str.contains('LOCATION'))])
+            self.results.extend(self._time_cross_consistency(df1_name, df2_name, th)[0])
 
-            common_dt_cols = list(common_cols[common_cols.str.endswith('_DT')])
+        return self.collect() if collect else self.data_quality_output
+    
+    
+    def _time_cross_consistency(self, df1_name, df2_name, th):
+        """time_cross_consistency check of one table pair, returns (results, rows scanned)"""
+        df1, df2 = self.table(df1_name), self.table(df2_name)
+        common_cols = df1.columns.intersection(df2.columns)
+        common_id_cols = common_cols[common_cols.str.contains('ID')]
+        common_id_cols = list(common_id_cols[(common_id_cols.str.contains('PRODUCT')) | (common_id_cols.str.contains('LOCATION'))])
 
-            if common_dt_cols == [] or common_id_cols == []:
-                break
+        common_dt_cols = list(common_cols[common_cols.str.endswith('_DT')])
 
-            common_cols = common_id_cols + common_dt_cols
+        if common_dt_cols == [] or common_id_cols == []:
+            return [], 0
 
-            df_merged = df1.drop_duplicates(common_cols).merge(df2.drop_duplicates(common_cols), on=common_cols, 
-                               how='left', indicator=True)
+        common_cols = common_id_cols + common_dt_cols
 
-            result1 = df_merged[df_merged['_merge'] == 'left_only'][common_cols]
+        df_merged = df1.drop_duplicates(common_cols).merge(df2.drop_duplicates(common_cols), on=common_cols, 
+                           how='left', indicator=True)
+        
+        results = []
 
-            if not result1.empty:
-                result1['INPUT_TABLE'] = df1_name + ' && ' + df2_name
-                result1['INPUT_VALUE'] = th
-                result1['WARNING_TYPE'] = 'time_cross_consistency'
-                result1['WARNING'] = f'id rows from table {df1_name} doesnot appear in table {df2_name}'
-                self.data_quality_output = pd.concat([self.data_quality_output, result1])
+        result1 = df_merged[df_merged['_merge'] == 'left_only'][common_cols]
 
-            both = df_merged[df_merged['_merge'] == 'both']
-            both = both.groupby(common_cols).size().reset_index(name='cnt')
-            result2 = both[both['cnt'] <= th].drop('cnt', axis=1)
+        if not result1.empty:
+            result1['INPUT_TABLE'] = df1_name + ' && ' + df2_name
+            result1['INPUT_VALUE'] = th
+            result1['WARNING_TYPE'] = 'time_cross_consistency'
+            result1['WARNING'] = f'id rows from table {df1_name} doesnot appear in table {df2_name}'
+            results.append(result1)
 
-            if not result2.empty:
-                result2['INPUT_TABLE'] = df1_name + ' && ' + df2_name
-                result2['INPUT_VALUE'] = th
-                result2['WARNING_TYPE'] = 'time_cross_consistency'
-                result2['WARNING'] = f'id rows from table {df1_name} doesnot appear in table {df2_name}'
-                self.data_quality_output = pd.concat([self.data_quality_output, result2])
+        both = df_merged[df_merged['_merge'] == 'both']
+        both = both.groupby(common_cols).size().reset_index(name='cnt')
+        result2 = both[both['cnt'] <= th].drop('cnt', axis=1)
 
-        return self.data_quality_output
+        if not result2.empty:
+            result2['INPUT_TABLE'] = df1_name + ' && ' + df2_name
+            result2['INPUT_VALUE'] = th
+            result2['WARNING_TYPE'] = 'time_cross_consistency'
+            result2['WARNING'] = f'id rows from table {df1_name} doesnot appear in table {df2_name}'
+            results.append(result2)
+
+        return results, len(df1) + len(df2)
     
     
     def format_output(self, lvl_data):
@@ -177,8 +412,7 @@ class DQ:
             if f'{el}_ID' not in self.data_quality_output.columns:
                 continue
                 
-            df = pd.read_csv(self.data_path + lvl_data[el] + '.csv')
-            cols = df.columns
+            cols = pd.Index(self.table_columns(lvl_data[el]))
             last_lvl = len(cols[cols.str.contains(f'{el}_LVL_ID')])
 
             self.data_quality_output[f'{el}_LVL_ID{last_lvl + 1}'] = self.data_quality_output[f'{el}_ID'].astype('Int64')
@@ -187,14 +421,311 @@ class DQ:
             
     
     def check(self):
+        """
+        Run all configured checks: every input table is loaded once with the planned columns
+        and the results of all checks are concatenated once
+        """
+        self.load_tables()
+        
         self.check_val_range(
             self.input_tables['val_range'],
-            self.th_values['val_range']
+            self.th_values['val_range'],
+            collect=False
         )
-        self.check_cross_consistency(self.input_tables['cross_consistency'])
+        self.check_cross_consistency(self.input_tables['cross_consistency'], collect=False)
         
         self.check_time_cross_consistency(self.input_tables['time_cross_consistency'],
-                                          self.th_values['time_cross_consistency']
+                                          self.th_values['time_cross_consistency'],
+                                          collect=False
                                          )
+        self.collect()
+        
+        self.format_output(self.lvl_data)
+    
+    
+    def tasks(self):
+        """
+        Independent units of the configured checks: one per val_range column,
+        cross_consistency table pair and time_cross_consistency pair, in check() order
+        
+        Returns
+        -------
+        list of tuples
+            (check name, input table label, method name, arguments)
+        """
+        tasks = []
+        for table_name, target_col in self.input_tables.get('val_range', []):
+            tasks.append(('val_range', table_name, '_val_range',
+                          (table_name, target_col, self.th_values['val_range'])))
+        for df1_name, df2_name in itertools.permutations(self.input_tables.get('cross_consistency', []), 2):
+            tasks.append(('cross_consistency', df1_name + ' && ' + df2_name, '_cross_consistency',
+                          (df1_name, df2_name)))
+        for df1_name, df2_name in self.input_tables.get('time_cross_consistency', []):
+            tasks.append(('time_cross_consistency', df1_name + ' && ' + df2_name, '_time_cross_consistency',
+                          (df1_name, df2_name, self.th_values['time_cross_consistency'])))
+        return tasks
+    
+    
+    def run_task(self, check_name, input_table, method, args, track_memory=False):
+        """
+        Run one task of tasks() and measure it
+        
+        Returns
+        -------
+        tuple
+            (list of result frames, report row dict)
+        """
+        tracing = tracemalloc.is_tracing()
+        if track_memory:
+            if not tracing:
+                tracemalloc.start()
+            start_memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        
+        started = time.perf_counter()
+        results, rows_scanned = getattr(self, method)(*args)
+        wall_time = time.perf_counter() - started
+        
+        peak_memory = np.nan
+        if track_memory:
+            peak_memory = max(tracemalloc.get_traced_memory()[1] - start_memory, 0)
+            if not tracing:
+                tracemalloc.stop()
+        
+        return results, {
+            'CHECK': check_name,
+            'INPUT_TABLE': input_table,
+            'ROWS_SCANNED': rows_scanned,
+            'VIOLATIONS': sum(len(result) for result in results),
+            'WALL_TIME': wall_time,
+            'PEAK_MEMORY': peak_memory
+        }
+    
+    
+    def run(self, n_workers=None, executor='thread', track_memory=False):
+        """
+        Run all configured checks concurrently after the input tables are loaded once
+        
+        Parameters
+        ----------
+        n_workers : int
+            Number of pool workers, defaults to the number of CPUs. 1 runs the tasks serially
+        
+        executor : str
+            'thread' shares the loaded tables between workers, 'process' sends each worker
+            a copy of them once and avoids the GIL on the python parts of the checks
+        
+        track_memory : bool
+            Measure the peak traced (tracemalloc) memory of every task. Exact per task with
+            executor='process' or n_workers=1, with threads tasks running at the same time
+            share the counter
+        
+        Returns
+        -------
+        tuple
+            (data_quality_output, report), same output as check(). report has a row per task
+            with CHECK, INPUT_TABLE, ROWS_SCANNED, VIOLATIONS, WALL_TIME (seconds) and
+            PEAK_MEMORY (bytes, NaN when not tracked), the total wall time is in report.attrs
+        """
+        started = time.perf_counter()
+        self.load_tables()
+        load_time = time.perf_counter() - started
+        
+        tasks = [task + (track_memory,) for task in self.tasks()]
+        n_workers = min(n_workers or os.cpu_count() or 1, max(len(tasks), 1))
+        
+        if n_workers == 1:
+            outcomes = [self.run_task(*task) for task in tasks]
+        elif executor == 'process':
+            with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker, initargs=(self,)) as pool:
+                outcomes = list(pool.map(_run_worker_task, tasks))
+        else:
+            tracing = tracemalloc.is_tracing()
+            if track_memory and not tracing:
+                tracemalloc.start()
+            with ThreadPoolExecutor(max_workers=n_workers) as pool:
+                outcomes = list(pool.map(lambda task: self.run_task(*task), tasks))
+            if track_memory and not tracing:
+                tracemalloc.stop()
         
+        for results, _ in outcomes:
+            self.results.extend(results)
+        self.collect()
         self.format_output(self.lvl_data)
+        
+        report = pd.DataFrame([row for _, row in outcomes],
+                              columns=['CHECK', 'INPUT_TABLE', 'ROWS_SCANNED', 'VIOLATIONS', 'WALL_TIME', 'PEAK_MEMORY'])
+        report.attrs['LOAD_TIME'] = load_time
+        report.attrs['WALL_TIME'] = time.perf_counter() - started
+        
+        return self.data_quality_output, report
+    
+    
+    def _val_range_fast(self, table_name, target_col, th, limit=None, sample_frac=None, chunk_size=None):
+        """
+        val_range count of one table column,
+        returns (rows scanned, rows checked, violations, rate margin, early exit)
+        """
+        series_cols = series_columns(self.table_columns(table_name))
+        columns = [col for col in self.table_columns(table_name) if col in series_cols or col == target_col]
+        rows_scanned = rows_checked = violations = 0
+        counts = []
+        
+        for chunk in self.iter_table(table_name, columns, chunk_size):
+            rows_scanned += len(chunk)
+            violating = (chunk[target_col] < th).to_numpy()
+            if sample_frac is not None:
+                series = key_hashes(chunk, series_cols)
+                mask = sample_mask(series, sample_frac)
+                violating = violating[mask]
+                counts.append(pd.DataFrame({'SERIES': series[mask], 'CHECKED': 1, 'VIOLATIONS': violating.astype(np.int64)}))
+            rows_checked += len(violating)
+            violations += int(violating.sum())
+            if limit is not None and violations >= limit:
+                break
+        
+        margin = 0.0
+        if sample_frac is not None:
+            counts = pd.concat(counts).groupby('SERIES').sum()
+            margin = rate_margin(counts['CHECKED'], counts['VIOLATIONS'], sample_frac)
+        return rows_scanned, rows_checked, violations, margin, limit is not None and violations >= limit
+    
+    
+    def _key_set(self, table_name, cols, sample_frac=None, chunk_size=None):
+        """Sorted distinct key hashes of a table (of the sampled series), and rows scanned"""
+        keys, rows_scanned = [np.array([], dtype=np.uint64)], 0
+        for chunk in self.iter_table(table_name, cols, chunk_size):
+            rows_scanned += len(chunk)
+            if sample_frac is not None:
+                chunk = chunk[sample_mask(key_hashes(chunk, series_columns(cols)), sample_frac)]
+            keys.append(np.unique(key_hashes(chunk, cols)))
+        return np.unique(np.concatenate(keys)), rows_scanned
+    
+    
+    def _missing_keys_fast(self, df1_name, df2_name, cols, count_matched=False, limit=None, sample_frac=None, chunk_size=None):
+        """
+        Distinct cols tuples of df1 missing in df2 (plus the matched ones if count_matched),
+        df1 is streamed against the key set of df2 and stops at limit violations
+        """
+        keys2, rows_scanned = self._key_set(df2_name, cols, sample_frac, chunk_size)
+        checked = missing = np.array([], dtype=np.uint64)
+        sampled = [pd.DataFrame({'KEY': checked, 'SERIES': checked})]
+        
+        for chunk in self.iter_table(df1_name, cols, chunk_size):
+            rows_scanned += len(chunk)
+            if sample_frac is not None:
+                series = key_hashes(chunk, series_columns(cols))
+                mask = sample_mask(series, sample_frac)
+                chunk, series = chunk[mask], series[mask]
+            keys, first = np.unique(key_hashes(chunk, cols), return_index=True)
+            if sample_frac is not None:
+                sampled.append(pd.DataFrame({'KEY': keys, 'SERIES': series[first]}))
+            checked = np.union1d(checked, keys)
+            missing = np.union1d(missing, keys[~np.isin(keys, keys2, assume_unique=True)])
+            if limit is not None and (len(checked) if count_matched else len(missing)) >= limit:
+                break
+        
+        violations = len(checked) if count_matched else len(missing)
+        margin = 0.0
+        if sample_frac is not None:
+            # a key belongs to a single series, the series are the sampling clusters
+            counts = pd.concat(sampled).drop_duplicates('KEY')
+            counts['CHECKED'] = 1
+            counts['VIOLATIONS'] = 1 if count_matched else np.isin(counts['KEY'], missing).astype(np.int64)
+            counts = counts.groupby('SERIES')[['CHECKED', 'VIOLATIONS']].sum()
+            margin = rate_margin(counts['CHECKED'], counts['VIOLATIONS'], sample_frac)
+        return rows_scanned, len(checked), violations, margin, limit is not None and violations >= limit
+    
+    
+    def _cross_consistency_fast(self, df1_name, df2_name, limit=None, sample_frac=None, chunk_size=None):
+        """
+        cross_consistency count of one ordered table pair,
+        returns (rows scanned, keys checked, violations, rate margin, early exit)
+        """
+        cols2 = self.table_columns(df2_name)
+        common_cols = [col for col in self.table_columns(df1_name) if col in cols2 and 'ID' in col]
+        if common_cols == []:
+            return 0, 0, 0, np.nan, False
+        return self._missing_keys_fast(df1_name, df2_name, common_cols, False, limit, sample_frac, chunk_size)
+    
+    
+    def _time_cross_consistency_fast(self, df1_name, df2_name, th, limit=None, sample_frac=None, chunk_size=None):
+        """
+        time_cross_consistency count of one table pair,
+        returns (rows scanned, keys checked, violations, rate margin, early exit)
+        """
+        cols2 = self.table_columns(df2_name)
+        common_cols = [col for col in self.table_columns(df1_name) if col in cols2]
+        common_id_cols = [col for col in common_cols if 'ID' in col and ('PRODUCT' in col or 'LOCATION' in col)]
+        common_dt_cols = [col for col in common_cols if col.endswith('_DT')]
+        if common_dt_cols == [] or common_id_cols == []:
+            return 0, 0, 0, np.nan, False
+        # distinct keys are counted once, so every matched key is reported too when th >= 1, as in the full check
+        return self._missing_keys_fast(df1_name, df2_name, common_id_cols + common_dt_cols, th >= 1,
+                                       limit, sample_frac, chunk_size)
+    
+    
+    def check_fast(self, limits=None, sample_frac=None, chunk_size=None):
+        """
+        Pre-flight mode of the configured checks: counts violations to tell quickly whether
+        a check fails, without building the output rows. check() and run() stay the audit mode.
+        
+        Parameters
+        ----------
+        limits : int or dict
+            Stop a check after this many violations, one value for all checks or
+            check name -> limit ('val_range', 'cross_consistency', 'time_cross_consistency').
+            Remaining tables or pairs of a check that reached its limit are not checked.
+            With sample_frac the limit applies to the violations estimated for all series
+            (sampled violations / sample_frac)
+        
+        sample_frac : float
+            Check only the PRODUCT/LOCATION series of a hash sample of this fraction (sample_mask,
+            the same series in every table). The tables are still read in full, ROWS_SCANNED stays
+            the table size. VIOLATION_RATE then estimates the rate of the full check within
+            VIOLATION_RATE_MARGIN (rate_margin)
+        
+        chunk_size : int
+            Stream the tables from disk in chunks of chunk_size rows instead of loading them
+        
+        Returns
+        -------
+        pd.DataFrame
+            A row per checked table or pair: CHECK, INPUT_TABLE, ROWS_SCANNED, CHECKED (rows for val_range,
+            distinct keys for the consistency checks), VIOLATIONS, VIOLATION_RATE, VIOLATION_RATE_MARGIN,
+            EARLY_EXIT and BREACHED. BREACHED means the check reached its limit with this table or pair,
+            any violation breaches a check without a limit
+        """
+        if not isinstance(limits, dict):
+            limits = {check_name: limits for check_name in ['val_range', 'cross_consistency', 'time_cross_consistency']}
+        
+        totals = {}
+        rows = []
+        for check_name, input_table, method, args in self.tasks():
+            limit = limits.get(check_name)
+            if limit is not None:
+                # in sampled violations
+                if sample_frac is not None:
+                    limit = int(np.ceil(limit * sample_frac))
+                if totals.get(check_name, 0) >= limit:
+                    continue
+                limit -= totals.get(check_name, 0)
+            
+            rows_scanned, checked, violations, margin, early_exit = getattr(self, method + '_fast')(
+                *args, limit=limit, sample_frac=sample_frac, chunk_size=chunk_size
+            )
+            totals[check_name] = totals.get(check_name, 0) + violations
+            rows.append({
+                'CHECK': check_name,
+                'INPUT_TABLE': input_table,
+                'ROWS_SCANNED': rows_scanned,
+                'CHECKED': checked,
+                'VIOLATIONS': violations,
+                'VIOLATION_RATE': violations / checked if checked else np.nan,
+                'VIOLATION_RATE_MARGIN': margin,
+                'EARLY_EXIT': early_exit,
+                'BREACHED': violations >= limit if limit is not None else violations > 0
+            })
+        
+        return pd.DataFrame(rows, columns=['CHECK', 'INPUT_TABLE', 'ROWS_SCANNED', 'CHECKED', 'VIOLATIONS', 'VIOLATION_RATE',
+                                           'VIOLATION_RATE_MARGIN', 'EARLY_EXIT', 'BREACHED'])
@@ -1,6 +1,8 @@
 import numpy as np, pandas as pd
 from datetime import date
 import datetime
+from intervals import interval_union
+from hierarchy import HierarchyIndex, semi_join
 
 FORECAST_FLAG = None
 
@@ -77,39 +79,53 @@ def generate_input_unfolding(size):
 
 
 
-def unfold_aggregated_data(mpInTable, mpInProduct, mpInLocation, mpInCustomer,mpInDistrChannel, mpInQuadruple = None):
+def unfold_aggregated_data(mpInTable, mpInProduct, mpInLocation, mpInCustomer,mpInDistrChannel, mpInQuadruple = None, columns = None):
   """
   Utility to unfold aggregated data to lower level of organizational hierarchy (3)
 
+  Every hierarchy is a HierarchyIndex (build it once with HierarchyIndex.from_dps and reuse it)
+  or a table with a <dimension>_lvl_id column, indexed on the fly. Rows are repeated for
+  the members under their *_lvl_id with a CSR gather instead of merges.
+
   Parameters
   ----------
   mpInTable : pd.DataFrame
     Input Table that must be unfold
 
-  mpInProduct : pd.DataFrame
+  mpInProduct : pd.DataFrame or HierarchyIndex
     Product Hierarchy
 
-  mpInLocation : pd.DataFrame
+  mpInLocation : pd.DataFrame or HierarchyIndex
     Location Hierarchy
 
-  mpInCustomer : pd.DataFrame
+  mpInCustomer : pd.DataFrame or HierarchyIndex
     Customer Hierarchy
 
-  mpInDistrChannel : pd.DataFrame
+  mpInDistrChannel : pd.DataFrame or HierarchyIndex
     Distribution channel Hierarchy
 
+  mpInQuadruple : pd.DataFrame
+    Quadruples to keep (product_id, location_id, customer_id, distr_channel_id), semi-joined by key hash
+
+  columns : dict
+    *_lvl_id column -> hierarchy columns to carry, all of them by default
+
   Returns
   -------
   pd.DataFrame
     Returns unfolded table
   """
 
-  table = mpInTable.merge(mpInProduct, on=["product_lvl_id"], how="left")
-  table = table.merge(mpInLocation, on=["location_lvl_id"], how="left")
-  table = table.merge(mpInCustomer, on=["customer_lvl_id"], how="left")
-  table = table.merge(mpInDistrChannel, on=["distr_channel_lvl_id"], how="left")
-  if mpInQuadruple is not None:  
-    table = table.merge(mpInQuadruple, on=['product_id', 'location_id', 'customer_id', 'distr_channel_id'], how = 'inner')
+  columns = columns or {}
+  table = mpInTable
+  for lvl_col, hierarchy in [("product_lvl_id", mpInProduct), ("location_lvl_id", mpInLocation),
+                             ("customer_lvl_id", mpInCustomer), ("distr_channel_lvl_id", mpInDistrChannel)]:
+    if not isinstance(hierarchy, HierarchyIndex):
+      hierarchy = HierarchyIndex(hierarchy, [lvl_col])
+    table = hierarchy.unfold(table, lvl_col, columns.get(lvl_col))
+
+  if mpInQuadruple is not None:
+    table = semi_join(table, mpInQuadruple, ['product_id', 'location_id', 'customer_id', 'distr_channel_id']).reset_index(drop=True)
 
   return table
 
@@ -206,44 +222,33 @@ def generate_input_ilp(start_date, end_date):
 
 def time_interval_utility(table, granuality, distance_tolerance,groupby):
   """
-	Technical utility for time-intervals union
+  Technical utility for time-intervals union
 
-	Parameters
-  	----------
-  	Sales : pd.DataFrame
-    	Input table to transform 
+  Overlapping and adjacent [start_dt, end_dt] intervals of every group are merged
+  in one vectorized pass (see intervals.interval_union)
 
-    granuality : str 
-    	Granuality to put dates in accordance with
+  Parameters
+  ----------
+  table : pd.DataFrame
+    Input table to transform, with start_dt and end_dt columns
 
-    groubpy : str 
-    	Column to group by
+  granuality : str
+    Granuality to put dates in accordance with (pandas period alias like 'D', 'W', 'M'),
+    None keeps the dates as they are
 
-   	Returns
-   	----------
-   	list
-   		transformed dates list
-	"""
-  
-  dates = []
+  distance_tolerance : int
+    Gap in days still merged between two intervals of a group
+
+  groupby : str or list
+    Column(s) to group by
+
+  Returns
+  ----------
+  pd.DataFrame
+    groupby columns, start_dt and end_dt of the merged intervals
+  """
   
-  for i in range(len(table.groupby(groupby))):
-      if len(list(table.groupby(groupby))[i][1]):
-          dates.append(table.groupby(groupby))[i][1]
-      else: 
-    	    grouped_by = list(table.groupby(groupby))
-    	    for j in range(1,len(list(table.groupby(groupby))[i][1])-1):
-      	      left_bound = grouped_by[j][1].start_dt
-      	      right_bound = grouped_by[j][1].end_dt
-      	      next_left_bound = grouped_by[j+1][1].start_dt
-      	      next_right_bound = grouped_by[j+1][1].end_dt
-
-      	      if (left_bound < next_right_bound and next_left_bound > next_left_bound \
-                 and right_bound > next_right_bound):
-                  grouped_by[j+1][1].end_dt = right_bound
-			
-      dates.append((right_bound,left_bound))
-      return dates
+  return interval_union(table, groupby, 'start_dt', 'end_dt', granuality, distance_tolerance)
 
 
 def incremental_load_preparation(SALES, STOCK, SELL_IN, SELL_OUT, ASSORT_MATRIX, LOCATION_LIFE, start_date, end_date, PRODUCT_LIFE = None, CUSTOMER_LIFE = None):
@@ -0,0 +1,166 @@
+import re
+import numpy as np
+import pandas as pd
+from dps_schema import load_table
+
+
+DIMENSIONS = {
+    'PRODUCT': 'DPS_PRODUCT',
+    'LOCATION': 'DPS_LOCATION',
+    'CUSTOMER': 'DPS_CUSTOMER',
+    'DISTR_CHANNEL': 'DPS_DISTR_CHANNEL'
+}
+
+
+def _id_values(values):
+    """ids as float64 with NaN for missing, so Int32/int64/float id columns compare equal"""
+    return pd.Series(values).to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+class HierarchyIndex:
+    """
+    Members of a dimension hierarchy (one row per member, e.g. DPS_PRODUCT) indexed by
+    the id of every level: for each level the sorted node ids and a CSR pointer into
+    the member rows under each node.
+
+    Built once per dimension and reused by every stage that maps *_lvl_id to members.
+    """
+    def __init__(self, members, lvl_cols):
+        """
+        Parameters
+        ----------
+        members : pd.DataFrame
+            One row per member with the ids of its ancestors
+        lvl_cols : list
+            Id columns an aggregated id can be unfolded from, top level first
+            (the member id column itself can be the last one)
+        """
+        self.members = members.reset_index(drop=True)
+        self.lvl_cols = list(lvl_cols)
+        self.node_ids = []
+        self.indptr = []
+
+        member_rows = []
+        offset = 0
+        for col in self.lvl_cols:
+            ids = _id_values(self.members[col])
+            rows = np.flatnonzero(~np.isnan(ids))
+            # stable, so the members of a node keep the table order like in a merge
+            rows = rows[np.argsort(ids[rows], kind='stable')]
+            node_ids, starts = np.unique(ids[rows], return_index=True)
+            self.node_ids.append(node_ids)
+            self.indptr.append(np.append(starts, len(rows)) + offset)
+            member_rows.append(rows)
+            offset += len(rows)
+        self.member_rows = np.concatenate(member_rows) if member_rows else np.array([], dtype=np.int64)
+
+
+    @classmethod
+    def from_dps(cls, dimension, data_path=None, members=None):
+        """
+        Index of a DPS hierarchy table: PRODUCT, LOCATION, CUSTOMER or DISTR_CHANNEL
+
+        members is the loaded table, otherwise it is read with dps_schema.load_table
+        """
+        if members is None:
+            members = load_table(DIMENSIONS[dimension], data_path)
+        pattern = re.compile(f'{dimension}_LVL_ID(\\d+)$')
+        lvl_cols = sorted((col for col in members.columns if pattern.match(col)),
+                          key=lambda col: int(pattern.match(col).group(1)))
+        return cls(members, lvl_cols + [f'{dimension}_ID'])
+
+
+    def gather(self, ids):
+        """
+        Member rows under every id, each id is looked up from the top level down
+
+        Parameters
+        ----------
+        ids : array-like
+            Ids of any level
+
+        Returns
+        -------
+        np.ndarray
+            Positions in ids, repeated once per member
+        np.ndarray
+            Member row positions, -1 for an unknown id (kept once, like a left join)
+        """
+        ids = _id_values(ids)
+        start = np.zeros(len(ids), dtype=np.int64)
+        count = np.zeros(len(ids), dtype=np.int64)
+        resolved = np.zeros(len(ids), dtype=bool)
+
+        for node_ids, indptr in zip(self.node_ids, self.indptr):
+            if len(node_ids) == 0:
+                continue
+            pos = np.minimum(np.searchsorted(node_ids, ids), len(node_ids) - 1)
+            found = ~resolved & (node_ids[pos] == ids)
+            start[found] = indptr[pos[found]]
+            count[found] = indptr[pos[found] + 1] - indptr[pos[found]]
+            resolved |= found
+
+        count[~resolved] = 1
+        rows = np.repeat(np.arange(len(ids), dtype=np.int64), count)
+        offsets = np.arange(len(rows), dtype=np.int64) - np.repeat(np.cumsum(count) - count, count)
+        member_rows = np.full(len(rows), -1, dtype=np.int64)
+        hit = np.repeat(resolved, count)
+        member_rows[hit] = self.member_rows[np.repeat(start, count)[hit] + offsets[hit]]
+        return rows, member_rows
+
+
+    def unfold(self, table, lvl_col, columns=None):
+        """
+        Rows of table repeated for every member under table[lvl_col], with the member columns
+
+        Parameters
+        ----------
+        table : pd.DataFrame
+            Aggregated table
+        lvl_col : str
+            Column with the aggregated ids
+        columns : list
+            Member columns to add, by default all of them except lvl_col.
+            Names already in table get _x/_y suffixes as in pd.merge
+
+        Returns
+        -------
+        pd.DataFrame
+            Unfolded table, rows of an unknown id are kept once with missing member columns
+        """
+        if columns is None:
+            columns = [col for col in self.members.columns if col != lvl_col]
+        rows, member_rows = self.gather(table[lvl_col])
+
+        clashes = [col for col in columns if col in table.columns]
+        result = table.iloc[rows].reset_index(drop=True).rename(columns={col: col + '_x' for col in clashes})
+        # member rows -1 are not in the RangeIndex and come out missing
+        added = self.members[columns].reindex(member_rows).reset_index(drop=True)
+        added = added.rename(columns={col: col + '_y' for col in clashes})
+        return pd.concat([result, added], axis=1)
+
+
+def key_hashes(df, cols):
+    """
+    64-bit hash of every key tuple of df[cols]
+
+    Numeric keys are hashed as float64 so that equal values match across tables
+    with different integer/float/nullable dtypes, like in a merge
+    """
+    keys = {}
+    for col in cols:
+        if pd.api.types.is_numeric_dtype(df[col]) or pd.api.types.is_bool_dtype(df[col]):
+            keys[col] = _id_values(df[col])
+        else:
+            keys[col] = df[col]
+    return pd.util.hash_pandas_object(pd.DataFrame(keys, index=df.index), index=False).to_numpy()
+
+
+def semi_join(table, keys_table, keys):
+    """
+    Rows of table whose keys tuple appears in keys_table, matched by 64-bit key hashes
+
+    Unlike an inner merge no columns are added and rows are not repeated
+    for duplicate keys in keys_table
+    """
+    return table[np.isin(key_hashes(table, keys), key_hashes(keys_table, keys))]
@@ -1,16 +1,150 @@
 import pandas as pd
 import numpy as np
+from storage import read_input, write_table
 
 
 IB_ZERO_DEMAND_THRESHOLD = 0.01
 
 
+# Ordered routing table: the first rule whose conditions all hold decides the row.
+# A condition is (column, op, value); string comparisons are case-insensitive and
+# TS_FORECAST_VALUE / ML_FORECAST_VALUE refer to the mutually filled forecasts.
+# A string value in a numeric comparison names a threshold parameter of hybridization().
+# weights give the NaN-aware weighted mean written to HYBRID_FORECAST_VALUE,
+# ensemble=True additionally fills ENSEMBLE_FORECAST_VALUE with the plain ts/ml mean.
+HYBRIDIZATION_RULES = [
+    {
+        'conditions': [('DEMAND_TYPE', '==', 'promo'), ('SEGMENT_NAME', '!=', 'retired')],
+        'source': 'ml',
+        'weights': {'ml': 1.0}
+    },
+    {
+        'conditions': [('SEGMENT_NAME', '==', 'short')],
+        'source': 'ml',
+        'weights': {'ml': 1.0}
+    },
+    {
+        'conditions': [('ASSORTMENT_TYPE', '==', 'new')],
+        'source': 'ml',
+        'weights': {'ml': 1.0}
+    },
+    {
+        'conditions': [('SEGMENT_NAME', 'in', ['retired', 'low volume']),
+                       ('TS_FORECAST_VALUE', '<=', 'ib_zero_demand_threshold')],
+        'source': 'ts',
+        'weights': {'ts': 1.0}
+    },
+    {
+        'conditions': [('TS_FORECAST_VALUE', '<=', 'ib_zero_demand_threshold')],
+        'source': 'ensemble',
+        'weights': {'ts': 1.0},
+        'ensemble': True
+    },
+    {
+        'conditions': [],
+        'source': 'ensemble',
+        'weights': {'ts': 0.5, 'ml': 0.5},
+        'ensemble': True
+    }
+]
+
+_NUMERIC_OPS = {
+    '<': np.less,
+    '<=': np.less_equal,
+    '>': np.greater,
+    '>=': np.greater_equal
+}
+
+
+def _lower_labels(column):
+    codes, uniques = pd.factorize(column)
+    labels = np.array([str(u).lower() for u in uniques] + [''], dtype=object)
+    return codes, labels
+
+
+def _nan_mean(a, b):
+    both = ~np.isnan(a) & ~np.isnan(b)
+    return np.where(both, (a + b) / 2, np.where(np.isnan(a), b, a))
+
+
+def _weighted_mean(ts_value, ml_value, ts_weight, ml_weight):
+    ts_valid = ~np.isnan(ts_value)
+    ml_valid = ~np.isnan(ml_value)
+    total = np.where(ts_valid, ts_weight, 0.0) + np.where(ml_valid, ml_weight, 0.0)
+    weighted = ts_weight * np.where(ts_valid, ts_value, 0.0) + ml_weight * np.where(ml_valid, ml_value, 0.0)
+    return np.divide(weighted, total, out=np.full(len(total), np.nan), where=total > 0)
+
+
+def compile_rules(df, rules, values, thresholds):
+    """
+    Evaluate a hybridization rule table into per-row routing arrays
+    
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Reconciled forecast
+    rules : list of dict
+        Ordered rule table (see HYBRIDIZATION_RULES)
+    values : dict
+        Numeric arrays available to conditions by name (the filled ts/ml forecasts)
+    thresholds : dict
+        Threshold parameters referenced by name in numeric conditions
+    
+    Returns
+    -------
+    np.ndarray
+        Index of the first matching rule per row (-1 if none matches)
+    """
+    label_cache = {}
+    
+    def categorical_mask(column, op, value):
+        if column not in label_cache:
+            label_cache[column] = _lower_labels(df[column])
+        codes, labels = label_cache[column]
+        targets = value if op in ('in', 'not in') else [value]
+        targets = [str(t).lower() for t in targets]
+        label_mask = np.isin(labels, targets)
+        if op in ('!=', 'not in'):
+            label_mask = ~label_mask
+        return label_mask[codes]
+    
+    def numeric_mask(column, op, value):
+        column_values = values[column] if column in values else df[column].to_numpy(dtype=np.float64)
+        if isinstance(value, str):
+            value = thresholds[value]
+        return _NUMERIC_OPS[op](column_values, value)
+    
+    masks = []
+    for rule in rules:
+        mask = np.ones(len(df), dtype=bool)
+        for column, op, value in rule['conditions']:
+            if op in _NUMERIC_OPS:
+                mask &= numeric_mask(column, op, value)
+            elif op in ('==', '!=', 'in', 'not in'):
+                mask &= categorical_mask(column, op, value)
+            else:
+                raise ValueError(f'unknown operator {op} in hybridization rule')
+        masks.append(mask)
+    
+    return np.select(masks, np.arange(len(rules)), -1) if rules else np.full(len(df), -1)
+
+
 def hybridization(
     reconciled_forecast: pd.DataFrame,
-    ib_zero_demand_threshold: float = IB_ZERO_DEMAND_THRESHOLD
+    ib_zero_demand_threshold: float = IB_ZERO_DEMAND_THRESHOLD,
+    rules: list = None,
+    output_path: str = None
 ) -> pd.DataFrame:
+    """
+    Hybrid forecast of the reconciled forecast routed by rules
+
+    reconciled_forecast can also be the path of a dataset written by storage.write_table
+    (e.g. output_path of reconciliation), output_path writes the result as such a dataset
+    """
+    if rules is None:
+        rules = HYBRIDIZATION_RULES
     
-    df = reconciled_forecast.copy()
+    df = read_input(reconciled_forecast).copy()
     
     if 'TS_FORECAST_VALUE_REC' in df.columns and 'ML_FORECAST_VALUE' in df.columns:
         df['TS_FORECAST_VALUE_F'] = df['TS_FORECAST_VALUE_REC'].fillna(df['ML_FORECAST_VALUE'])
@@ -35,59 +169,24 @@ def hybridization(
     if 'ASSORTMENT_TYPE' not in df.columns:
         df['ASSORTMENT_TYPE'] = np.nan
     
-    df['DEMAND_TYPE_LOWER'] = df['DEMAND_TYPE'].fillna('').astype(str).str.lower()
-    df['SEGMENT_NAME_LOWER'] = df['SEGMENT_NAME'].fillna('').astype(str).str.lower()
-    df['ASSORTMENT_TYPE_LOWER'] = df['ASSORTMENT_TYPE'].fillna('').astype(str).str.lower()
-    
-    def calculate_hybrid_forecast(row):
-        if ((row['DEMAND_TYPE_LOWER'] == 'promo' and row['SEGMENT_NAME_LOWER'] != 'retired') or
-            row['SEGMENT_NAME_LOWER'] == 'short' or
-            row['ASSORTMENT_TYPE_LOWER'] == 'new'):
-            return row['ML_FORECAST_VALUE_F']
-        elif ((row['SEGMENT_NAME_LOWER'] == 'retired' or row['SEGMENT_NAME_LOWER'] == 'low volume') and
-              row['TS_FORECAST_VALUE_F'] <= ib_zero_demand_threshold):
-            return row['TS_FORECAST_VALUE_F']
-        else:
-            if pd.notna(row['TS_FORECAST_VALUE_F']) and row['TS_FORECAST_VALUE_F'] <= ib_zero_demand_threshold:
-                return row['TS_FORECAST_VALUE_F']
-            else:
-                values = [row['TS_FORECAST_VALUE_F'], row['ML_FORECAST_VALUE_F']]
-                valid_values = [v for v in values if pd.notna(v)]
-                if len(valid_values) > 0:
-                    return np.mean(valid_values)
-                else:
-                    return np.nan
-    
-    def calculate_forecast_source(row):
-        if ((row['DEMAND_TYPE_LOWER'] == 'promo' and row['SEGMENT_NAME_LOWER'] != 'retired') or
-            row['SEGMENT_NAME_LOWER'] == 'short' or
-            row['ASSORTMENT_TYPE_LOWER'] == 'new'):
-            return 'ml'
-        elif ((row['SEGMENT_NAME_LOWER'] == 'retired' or row['SEGMENT_NAME_LOWER'] == 'low volume') and
-              row['TS_FORECAST_VALUE_F'] <= ib_zero_demand_threshold):
-            return 'ts'
-        else:
-            return 'ensemble'
-    
-    def calculate_ensemble_value(row):
-        if ((row['DEMAND_TYPE_LOWER'] == 'promo' and row['SEGMENT_NAME_LOWER'] != 'retired') or
-            row['SEGMENT_NAME_LOWER'] == 'short' or
-            row['ASSORTMENT_TYPE_LOWER'] == 'new'):
-            return np.nan
-        elif ((row['SEGMENT_NAME_LOWER'] == 'retired' or row['SEGMENT_NAME_LOWER'] == 'low volume') and
-              row['TS_FORECAST_VALUE_F'] <= ib_zero_demand_threshold):
-            return np.nan
-        else:
-            values = [row['TS_FORECAST_VALUE_F'], row['ML_FORECAST_VALUE_F']]
-            valid_values = [v for v in values if pd.notna(v)]
-            if len(valid_values) > 0:
-                return np.mean(valid_values)
-            else:
-                return np.nan
+    ts_value = df['TS_FORECAST_VALUE_F'].to_numpy(dtype=np.float64)
+    ml_value = df['ML_FORECAST_VALUE_F'].to_numpy(dtype=np.float64)
+    
+    rule_idx = compile_rules(
+        df, rules,
+        values={'TS_FORECAST_VALUE': ts_value, 'ML_FORECAST_VALUE': ml_value},
+        thresholds={'ib_zero_demand_threshold': ib_zero_demand_threshold}
+    )
     
-    df['HYBRID_FORECAST_VALUE'] = df.apply(calculate_hybrid_forecast, axis=1)
-    df['FORECAST_SOURCE'] = df.apply(calculate_forecast_source, axis=1)
-    df['ENSEMBLE_FORECAST_VALUE'] = df.apply(calculate_ensemble_value, axis=1)
+    # one extra slot at the end serves rows that no rule matched
+    ts_weight = np.array([rule['weights'].get('ts', 0.0) for rule in rules] + [0.0])[rule_idx]
+    ml_weight = np.array([rule['weights'].get('ml', 0.0) for rule in rules] + [0.0])[rule_idx]
+    source = np.array([rule['source'] for rule in rules] + [None], dtype=object)[rule_idx]
+    ensemble = np.array([rule.get('ensemble', False) for rule in rules] + [False])[rule_idx]
+    
+    df['HYBRID_FORECAST_VALUE'] = _weighted_mean(ts_value, ml_value, ts_weight, ml_weight)
+    df['FORECAST_SOURCE'] = source
+    df['ENSEMBLE_FORECAST_VALUE'] = np.where(ensemble, _nan_mean(ts_value, ml_value), np.nan)
     
     if 'TS_FORECAST_VALUE_REC' in df.columns:
         df['TS_FORECAST_VALUE'] = df['TS_FORECAST_VALUE_REC']
@@ -95,8 +194,10 @@ def hybridization(
     if 'ML_FORECAST_VALUE' not in df.columns:
         df['ML_FORECAST_VALUE'] = np.nan
     
-    df = df.drop(columns=['DEMAND_TYPE_LOWER', 'SEGMENT_NAME_LOWER', 'ASSORTMENT_TYPE_LOWER',
-                          'TS_FORECAST_VALUE_F', 'ML_FORECAST_VALUE_F'], errors='ignore')
+    df = df.drop(columns=['TS_FORECAST_VALUE_F', 'ML_FORECAST_VALUE_F'], errors='ignore')
+    
+    if output_path is not None:
+        write_table(df, output_path)
     
     return df
 
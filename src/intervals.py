@@ -0,0 +1,215 @@
+import numpy as np
+import pandas as pd
+from time_levels import as_datetime
+
+
+def _to_ns(values):
+    return as_datetime(values).to_numpy().astype('datetime64[ns]')
+
+
+def _key_codes(left, right, keys):
+    """
+    Encode key tuples of both tables into one shared integer code space.
+    Rows with a missing key get code -1 (they never match, as in an equi-join on NaN).
+    """
+    both = pd.concat([left[keys], right[keys]], ignore_index=True)
+    codes = both.groupby(keys, sort=False, dropna=True).ngroup()
+    codes = codes.fillna(-1).to_numpy(dtype=np.int64)
+    return codes[:len(left)], codes[len(left):]
+
+
+def overlap_pairs(left, right, keys, start='PERIOD_DT', end='PERIOD_END_DT'):
+    """
+    Keyed interval-overlap join.
+
+    Finds every pair of rows (i, j) with equal key columns and overlapping
+    closed intervals, i.e. left[start] <= right[end] and left[end] >= right[start].
+    Right intervals are sorted once per key and located with searchsorted, so memory
+    scales with the number of overlapping pairs rather than len(left) * len(right).
+
+    Parameters
+    ----------
+    left : pd.DataFrame
+        Left table
+    right : pd.DataFrame
+        Right table
+    keys : list
+        Key columns present in both tables
+    start : str
+        Interval start column (inclusive)
+    end : str
+        Interval end column (inclusive)
+
+    Returns
+    -------
+    np.ndarray
+        Positional row indices into left
+    np.ndarray
+        Positional row indices into right
+
+    Pairs are ordered by left row, then right row, like a filtered cross join.
+    """
+    lc, rc = _key_codes(left, right, keys)
+    ls, le = _to_ns(left[start]), _to_ns(left[end])
+    rs, re = _to_ns(right[start]), _to_ns(right[end])
+
+    left_valid = (lc >= 0) & ~np.isnat(ls) & ~np.isnat(le)
+    right_valid = np.flatnonzero((rc >= 0) & ~np.isnat(rs) & ~np.isnat(re))
+
+    empty = np.array([], dtype=np.int64)
+    if not left_valid.any() or len(right_valid) == 0:
+        return empty, empty
+
+    # dates are replaced by their rank so that (key code, date) packs into one int64
+    ls, le = ls.view(np.int64), le.view(np.int64)
+    rs, re = rs.view(np.int64)[right_valid], re.view(np.int64)[right_valid]
+    rc = rc[right_valid]
+    calendar = np.unique(np.concatenate([ls[left_valid], le[left_valid], rs, re]))
+    width = len(calendar) + 1
+
+    order = np.lexsort((rs, rc))
+    rc, rs, re = rc[order], rs[order], re[order]
+    start_key = rc * width + np.searchsorted(calendar, rs)
+    # running max of interval ends within a key; it stays sorted because the key code dominates
+    end_key = np.maximum.accumulate(rc * width + np.searchsorted(calendar, re))
+
+    lo = np.searchsorted(end_key, lc * width + np.searchsorted(calendar, ls), side='left')
+    hi = np.searchsorted(start_key, lc * width + np.searchsorted(calendar, le), side='right')
+    counts = np.where(left_valid, np.maximum(hi - lo, 0), 0)
+
+    left_idx = np.repeat(np.arange(len(left), dtype=np.int64), counts)
+    offsets = np.arange(len(left_idx), dtype=np.int64) - np.repeat(np.cumsum(counts) - counts, counts)
+    right_pos = np.repeat(lo, counts) + offsets
+
+    # with overlapping right intervals the cummax bound can admit intervals ending too early
+    hit = re[right_pos] >= ls[left_idx]
+    left_idx, right_pos = left_idx[hit], right_pos[hit]
+    right_idx = right_valid[order[right_pos]]
+
+    pair_order = np.lexsort((right_idx, left_idx))
+    return left_idx[pair_order], right_idx[pair_order]
+
+
+def interval_union(df, keys, start='start_dt', end='end_dt', granularity=None, distance_tolerance=0):
+    """
+    Union of closed day intervals within every key, in one pass over all keys.
+
+    Intervals are sorted by (key, start); a running max of the ends marks where a new
+    island starts: an interval whose start is after the running end of its key plus one
+    day (adjacent days are merged) plus distance_tolerance days.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Intervals, e.g. assortment, location life or promo periods
+    keys : list or str
+        Key columns, intervals are merged only within equal keys
+    start : str
+        Interval start column (inclusive)
+    end : str
+        Interval end column (inclusive)
+    granularity : str
+        Pandas period alias ('D', 'W', 'W-SUN', 'M', ...) the intervals are widened to
+        before merging: start to its period start, end to its period last day
+    distance_tolerance : int or pd.Timedelta
+        Gap (days if int) still bridged between two intervals of a key
+
+    Returns
+    -------
+    pd.DataFrame
+        keys, start and end of the merged intervals, ordered by keys and start.
+        Rows with a missing key, start or end are dropped.
+    """
+    keys = [keys] if isinstance(keys, str) else list(keys)
+    starts, ends = as_datetime(df[start]), as_datetime(df[end])
+    start_dtype, end_dtype = starts.dtype, ends.dtype
+    if granularity is not None:
+        starts = starts.dt.to_period(granularity).dt.start_time
+        ends = ends.dt.to_period(granularity).dt.end_time.dt.normalize()
+    starts, ends = _to_ns(starts), _to_ns(ends)
+
+    codes = df.groupby(keys, sort=True, dropna=True).ngroup().fillna(-1).to_numpy(dtype=np.int64)
+    valid = np.flatnonzero((codes >= 0) & ~np.isnat(starts) & ~np.isnat(ends))
+    codes, starts, ends = codes[valid], starts[valid].view(np.int64), ends[valid].view(np.int64)
+
+    order = np.lexsort((starts, codes))
+    codes, starts, ends = codes[order], starts[order], ends[order]
+
+    # dates are replaced by their rank so that (key code, end) packs into one int64
+    # and a single running max works across keys
+    calendar = np.unique(np.concatenate([starts, ends]))
+    width = len(calendar) + 1
+    running_end = calendar[np.maximum.accumulate(codes * width + np.searchsorted(calendar, ends)) % width]
+
+    bridge = (pd.Timedelta(days=1) + pd.to_timedelta(distance_tolerance, unit='D')).value
+    new_island = np.ones(len(codes), dtype=bool)
+    new_island[1:] = (codes[1:] != codes[:-1]) | (starts[1:] > running_end[:-1] + bridge)
+
+    first = np.flatnonzero(new_island)
+    last = np.append(first[1:] - 1, len(codes) - 1).astype(np.int64)
+
+    result = df.iloc[valid[order[first]]][keys].reset_index(drop=True)
+    result[start] = starts[first].astype('datetime64[ns]').astype(start_dtype)
+    result[end] = running_end[last].astype('datetime64[ns]').astype(end_dtype)
+    return result
+
+
+def interval_lookup(left, right, keys, at='PERIOD_DT', start='PERIOD_START_DT', end='PERIOD_END_DT'):
+    """
+    Keyed point-in-interval lookup.
+
+    For every row of left finds the row of right with equal key columns and
+    right[start] <= left[at] <= right[end]. Right intervals are sorted once by
+    (key, start) and every date is located with a single searchsorted.
+
+    Parameters
+    ----------
+    left : pd.DataFrame
+        Table with the dates to attribute
+    right : pd.DataFrame
+        Intervals, e.g. promo windows
+    keys : list
+        Key columns present in both tables
+    at : str
+        Date column of left
+    start : str
+        Interval start column of right (inclusive)
+    end : str
+        Interval end column of right (inclusive)
+
+    Returns
+    -------
+    np.ndarray
+        Positional row index into right for every row of left, -1 where no interval covers the date.
+        When several intervals of a key cover a date, the one ending last is taken.
+    """
+    lc, rc = _key_codes(left, right, keys)
+    at_ns = _to_ns(left[at])
+    rs, re = _to_ns(right[start]), _to_ns(right[end])
+
+    found = np.full(len(left), -1, dtype=np.int64)
+    left_valid = (lc >= 0) & ~np.isnat(at_ns)
+    right_valid = np.flatnonzero((rc >= 0) & ~np.isnat(rs) & ~np.isnat(re))
+    if not left_valid.any() or len(right_valid) == 0:
+        return found
+
+    at_ns = at_ns.view(np.int64)
+    rs, re = rs.view(np.int64)[right_valid], re.view(np.int64)[right_valid]
+    rc = rc[right_valid]
+    calendar = np.unique(np.concatenate([at_ns[left_valid], rs, re]))
+    width = len(calendar) + 1
+
+    order = np.lexsort((rs, rc))
+    rc, rs, re = rc[order], rs[order], re[order]
+    start_key = rc * width + np.searchsorted(calendar, rs)
+    end_key = rc * width + np.searchsorted(calendar, re)
+    # latest ending interval among those started so far within a key
+    running_end = np.maximum.accumulate(end_key)
+    running_last = np.maximum.accumulate(np.where(end_key == running_end, np.arange(len(end_key)), 0))
+
+    pos = np.searchsorted(start_key, lc * width + np.searchsorted(calendar, at_ns), side='right') - 1
+    pos_valid = np.maximum(pos, 0)
+    best = running_last[pos_valid]
+    hit = left_valid & (pos >= 0) & (rc[best] == lc) & (re[best] >= at_ns)
+    found[hit] = right_valid[order[best[hit]]]
+    return found
@@ -1,48 +1,131 @@
+import os
 import pandas as pd
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
+from intervals import overlap_pairs
+from hierarchy import key_hashes
+from time_levels import period_days, period_end_dt
+from storage import read_input, write_table
+
+
+LVL_ID_COLS = ['product_lvl_id', 'location_lvl_id', 'customer_lvl_id', 'distr_channel_lvl_id']
 
 
 def number_days(time_lvl, period_dt):
-    if time_lvl.lower() == 'day':
-        return 1
-    elif time_lvl.lower().startswith('week'):
-        return 7
-    elif time_lvl.lower() == 'month':
-        next_month = period_dt.replace(day=28) + timedelta(days=4)
-        return (next_month.replace(day=1) - period_dt.replace(day=1)).days
-    return 1
+    return int(period_days(time_lvl, [period_dt])[0])
+
+
+def prorate(values, covered_days, period_days):
+    """
+    Scale values by covered_days / period_days where the value is known and period_days > 0,
+    other values are returned unchanged
+    """
+    values = np.asarray(values, dtype=np.float64)
+    covered_days = np.asarray(covered_days, dtype=np.float64)
+    period_days = np.asarray(period_days, dtype=np.float64)
+    return np.divide(values * covered_days, period_days, out=values.copy(),
+                     where=~np.isnan(values) & (period_days > 0))
+
+
+def reconciliation_ratio(ml_total, ts_total):
+    """
+    ml_total / ts_total where ts_total > 0, 1.0 there if ml_total is missing, 0.0 elsewhere
+    """
+    ml_total = np.asarray(ml_total, dtype=np.float64)
+    ts_total = np.asarray(ts_total, dtype=np.float64)
+    positive = ts_total > 0
+    ratio = np.where(positive, 1.0, 0.0)
+    return np.divide(ml_total, ts_total, out=ratio, where=positive & ~np.isnan(ml_total))
+
+
+def reconciliation_totals_ratio(df_t1):
+    """
+    Reconciliation ratio of every row of a table that is unique on the reconciliation keys.
+    Equivalent to summing ML_FORECAST_VALUE and TS_FORECAST_VALUE per key (missing values sum to 0)
+    and taking reconciliation_ratio() of the totals.
+    """
+    return reconciliation_ratio(df_t1['ML_FORECAST_VALUE'].fillna(0), df_t1['TS_FORECAST_VALUE'].fillna(0))
+
+
+def _covered_days(df):
+    return (df['PERIOD_END_DT'] - df['PERIOD_DT']).dt.days + 1
+
+
+def _lvl_id_columns(df):
+    return {col if col in df.columns else col.upper(): col for col in LVL_ID_COLS}
+
+
+def _read_forecasts(ts_forecast, ml_forecast, ts_segments, ib_hist_end_dt):
+    """
+    Inputs given as DataFrames or storage dataset paths, from a path only periods
+    from ib_hist_end_dt on are read (earlier ones are not reconciled)
+    """
+    return (read_input(ts_forecast, start=ib_hist_end_dt), read_input(ml_forecast, start=ib_hist_end_dt),
+            read_input(ts_segments))
+
+
+def _write_reconciled(df, output_path):
+    if output_path is not None:
+        write_table(df, output_path)
+    return df
+
+
+def _reconciliation_params(config):
+    """
+    Parameters of reconciliation() from config with their defaults,
+    parallel_reconciliation() reads them here too so both entry points agree
+    """
+    if config is None:
+        config = {}
+    
+    return {
+        'ib_hist_end_dt': config.get('IB_HIST_END_DT', datetime.now()),
+        'ib_fc_horiz': config.get('IB_FC_HORIZ', 90),
+        
+        'ts_product_lvl': config.get('ts_product_lvl', 7),
+        'ts_location_lvl': config.get('ts_location_lvl', 1),
+        'ts_customer_lvl': config.get('ts_customer_lvl', 5),
+        'ts_distr_channel_lvl': config.get('ts_distr_channel_lvl', 1),
+        'ts_time_lvl': config.get('ts_time_lvl', 'MONTH'),
+        
+        'ml_product_lvl': config.get('ml_product_lvl', 7),
+        'ml_location_lvl': config.get('ml_location_lvl', 5),
+        'ml_customer_lvl': config.get('ml_customer_lvl', 4),
+        'ml_distr_channel_lvl': config.get('ml_distr_channel_lvl', 1),
+        'ml_time_lvl': config.get('ml_time_lvl', 'WEEK.2'),
+        
+        'delays_config_length': config.get('delays_config_length', 0)
+    }
 
 
 def reconciliation(
     ts_forecast: pd.DataFrame,
     ml_forecast: pd.DataFrame,
     ts_segments: pd.DataFrame = None,
-    config: dict = None
+    config: dict = None,
+    output_path: str = None
 ) -> pd.DataFrame:
+    """
+    Reconciled forecast of ts_forecast and ml_forecast
+
+    ts_forecast, ml_forecast and ts_segments can also be paths of datasets written by
+    storage.write_table, output_path writes the result as such a dataset
+    """
+    params = _reconciliation_params(config)
+    ib_hist_end_dt = params['ib_hist_end_dt']
     
-    if config is None:
-        config = {}
-    
-    ib_hist_end_dt = config.get('IB_HIST_END_DT', datetime.now())
-    ib_fc_horiz = config.get('IB_FC_HORIZ', 90)
-    
-    ts_product_lvl = config.get('ts_product_lvl', 7)
-    ts_location_lvl = config.get('ts_location_lvl', 1)
-    ts_customer_lvl = config.get('ts_customer_lvl', 5)
-    ts_distr_channel_lvl = config.get('ts_distr_channel_lvl', 1)
-    ts_time_lvl = config.get('ts_time_lvl', 'MONTH')
-    
-    ml_product_lvl = config.get('ml_product_lvl', 7)
-    ml_location_lvl = config.get('ml_location_lvl', 5)
-    ml_customer_lvl = config.get('ml_customer_lvl', 4)
-    ml_distr_channel_lvl = config.get('ml_distr_channel_lvl', 1)
-    ml_time_lvl = config.get('ml_time_lvl', 'WEEK.2')
-    
+    ts_forecast, ml_forecast, ts_segments = _read_forecasts(ts_forecast, ml_forecast, ts_segments, ib_hist_end_dt)
     df_ml = ml_forecast.copy()
     df_ts = ts_forecast.copy()
     
-    delays_config_length = config.get('delays_config_length', 0)
+    df_ts, mid_reconciled_dfs = _split_mid_term(df_ts, ib_hist_end_dt, params['ib_fc_horiz'], params['delays_config_length'])
+    df_t2 = _reconcile_short_term(df_ts, df_ml, ts_segments, ib_hist_end_dt, params['ts_time_lvl'], params['ml_time_lvl'])
+    
+    return _write_reconciled(_append_mid_term(df_t2, mid_reconciled_dfs), output_path)
+
+
+def _split_mid_term(df_ts, ib_hist_end_dt, ib_fc_horiz, delays_config_length):
     
     mid_reconciled_dfs = []
     if ib_fc_horiz > delays_config_length:
@@ -55,74 +138,43 @@ def reconciliation(
             mid_reconciled_dfs.append(df_mid_ts)
         df_ts = df_ts[~mask].copy()
     
+    return df_ts, mid_reconciled_dfs
+
+
+def _reconcile_short_term(df_ts, df_ml, ts_segments, ib_hist_end_dt, ts_time_lvl, ml_time_lvl):
+    
     if 'PERIOD_END_DT' not in df_ml.columns:
-        df_ml['PERIOD_END_DT'] = df_ml.apply(
-            lambda x: x['PERIOD_DT'] + timedelta(days=number_days(ml_time_lvl, x['PERIOD_DT']) - 1), 
-            axis=1
-        )
+        df_ml['PERIOD_END_DT'] = period_end_dt(ml_time_lvl, df_ml['PERIOD_DT'])
     
     if 'PERIOD_END_DT' not in df_ts.columns:
-        df_ts['PERIOD_END_DT'] = df_ts.apply(
-            lambda x: x['PERIOD_DT'] + timedelta(days=number_days(ts_time_lvl, x['PERIOD_DT']) - 1),
-            axis=1
-        )
+        df_ts['PERIOD_END_DT'] = period_end_dt(ts_time_lvl, df_ts['PERIOD_DT'])
     
     df_ml = df_ml[df_ml['PERIOD_DT'] > ib_hist_end_dt].copy()
     df_ts = df_ts[df_ts['PERIOD_DT'] > ib_hist_end_dt].copy()
     
-    product_col_ml = f'product_lvl_id' if 'product_lvl_id' in df_ml.columns else 'PRODUCT_LVL_ID'
-    location_col_ml = f'location_lvl_id' if 'location_lvl_id' in df_ml.columns else 'LOCATION_LVL_ID'
-    customer_col_ml = f'customer_lvl_id' if 'customer_lvl_id' in df_ml.columns else 'CUSTOMER_LVL_ID'
-    channel_col_ml = f'distr_channel_lvl_id' if 'distr_channel_lvl_id' in df_ml.columns else 'DISTR_CHANNEL_LVL_ID'
-    
-    product_col_ts = f'product_lvl_id' if 'product_lvl_id' in df_ts.columns else 'PRODUCT_LVL_ID'
-    location_col_ts = f'location_lvl_id' if 'location_lvl_id' in df_ts.columns else 'LOCATION_LVL_ID'
-    customer_col_ts = f'customer_lvl_id' if 'customer_lvl_id' in df_ts.columns else 'CUSTOMER_LVL_ID'
-    channel_col_ts = f'distr_channel_lvl_id' if 'distr_channel_lvl_id' in df_ts.columns else 'DISTR_CHANNEL_LVL_ID'
-    
     df_ts = df_ts.rename(columns={
         'FORECAST_VALUE': 'TS_FORECAST_VALUE',
-        product_col_ts: 'product_lvl_id',
-        location_col_ts: 'location_lvl_id', 
-        customer_col_ts: 'customer_lvl_id',
-        channel_col_ts: 'distr_channel_lvl_id'
+        **_lvl_id_columns(df_ts)
     })
     
     df_ml = df_ml.rename(columns={
         'FORECAST_VALUE': 'ML_FORECAST_VALUE',
         'FORECAST_VALUE_total': 'ML_FORECAST_VALUE',
-        product_col_ml: 'product_lvl_id',
-        location_col_ml: 'location_lvl_id',
-        customer_col_ml: 'customer_lvl_id', 
-        channel_col_ml: 'distr_channel_lvl_id'
+        **_lvl_id_columns(df_ml)
     })
     
-    df_ml['ml_days'] = df_ml['PERIOD_DT'].apply(lambda x: number_days(ml_time_lvl, x))
-    df_ts['ts_days'] = df_ts['PERIOD_DT'].apply(lambda x: number_days(ts_time_lvl, x))
-    
-    df_ml['ML_FORECAST_VALUE'] = df_ml.apply(
-        lambda x: x['ML_FORECAST_VALUE'] * ((x['PERIOD_END_DT'] - x['PERIOD_DT']).days + 1) / x['ml_days']
-        if pd.notna(x['ML_FORECAST_VALUE']) and x['ml_days'] > 0 else x['ML_FORECAST_VALUE'],
-        axis=1
-    )
-    
-    df_ts['TS_FORECAST_VALUE'] = df_ts.apply(
-        lambda x: x['TS_FORECAST_VALUE'] * ((x['PERIOD_END_DT'] - x['PERIOD_DT']).days + 1) / x['ts_days']
-        if pd.notna(x['TS_FORECAST_VALUE']) and x['ts_days'] > 0 else x['TS_FORECAST_VALUE'],
-        axis=1
-    )
-    
-    df_ml['_merge_key'] = 1
-    df_ts['_merge_key'] = 1
-    df_joined = df_ml.merge(df_ts, on='_merge_key', how='left', suffixes=('_ml', '_ts'))
-    df_joined = df_joined[
-        (df_joined['PERIOD_DT_ml'] <= df_joined['PERIOD_END_DT_ts']) &
-        (df_joined['PERIOD_END_DT_ml'] >= df_joined['PERIOD_DT_ts']) &
-        (df_joined['product_lvl_id_ml'] == df_joined['product_lvl_id_ts']) &
-        (df_joined['location_lvl_id_ml'] == df_joined['location_lvl_id_ts']) &
-        (df_joined['customer_lvl_id_ml'] == df_joined['customer_lvl_id_ts']) &
-        (df_joined['distr_channel_lvl_id_ml'] == df_joined['distr_channel_lvl_id_ts'])
-    ].copy()
+    df_ml['ml_days'] = period_days(ml_time_lvl, df_ml['PERIOD_DT'])
+    df_ts['ts_days'] = period_days(ts_time_lvl, df_ts['PERIOD_DT'])
+    
+    df_ml['ML_FORECAST_VALUE'] = prorate(df_ml['ML_FORECAST_VALUE'], _covered_days(df_ml), df_ml['ml_days'])
+    df_ts['TS_FORECAST_VALUE'] = prorate(df_ts['TS_FORECAST_VALUE'], _covered_days(df_ts), df_ts['ts_days'])
+    
+    ml_idx, ts_idx = overlap_pairs(df_ml, df_ts, LVL_ID_COLS, 'PERIOD_DT', 'PERIOD_END_DT')
+    common_cols = df_ml.columns.intersection(df_ts.columns)
+    df_joined = pd.concat([
+        df_ml.iloc[ml_idx].rename(columns={c: c + '_ml' for c in common_cols}).reset_index(drop=True),
+        df_ts.iloc[ts_idx].rename(columns={c: c + '_ts' for c in common_cols}).reset_index(drop=True)
+    ], axis=1)
     
     df_joined['PERIOD_DT'] = df_joined[['PERIOD_DT_ml', 'PERIOD_DT_ts']].max(axis=1)
     df_joined['PERIOD_END_DT'] = df_joined[['PERIOD_END_DT_ml', 'PERIOD_END_DT_ts']].min(axis=1)
@@ -145,28 +197,9 @@ def reconciliation(
         'ASSORTMENT_TYPE': 'first' if 'ASSORTMENT_TYPE' in df_joined.columns else lambda x: 'old'
     })
     
-    reconciliation_group_cols = ['product_lvl_id', 'location_lvl_id', 'customer_lvl_id', 
-                                  'distr_channel_lvl_id', 'PERIOD_DT']
-    
-    ml_totals = df_t1.groupby(reconciliation_group_cols, as_index=False)['ML_FORECAST_VALUE'].sum()
-    ts_totals = df_t1.groupby(reconciliation_group_cols, as_index=False)['TS_FORECAST_VALUE'].sum()
-    
-    df_totals = ml_totals.merge(ts_totals, on=reconciliation_group_cols, how='outer', suffixes=('_ml', '_ts'))
-    df_totals['reconciliation_ratio'] = df_totals.apply(
-        lambda x: x['ML_FORECAST_VALUE'] / x['TS_FORECAST_VALUE']
-        if pd.notna(x['TS_FORECAST_VALUE']) and x['TS_FORECAST_VALUE'] > 0 and pd.notna(x['ML_FORECAST_VALUE'])
-        else (1.0 if pd.notna(x['TS_FORECAST_VALUE']) and x['TS_FORECAST_VALUE'] > 0 else 0.0),
-        axis=1
-    )
-    
-    df_t2 = df_t1.merge(
-        df_totals[reconciliation_group_cols + ['reconciliation_ratio']],
-        on=reconciliation_group_cols,
-        how='left'
-    )
-    
-    df_t2['TS_FORECAST_VALUE_REC'] = df_t2['TS_FORECAST_VALUE'] * df_t2['reconciliation_ratio'].fillna(1.0)
-    df_t2 = df_t2.drop(columns=['reconciliation_ratio'], errors='ignore')
+    # df_t1 is already unique on group_cols, so its rows are the reconciliation totals
+    df_t2 = df_t1
+    df_t2['TS_FORECAST_VALUE_REC'] = df_t2['TS_FORECAST_VALUE'] * reconciliation_totals_ratio(df_t2)
     
     if ts_segments is not None:
         df_t2 = pd.merge(
@@ -181,6 +214,11 @@ def reconciliation(
     df_t2['CUSTOMER_LVL_ID'] = df_t2['customer_lvl_id']
     df_t2['DISTR_CHANNEL_LVL_ID'] = df_t2['distr_channel_lvl_id']
     
+    return df_t2
+
+
+def _append_mid_term(df_t2, mid_reconciled_dfs):
+    
     if len(mid_reconciled_dfs) > 0:
         for df_mid in mid_reconciled_dfs:
             if 'FORECAST_VALUE' in df_mid.columns:
@@ -195,3 +233,78 @@ def reconciliation(
     
     return df_t2
 
+
+
+def _series_partitions(frames, n_partitions):
+    """
+    Partition number of every row of every frame: hash of its (product, location, customer, channel)
+    keys modulo n_partitions, so a key lands in the same partition whatever other keys are present
+    """
+    partitions = []
+    for frame in frames:
+        keys = frame[list(_lvl_id_columns(frame))].set_axis(LVL_ID_COLS, axis=1)
+        partitions.append((key_hashes(keys, LVL_ID_COLS) % np.uint64(n_partitions)).astype(np.int64))
+    return partitions
+
+
+def _reconcile_partition(task):
+    return _reconcile_short_term(*task)
+
+
+def parallel_reconciliation(
+    ts_forecast: pd.DataFrame,
+    ml_forecast: pd.DataFrame,
+    ts_segments: pd.DataFrame = None,
+    config: dict = None,
+    n_workers: int = None,
+    n_partitions: int = None,
+    output_path: str = None
+) -> pd.DataFrame:
+    """
+    Partitioned execution of reconciliation()
+    
+    Both forecasts (and segments) are partitioned on the series keys, every partition
+    is reconciled in a separate process and the results are concatenated. Output is
+    equal to reconciliation() on the same inputs, inputs and output_path as there.
+    
+    Parameters
+    ----------
+    n_workers : int
+        Number of worker processes, defaults to the number of CPUs
+    n_partitions : int
+        Number of series partitions, defaults to n_workers
+    """
+    params = _reconciliation_params(config)
+    ib_hist_end_dt = params['ib_hist_end_dt']
+    
+    n_workers = n_workers or os.cpu_count() or 1
+    n_partitions = n_partitions or n_workers
+    
+    ts_forecast, ml_forecast, ts_segments = _read_forecasts(ts_forecast, ml_forecast, ts_segments, ib_hist_end_dt)
+    df_ts, mid_reconciled_dfs = _split_mid_term(ts_forecast.copy(), ib_hist_end_dt, params['ib_fc_horiz'],
+                                                params['delays_config_length'])
+    df_ml = ml_forecast
+    
+    frames = [df_ts, df_ml] + ([ts_segments] if ts_segments is not None else [])
+    partitions = _series_partitions(frames, n_partitions)
+    
+    tasks = []
+    for part in range(n_partitions):
+        ts_part = df_ts[partitions[0] == part]
+        ml_part = df_ml[partitions[1] == part]
+        if len(ts_part) == 0 or len(ml_part) == 0:
+            continue
+        segments_part = ts_segments[partitions[2] == part] if ts_segments is not None else None
+        tasks.append((ts_part, ml_part, segments_part, ib_hist_end_dt, params['ts_time_lvl'], params['ml_time_lvl']))
+    
+    # nothing to reconcile in parallel, e.g. no series with both forecasts
+    if len(tasks) == 0:
+        return reconciliation(ts_forecast, ml_forecast, ts_segments, config, output_path)
+    
+    with ProcessPoolExecutor(max_workers=min(n_workers, len(tasks))) as executor:
+        results = list(executor.map(_reconcile_partition, tasks))
+    
+    group_cols = LVL_ID_COLS + ['PERIOD_DT']
+    df_t2 = pd.concat(results, ignore_index=True).sort_values(group_cols, kind='stable').reset_index(drop=True)
+    
+    return _write_reconciled(_append_mid_term(df_t2, mid_reconciled_dfs), output_path)
@@ -0,0 +1,192 @@
+import os
+import json
+import shutil
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+
+FORMATS = {'parquet': 'parquet', 'arrow': 'ipc'}
+
+METADATA_FILE = '_common_metadata'
+
+
+def _is_id_column(name):
+    return '_ID' in name.upper()
+
+
+def _is_whole_days(column):
+    seconds = pc.cast(column, pa.timestamp('s'), safe=False)
+    days = pc.cast(pc.cast(seconds, pa.date32()), pa.timestamp('s'))
+    return pc.all(pc.equal(days, seconds)).as_py() is not False
+
+
+def _to_arrow(df):
+    """
+    Arrow table from df with day-level datetime columns stored as date32
+    and string ID columns dictionary-encoded
+    """
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    metadata = table.schema.metadata
+
+    for i, field in enumerate(table.schema):
+        column = table.column(i)
+        if pa.types.is_timestamp(field.type) and field.type.tz is None and _is_whole_days(column):
+            table = table.set_column(i, field.name, pc.cast(pc.cast(column, pa.timestamp('s'), safe=False), pa.date32()))
+        elif _is_id_column(field.name) and (pa.types.is_string(field.type) or pa.types.is_large_string(field.type)):
+            table = table.set_column(i, field.name, pc.dictionary_encode(pc.cast(column, pa.string())))
+
+    return table.replace_schema_metadata(metadata)
+
+
+def _month_key(period):
+    """yyyymm of a date32/timestamp column"""
+    return pc.add(pc.multiply(pc.year(period), 100), pc.month(period))
+
+
+def _pandas_columns(schema):
+    return [col['name'] for col in (schema.pandas_metadata or {}).get('columns', [])]
+
+
+def write_table(df, path, format='parquet', product_lvl=None, period_col='PERIOD_DT', mode='overwrite'):
+    """
+    Write a stage table (RESTORED_DEMAND, reconciled, hybrid or disaccumulated forecast)
+    as a hive-partitioned Parquet or Arrow IPC dataset: PRODUCT_LVL=<product_lvl>/PERIOD_MONTH=<yyyymm>/
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Table to write
+    path : str
+        Dataset directory
+    format : str
+        'parquet' or 'arrow' (Arrow IPC files)
+    product_lvl : int
+        Product hierarchy level of the table, used as the first partition key if given
+    period_col : str
+        Period column, its month is the second partition key
+    mode : str
+        'overwrite' replaces the whole dataset,
+        'partitions' replaces only the partitions present in df (e.g. to add another product level)
+
+    Day-level datetime columns are stored as date32 and string ID columns are dictionary-encoded,
+    read_table restores the original pandas dtypes.
+    """
+    table = _to_arrow(df)
+
+    partition_cols = []
+    if product_lvl is not None:
+        table = table.append_column('PRODUCT_LVL', pa.array([product_lvl] * len(table), pa.int32()))
+        partition_cols.append('PRODUCT_LVL')
+    if period_col in df.columns:
+        table = table.append_column('PERIOD_MONTH', _month_key(table.column(period_col)))
+        partition_cols.append('PERIOD_MONTH')
+
+    metadata = dict(table.schema.metadata)
+    metadata[b'partition_cols'] = json.dumps(partition_cols).encode()
+    metadata[b'period_col'] = period_col.encode()
+    table = table.replace_schema_metadata(metadata)
+
+    if mode == 'overwrite' and os.path.isdir(path):
+        shutil.rmtree(path)
+    os.makedirs(path, exist_ok=True)
+
+    file_options = None
+    if format == 'parquet':
+        id_cols = [name for name in table.schema.names if _is_id_column(name)]
+        file_options = ds.ParquetFileFormat().make_write_options(use_dictionary=id_cols, compression='zstd')
+
+    partitioning = None
+    if partition_cols:
+        partitioning = ds.partitioning(pa.schema([table.schema.field(col) for col in partition_cols]), flavor='hive')
+    ds.write_dataset(table, path, format=FORMATS[format], partitioning=partitioning, file_options=file_options,
+                     existing_data_behavior='delete_matching', max_partitions=100000,
+                     basename_template='part-{i}.' + format)
+    pq.write_metadata(table.schema, os.path.join(path, METADATA_FILE))
+
+
+def _restore_dtypes(df, schema):
+    """Back to the pandas dtypes the table was written with"""
+    columns = {col['name']: col for col in (schema.pandas_metadata or {}).get('columns', [])}
+    for col in df.columns:
+        field = schema.field(col)
+        numpy_type = columns.get(col, {}).get('numpy_type', 'object')
+        if pa.types.is_date(field.type) and numpy_type.startswith('datetime64'):
+            df[col] = pd.to_datetime(df[col]).astype(numpy_type)
+        elif pa.types.is_dictionary(field.type) and columns.get(col, {}).get('pandas_type') != 'categorical':
+            df[col] = df[col].astype(str if numpy_type == 'object' else numpy_type)
+    return df
+
+
+def read_table(path, format='parquet', columns=None, start=None, end=None, product_lvl=None):
+    """
+    Read a dataset written by write_table
+
+    Parameters
+    ----------
+    path : str
+        Dataset directory
+    format : str
+        'parquet' or 'arrow'
+    columns : list
+        Columns to read, all by default. Other columns are not read from disk
+    start : datetime-like
+        Read only rows with period_col >= start
+    end : datetime-like
+        Read only rows with period_col <= end
+    product_lvl : int
+        Read only this product level
+
+    Returns
+    -------
+    pd.DataFrame
+        Table with the written dtypes, rows ordered by partition
+
+    The filters prune PRODUCT_LVL/PERIOD_MONTH partitions and are pushed down to the file
+    reader (Parquet row group statistics), so a stage reads only the horizon it needs.
+    """
+    schema = pq.read_schema(os.path.join(path, METADATA_FILE))
+    partition_cols = json.loads(schema.metadata[b'partition_cols'])
+    period_col = schema.metadata[b'period_col'].decode()
+
+    partitioning = None
+    if partition_cols:
+        partitioning = ds.partitioning(pa.schema([schema.field(col) for col in partition_cols]), flavor='hive')
+    dataset = ds.dataset(path, format=FORMATS[format], schema=schema, partitioning=partitioning)
+
+    period_type = schema.field(period_col).type if period_col in schema.names else None
+    conditions = []
+    for bound, compare in [(start, pc.greater_equal), (end, pc.less_equal)]:
+        if bound is None:
+            continue
+        bound = pd.Timestamp(bound)
+        value = bound.date() if pa.types.is_date(period_type) else bound.to_pydatetime()
+        conditions.append(compare(ds.field(period_col), pa.scalar(value, period_type)))
+        if 'PERIOD_MONTH' in partition_cols:
+            conditions.append(compare(ds.field('PERIOD_MONTH'), bound.year * 100 + bound.month))
+    if product_lvl is not None:
+        conditions.append(ds.field('PRODUCT_LVL') == product_lvl)
+
+    predicate = None
+    for condition in conditions:
+        predicate = condition if predicate is None else predicate & condition
+
+    if columns is None:
+        columns = _pandas_columns(schema) or [name for name in schema.names if name not in partition_cols]
+
+    df = dataset.to_table(columns=columns, filter=predicate).to_pandas()
+    return _restore_dtypes(df, schema)
+
+
+def read_input(table, columns=None, start=None, end=None, format='parquet'):
+    """
+    Stage input given either as a DataFrame or as the path of a dataset written by write_table
+
+    A DataFrame is returned unchanged, the stage filters it itself. A path is read with
+    read_table, so only the columns and the PERIOD_DT horizon the stage needs are loaded
+    """
+    if isinstance(table, pd.DataFrame) or table is None:
+        return table
+    return read_table(table, format=format, columns=columns, start=start, end=end)
@@ -0,0 +1,292 @@
+import numpy as np
+import pandas as pd
+
+
+SERIES_KEYS = ['PRODUCT_ID', 'LOCATION_ID', 'CUSTOMER_ID', 'DISTR_CHANNEL_ID']
+
+LVL_KEYS = ['PRODUCT_LVL_ID', 'LOCATION_LVL_ID', 'CUSTOMER_LVL_ID', 'DISTR_CHANNEL_LVL_ID']
+
+SEGMENTS = ['Regular', 'Short', 'Retired', 'Low Volume']
+
+
+def default_rng(seed=None):
+    """np.random.Generator of a seed, a Generator is returned as is"""
+    return seed if isinstance(seed, np.random.Generator) else np.random.default_rng(seed)
+
+
+def _frame(columns, as_frame):
+    # copy=False keeps every array as its own block, no consolidation copy
+    return pd.DataFrame(columns, copy=False) if as_frame else columns
+
+
+def _categorical(codes, labels, as_frame):
+    """labels of codes, -1 is missing"""
+    return pd.Categorical.from_codes(codes, labels) if as_frame else np.asarray(labels, dtype=object)[codes]
+
+
+def choice(rng, labels, p, size, as_frame=True):
+    """
+    Random labels as a categorical column (an object array if not as_frame)
+
+    A None label gives missing values
+    """
+    codes = rng.choice(len(labels), size=size, p=p).astype(np.int8)
+    present = [label for label in labels if label is not None]
+    remap = np.array([present.index(label) if label is not None else -1 for label in labels], dtype=np.int8)
+    return _categorical(remap[codes], present, as_frame)
+
+
+def cartesian(columns):
+    """
+    Every combination of the values of columns, the first column varies slowest
+    (the row order of a chain of cross merges)
+
+    Parameters
+    ----------
+    columns : dict
+        Column name -> values
+
+    Returns
+    -------
+    dict
+        Column name -> values with the product of the lengths
+    """
+    # extension arrays (Int32, datetimes) keep their dtype
+    values = {name: column if isinstance(column, np.ndarray) else pd.Series(column).array for name, column in columns.items()}
+    sizes = [len(column) for column in values.values()]
+    total = int(np.prod(sizes))
+    result = {}
+    inner = total
+    for (name, column), size in zip(values.items(), sizes):
+        inner //= size
+        rows = np.tile(np.repeat(np.arange(size), inner), total // (inner * size))
+        result[name] = column[rows] if isinstance(column, np.ndarray) else column.take(rows)
+    return result
+
+
+def series_keys(num_series, num_products=None, num_customers=1, num_channels=1, names=SERIES_KEYS, as_frame=True):
+    """
+    Keys of num_series series: products vary fastest, then locations, customers and channels
+
+    num_products defaults to min(num_series, 1000), the number of locations follows from
+    num_series. Ids start at 1 and are int32
+    """
+    num_products = num_products or min(num_series, 1000)
+    series = np.arange(num_series, dtype=np.int64)
+    num_locations = -(-num_series // (num_products * num_customers * num_channels))
+    keys = [series % num_products, series // num_products % num_locations,
+            series // (num_products * num_locations) % num_customers,
+            series // (num_products * num_locations * num_customers)]
+    return _frame({name: (key + 1).astype(np.int32) for name, key in zip(names, keys)}, as_frame)
+
+
+def hierarchy(dimension, num_members, level_sizes=(1, 10, 100), as_frame=True):
+    """
+    DPS-like hierarchy table of a dimension (PRODUCT, LOCATION, ...), one row per member
+
+    Member ids are 1..num_members like in series_keys. Level k has level_sizes[k - 1] nodes,
+    each over a contiguous block of members, with ids k * M + 1, ... (M a power of 10 above
+    num_members) so that ids of different levels never collide.
+    Can be passed to hierarchy.HierarchyIndex.from_dps(dimension, members=...)
+    """
+    members = np.arange(num_members, dtype=np.int64)
+    scale = 10 ** len(str(num_members))
+    columns = {}
+    for level, size in enumerate(level_sizes, start=1):
+        columns[f'{dimension}_LVL_ID{level}'] = (level * scale + members * min(size, num_members) // num_members + 1).astype(np.int64)
+    columns[f'{dimension}_ID'] = (members + 1).astype(np.int64)
+    return _frame(columns, as_frame)
+
+
+def demand_profile(rng, num_series, calendar, level=(2.0, 1.0), weekly=0.3, yearly=0.3):
+    """
+    Expected demand of every series and period, float32 (num_series, len(calendar))
+
+    Lognormal level of every series (mean and sigma of the log) times a weekly profile
+    (daily calendars only) and a yearly profile with per-series amplitudes and phases
+    """
+    days = ((calendar - pd.Timestamp('2000-01-01')) // pd.Timedelta(days=1)).to_numpy()
+    profile = rng.lognormal(level[0], level[1], (num_series, 1)).astype(np.float32)
+
+    phase = rng.random((num_series, 1), dtype=np.float32)
+    amplitude = yearly * rng.random((num_series, 1), dtype=np.float32)
+    profile = profile * (1 + amplitude * np.sin(np.float32(2 * np.pi) * ((days % 365.25).astype(np.float32) / np.float32(365.25) + phase)))
+
+    if len(calendar) > 1 and (calendar[1] - calendar[0]) < pd.Timedelta(days=7):
+        # Monday to Sunday, largest deviation 1
+        weekday = np.array([-0.33, -0.5, -0.33, -0.17, 0.33, 1.0, 0.0], dtype=np.float32)
+        amplitude = weekly * rng.random((num_series, 1), dtype=np.float32)
+        profile *= 1 + amplitude * weekday[(days + 5) % 7]
+    return profile
+
+
+def _noise(rng, sigma, shape):
+    """float32 lognormal multiplicative noise"""
+    noise = rng.standard_normal(shape, dtype=np.float32)
+    noise *= np.float32(sigma)
+    return np.exp(noise, out=noise)
+
+
+def _poisson(rng, lam, rows=1 << 16):
+    """float32 Poisson counts of lam, drawn in row blocks to avoid an int64 copy of the whole matrix"""
+    counts = np.empty(lam.shape, dtype=np.float32)
+    for start in range(0, len(lam), rows):
+        counts[start:start + rows] = rng.poisson(lam[start:start + rows])
+    return counts
+
+
+def _periods(start, num_periods, freq):
+    """Period starts and ends (day before the next start)"""
+    bounds = pd.date_range(start, periods=num_periods + 1, freq=freq)
+    return bounds[:-1], bounds[1:] - pd.Timedelta(days=1)
+
+
+def _long(keys, starts, ends=None):
+    """Series-major long table columns: keys repeated, periods tiled"""
+    num_series, num_periods = len(next(iter(keys.values()))), len(starts)
+    columns = {name: np.repeat(key, num_periods) for name, key in keys.items()}
+    columns['PERIOD_DT'] = np.tile(starts.to_numpy(), num_series)
+    if ends is not None:
+        columns['PERIOD_END_DT'] = np.tile(ends.to_numpy(), num_series)
+    return columns
+
+
+def forecasts(num_series, num_periods, start='2024-01-01', freq='D', num_products=None, noise=0.2,
+              promo_share=0.2, new_share=0.1, segment_p=(0.55, 0.15, 0.15, 0.15), seed=None, as_frame=True):
+    """
+    TS and ML forecasts and TS segments, the inputs of reconciliation
+
+    Both forecasts follow the same demand profile with independent lognormal noise. DEMAND_TYPE
+    (promo/regular) is drawn per row, ASSORTMENT_TYPE (new/old) and SEGMENT_NAME per series
+
+    Returns
+    -------
+    pd.DataFrame
+        ts_forecast: *_LVL_ID keys, PERIOD_DT, PERIOD_END_DT, FORECAST_VALUE
+    pd.DataFrame
+        ml_forecast: same plus DEMAND_TYPE and ASSORTMENT_TYPE
+    pd.DataFrame
+        ts_segments: lower case *_lvl_id keys and SEGMENT_NAME
+    """
+    rng = default_rng(seed)
+    starts, ends = _periods(start, num_periods, freq)
+    keys = series_keys(num_series, num_products, names=LVL_KEYS, as_frame=False)
+    profile = demand_profile(rng, num_series, starts)
+    size = num_series * num_periods
+
+    ts = _long(keys, starts, ends)
+    ts['FORECAST_VALUE'] = (profile * _noise(rng, noise, profile.shape)).ravel()
+    ml = _long(keys, starts, ends)
+    ml['FORECAST_VALUE'] = (profile * _noise(rng, noise, profile.shape)).ravel()
+    ml['DEMAND_TYPE'] = choice(rng, ['regular', 'promo'], [1 - promo_share, promo_share], size, as_frame)
+    assortment = rng.random(num_series) < new_share
+    ml['ASSORTMENT_TYPE'] = _categorical(np.repeat(assortment, num_periods).astype(np.int8), ['old', 'new'], as_frame)
+
+    segments = {name.lower(): key for name, key in keys.items()}
+    segments['SEGMENT_NAME'] = choice(rng, SEGMENTS, segment_p, num_series, as_frame)
+    return _frame(ts, as_frame), _frame(ml, as_frame), _frame(segments, as_frame)
+
+
+def reconciled_forecast(num_series, num_periods, start='2024-01-01', freq='D', num_products=None, noise=0.2,
+                        promo_share=0.3, new_share=0.2, segment_p=(0.5, 0.15, 0.15, 0.15, 0.05),
+                        zero_share=0.3, seed=None, as_frame=True):
+    """
+    Reconciled forecast, the input of hybridization
+
+    SEGMENT_NAME is drawn per series from SEGMENTS and None (segment_p), zero_share of the Retired
+    and Low Volume series have near zero TS_FORECAST_VALUE_REC (below IB_ZERO_DEMAND_THRESHOLD)
+    """
+    rng = default_rng(seed)
+    starts, ends = _periods(start, num_periods, freq)
+    keys = series_keys(num_series, num_products, names=LVL_KEYS, as_frame=False)
+    profile = demand_profile(rng, num_series, starts)
+    size = num_series * num_periods
+
+    segment_codes = rng.choice(len(segment_p), size=num_series, p=segment_p).astype(np.int8)
+    segment_codes[segment_codes == len(SEGMENTS)] = -1
+    fading = np.isin(segment_codes, [SEGMENTS.index('Retired'), SEGMENTS.index('Low Volume')])
+    ts_profile = np.where((fading & (rng.random(num_series) < zero_share))[:, None], np.float32(0.001), profile)
+
+    df = _long(keys, starts, ends)
+    df['TS_FORECAST_VALUE_REC'] = (ts_profile * _noise(rng, noise, profile.shape)).ravel()
+    df['ML_FORECAST_VALUE'] = (profile * _noise(rng, noise, profile.shape)).ravel()
+    df['SEGMENT_NAME'] = _categorical(np.repeat(segment_codes, num_periods), SEGMENTS, as_frame)
+    df['DEMAND_TYPE'] = choice(rng, ['regular', 'promo'], [1 - promo_share, promo_share], size, as_frame)
+    assortment = rng.random(num_series) < new_share
+    df['ASSORTMENT_TYPE'] = _categorical(np.repeat(assortment, num_periods).astype(np.int8), ['old', 'new'], as_frame)
+    return _frame(df, as_frame)
+
+
+def sales_history(num_series, num_days, start='2024-01-01', num_products=None, num_customers=1, num_channels=1,
+                  promo_slot_days=28, promo_share=0.3, promo_uplift=1.8, stockout_share=0.05,
+                  stock=True, seed=None, as_frame=True):
+    """
+    Daily SALES with PROMO windows and STOCK, the inputs of demand restoration
+
+    Demand is Poisson around demand_profile. Every series has one possible promo window per
+    promo_slot_days (taken with promo_share, 3 to 14 days) which multiplies the demand by
+    promo_uplift. Stock covers about a week of demand, stockout_share of the series-days have
+    low stock and SALES_QTY is capped by the stock, so deficits show up as in real data.
+
+    Returns
+    -------
+    pd.DataFrame
+        SALES: series keys, PERIOD_DT, SALES_QTY, PROMO_FLG, PROMO_ID (float, NaN outside promos)
+    pd.DataFrame
+        PROMO: PROMO_ID, series keys, PERIOD_START_DT, PERIOD_END_DT, PROMO_PRICE, PROMO_TYPE
+    pd.DataFrame
+        STOCK: PRODUCT_ID, LOCATION_ID, PERIOD_DT, STOCK_QTY of the first customer and channel
+        series, only if stock
+    """
+    rng = default_rng(seed)
+    calendar = pd.date_range(start, periods=num_days, freq='D')
+    keys = series_keys(num_series, num_products, num_customers, num_channels, as_frame=False)
+    demand = demand_profile(rng, num_series, calendar)
+
+    # promo windows, at most one per series and slot
+    num_slots = -(-num_days // promo_slot_days)
+    active = rng.random((num_series, num_slots)) < promo_share
+    length = rng.integers(3, 15, (num_series, num_slots), dtype=np.int16)
+    offset = rng.integers(0, promo_slot_days - 14, (num_series, num_slots), dtype=np.int16)
+    window_start = np.arange(num_slots) * promo_slot_days + offset
+    active &= window_start < num_days
+    promo_ids = np.where(active, np.cumsum(active).reshape(active.shape), 0).astype(np.int32)
+    # float32 holds the ids exactly up to 2**24
+    id_dtype = np.float32 if active.sum() < 2 ** 24 else np.float64
+
+    day = np.arange(num_days)
+    slot, day_offset = day // promo_slot_days, day % promo_slot_days
+    promo_flg = active[:, slot] & (day_offset >= offset[:, slot]) & (day_offset < offset[:, slot] + length[:, slot])
+    demand[promo_flg] *= np.float32(promo_uplift)
+
+    qty = _poisson(rng, demand)
+    demand *= 7
+    stock_qty = _poisson(rng, demand)
+    del demand
+    stockout = rng.random(qty.shape, dtype=np.float32) < stockout_share
+    stock_qty[stockout] = np.floor(stock_qty[stockout] * rng.random(stockout.sum(), dtype=np.float32) * 0.1)
+    np.minimum(qty, stock_qty, out=qty)
+
+    SALES = _long(keys, calendar)
+    SALES['SALES_QTY'] = qty.ravel()
+    SALES['PROMO_FLG'] = promo_flg.ravel().astype(np.int8)
+    promo_id = np.full(promo_flg.shape, np.nan, dtype=id_dtype)
+    promo_id[promo_flg] = promo_ids[:, slot][promo_flg]
+    SALES['PROMO_ID'] = promo_id.ravel()
+    del qty, promo_flg
+
+    series, slots = np.nonzero(active)
+    PROMO = {'PROMO_ID': promo_ids[series, slots].astype(id_dtype)}
+    PROMO.update({name: key[series] for name, key in keys.items()})
+    PROMO['PERIOD_START_DT'] = calendar[window_start[series, slots]].to_numpy()
+    PROMO['PERIOD_END_DT'] = calendar[np.minimum(window_start + length - 1, num_days - 1)[series, slots]].to_numpy()
+    PROMO['PROMO_PRICE'] = np.round(rng.uniform(1, 20, len(series)), 2)
+    PROMO['PROMO_TYPE'] = choice(rng, ['discount', 'bundle', 'display'], [0.6, 0.2, 0.2], len(series), as_frame)
+
+    if not stock:
+        return _frame(SALES, as_frame), _frame(PROMO, as_frame)
+
+    first = (keys['CUSTOMER_ID'] == 1) & (keys['DISTR_CHANNEL_ID'] == 1)
+    STOCK = _long({name: keys[name][first] for name in SERIES_KEYS[:2]}, calendar)
+    STOCK['STOCK_QTY'] = stock_qty[first].ravel()
+    return _frame(SALES, as_frame), _frame(PROMO, as_frame), _frame(STOCK, as_frame)
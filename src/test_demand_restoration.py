@@ -0,0 +1,372 @@
+import datetime
+import tempfile
+import pandas as pd
+import numpy as np
+from demand_restoration import rolling_deficit_stats, secondary_deficit_flg_def, build_rolling_state, add_stock_data_and_promo_flag
+from demand_restoration import primiry_deficit_flg_def, demand_restoration_on_stock_def, history_extending
+from demand_restoration import demand_restoration_algorithm, incremental_demand_restoration
+from dense_demand import DenseDemand, restore_demand, rolling_stats, pack_flags, unpack_flags
+from demand_cube import save_cube, open_cube, attach_cube, map_cube, parallel_restore_demand
+from storage import write_table, read_table
+
+
+KEYS = ['PRODUCT_ID', 'LOCATION_ID', 'CUSTOMER_ID', 'DISTR_CHANNEL_ID']
+
+
+def generate_daily_history(num_series=30, num_days=60, missing=0.0):
+
+    series = np.arange(num_series)
+    df = pd.DataFrame({
+        'PRODUCT_ID': np.repeat(series % 10, num_days),
+        'LOCATION_ID': np.repeat(series // 10, num_days),
+        'CUSTOMER_ID': 1,
+        'DISTR_CHANNEL_ID': 1,
+        'PERIOD_DT': np.tile(pd.date_range('2024-01-01', periods=num_days), num_series),
+        'TGT_QTY': np.random.uniform(0, 100, num_series * num_days),
+        'DEFICIT_FLG1': np.random.choice([0, 1], p=[0.8, 0.2], size=num_series * num_days)
+    })
+    # days without sales (left merge of SALES)
+    df.loc[np.random.random(len(df)) < missing, 'TGT_QTY'] = np.nan
+    # gaps in the calendar and shuffled rows
+    df = df.sample(frac=0.9).reset_index(drop=True)
+
+    return df
+
+
+def test_rolling_deficit_stats():
+
+    print("rolling deficit statistics test started")
+
+    df = generate_daily_history()
+    stats = rolling_deficit_stats(df, KEYS, 14)
+    print(stats.head(3).to_string())
+
+    assert stats.index.equals(df.index)
+    for _, group in df.groupby(KEYS):
+        group = group.sort_values('PERIOD_DT')
+        rolling = group.set_index('PERIOD_DT').rolling('14D')
+        assert np.allclose(stats.loc[group.index, 'mean'], rolling['TGT_QTY'].mean())
+        assert np.allclose(stats.loc[group.index, 'std'], rolling['TGT_QTY'].std(), equal_nan=True)
+        nondeficit = (1 - group.set_index('PERIOD_DT')['DEFICIT_FLG1']).rolling('14D').sum()
+        assert np.array_equal(stats.loc[group.index, 'COUNT_NONDEFECIT_DAYS'], nondeficit)
+
+    print("rolling deficit statistics test complete")
+
+
+def test_secondary_deficit_flg_def():
+
+    print("secondary deficit flag test started")
+
+    df = generate_daily_history()
+    DR_PARAMETERS = {'DR_PERIOD_LENGTH': 14}
+    T42 = secondary_deficit_flg_def(df, datetime.datetime(2024, 1, 1), datetime.datetime(2024, 2, 29), 0, 80, DR_PARAMETERS)
+
+    # statistics are attached per (keys, PERIOD_DT), without multiplying rows
+    assert len(T42) == len(df)
+    assert not T42.duplicated(KEYS + ['PERIOD_DT']).any()
+    assert T42[['mean', 'std', 'COUNT_NONDEFECIT_DAYS']].notna().all().all()
+    assert T42.loc[T42['DEFICIT_FLG1'] == 1, 'DEFICIT_FLG2'].eq(1).all()
+
+    # missing TGT_QTY: statistics of the known days of the series, the gap takes the last known day
+    df = generate_daily_history(missing=0.1)
+    T42 = secondary_deficit_flg_def(df, datetime.datetime(2024, 1, 1), datetime.datetime(2024, 2, 29), 0, 80, DR_PARAMETERS)
+    T42 = T42.sort_values(KEYS + ['PERIOD_DT'])
+    expected = df.sort_values(KEYS + ['PERIOD_DT'])
+    rolling = expected.set_index('PERIOD_DT').groupby(KEYS)['TGT_QTY'].rolling('14D')
+    assert np.allclose(T42['mean'], rolling.mean().fillna(0))
+    assert np.allclose(T42['std'], rolling.std().fillna(1))
+    assert np.allclose(T42['TGT_QTY'], expected.groupby(KEYS)['TGT_QTY'].ffill(), equal_nan=True)
+    assert T42['TGT_QTY'].isna().sum() < df['TGT_QTY'].isna().sum()
+
+    print("secondary deficit flag test complete")
+
+
+def test_incremental_rolling_state():
+
+    print("incremental rolling state test started")
+
+    df = generate_daily_history(missing=0.3)
+    DR_PARAMETERS = {'DR_PERIOD_LENGTH': 14}
+    IB_HIST_START_DT = datetime.datetime(2024, 1, 1)
+    IB_HIST_END_DT = datetime.datetime(2024, 2, 29)
+    depth = 10
+    # no sales of one series in the last 30 days, its last known TGT_QTY is older than the state window
+    gap = (df['PRODUCT_ID'] == 0) & (df['LOCATION_ID'] == 0) & (df['PERIOD_DT'] > IB_HIST_END_DT - datetime.timedelta(30))
+    df.loc[gap, 'TGT_QTY'] = np.nan
+
+    full = secondary_deficit_flg_def(df, IB_HIST_START_DT, IB_HIST_END_DT, 0, 80, DR_PARAMETERS)
+
+    # previous run ended 3 days earlier, the update window overlaps it by 7 days
+    previous_end = IB_HIST_END_DT - datetime.timedelta(3)
+    state = build_rolling_state(df[df['PERIOD_DT'] <= previous_end], previous_end, depth, DR_PARAMETERS)
+    print(f"rolling state {len(state)} of {len(df)} rows")
+    # days of the window plus at most one earlier day with a known TGT_QTY per series
+    earlier = state[state['PERIOD_DT'] <= previous_end - datetime.timedelta(14 + depth)]
+    assert not earlier.duplicated(KEYS).any() and earlier['TGT_QTY'].notna().all()
+
+    update = df[df['PERIOD_DT'] >= IB_HIST_END_DT - datetime.timedelta(depth)]
+    T42 = secondary_deficit_flg_def(update, IB_HIST_START_DT, IB_HIST_END_DT, depth, 80, DR_PARAMETERS, state)
+
+    cols = KEYS + ['PERIOD_DT', 'TGT_QTY', 'mean', 'std', 'COUNT_NONDEFECIT_DAYS', 'DEFICIT_FLG2']
+    expected = full[full['PERIOD_DT'] >= IB_HIST_END_DT - datetime.timedelta(depth)][cols]
+    expected = expected.sort_values(KEYS + ['PERIOD_DT']).reset_index(drop=True)
+    actual = T42[cols].sort_values(KEYS + ['PERIOD_DT']).reset_index(drop=True)
+    pd.testing.assert_frame_equal(actual, expected, check_exact=False)
+
+    state = build_rolling_state(update, IB_HIST_END_DT, depth, DR_PARAMETERS, state)
+    assert not state.duplicated(KEYS + ['PERIOD_DT']).any()
+    assert state['PERIOD_DT'].max() == update['PERIOD_DT'].max()
+
+    print("incremental rolling state test complete")
+
+
+def test_incremental_demand_restoration():
+
+    print("incremental demand restoration test started")
+
+    IB_HIST_START_DT = datetime.datetime(2024, 1, 1)
+    IB_HIST_END_DT = datetime.datetime(2024, 4, 30)
+    previous_end = IB_HIST_END_DT - datetime.timedelta(3)
+    depth = 10
+
+    days = pd.date_range(IB_HIST_START_DT, IB_HIST_END_DT)
+    SALES = generate_daily_history(num_days=len(days), missing=0.1).drop(columns='DEFICIT_FLG1')
+    SALES = SALES.rename(columns={'TGT_QTY': 'SALES_QTY'}).assign(PROMO_FLG=0, PROMO_ID=np.nan)
+    FORECAST_FLAG = SALES[KEYS + ['PERIOD_DT']].rename(columns={'PERIOD_DT': 'PERIOD_START_DT'})
+    FORECAST_FLAG = FORECAST_FLAG.assign(PERIOD_END_DT=pd.Timestamp('2100-01-01'), STATUS='maturity')
+    # days without a SALES row have a missing TGT_QTY
+    SALES = SALES.sample(frac=0.9)
+    STOCK = FORECAST_FLAG[KEYS[:2] + ['PERIOD_START_DT']].drop_duplicates().rename(columns={'PERIOD_START_DT': 'PERIOD_DT'})
+    STOCK['STOCK_QTY'] = np.random.randint(0, 20, len(STOCK)).astype(float)
+    PROMO = pd.DataFrame({'PRODUCT_ID': [0], 'LOCATION_ID': [0], 'CUSTOMER_ID': [1], 'DISTR_CHANNEL_ID': [1], 'PROMO_ID': [1.0],
+                          'PERIOD_START_DT': [pd.Timestamp('2024-02-01')], 'PERIOD_END_DT': [pd.Timestamp('2024-02-10')],
+                          'PROMO_PRICE': [5.0]})
+    PRODUCT_ATTR = pd.DataFrame({'PRODUCT_ID': [0, 1], 'PRODUCT_ATTR_NAME': 'SEASONAL', 'PRODUCT_ATTR_VALUE': 'Y'})
+    SEASONAL_FLAG_CONFIG = pd.DataFrame({'PRODUCT_ATTR_NAME': ['SEASONAL'], 'PRODUCT_ATTR_VALUE': ['Y']})
+    DR_PARAMETERS = {'DR_PERIOD_LENGTH': 14, 'MIN_SALES_QTY_DAY': 200, 'DEF_INV_TRSHD': 5, 'DEF_QTY_TRSHD': 30,
+                     'MIN_ND_DAYS': 5, 'DR_LIFECYCLE_MARGIN': 0, 'MIN_PROLONG_HIST_MONTH': 1, 'MAX_PROLONG_HIST_MONTH': 24}
+
+    def full_run(end, **paths):
+        known = lambda df, col: df[df[col] <= end]
+        return demand_restoration_algorithm(DR_PARAMETERS, {}, None, (end - IB_HIST_START_DT).days, IB_HIST_START_DT, end,
+                                            {}, known(STOCK, 'PERIOD_DT'), PROMO, known(SALES, 'PERIOD_DT'),
+                                            known(FORECAST_FLAG, 'PERIOD_START_DT'), None, 80, PRODUCT_ATTR,
+                                            SEASONAL_FLAG_CONFIG, return_state=True, **paths)
+
+    def incremental_run(RESTORED_DEMAND, ROLLING_STATE, **paths):
+        return incremental_demand_restoration(DR_PARAMETERS, depth, IB_HIST_START_DT, IB_HIST_END_DT, STOCK, PROMO,
+                                              SALES, FORECAST_FLAG, 80, PRODUCT_ATTR, SEASONAL_FLAG_CONFIG,
+                                              RESTORED_DEMAND, ROLLING_STATE, **paths)
+
+    path = tempfile.mkdtemp()
+    paths = {'output_path': path + '/restored_demand', 'state_path': path + '/rolling_state',
+             'seasonal_path': path + '/seasonal_demand'}
+    RESTORED_DEMAND, state = full_run(previous_end, **paths)
+    incremental, state = incremental_run(RESTORED_DEMAND, state)
+    expected, _ = full_run(IB_HIST_END_DT)
+
+    # only the month of the update window start on and the seasonal series are returned
+    seasonal = RESTORED_DEMAND['PRODUCT_ID'].isin([0, 1])
+    month_start = datetime.date(2024, 4, 1)
+    assert (pd.to_datetime(incremental.loc[~incremental['PRODUCT_ID'].isin([0, 1]), 'PERIOD_DT']).dt.date >= month_start).all()
+    incremental = pd.concat([RESTORED_DEMAND[~seasonal & (RESTORED_DEMAND['PERIOD_DT'] < month_start)], incremental])
+
+    cols = KEYS + ['PERIOD_DT', 'TGT_QTY_R']
+    actual = incremental[cols].sort_values(KEYS + ['PERIOD_DT'], ignore_index=True)
+    expected = expected[cols].sort_values(KEYS + ['PERIOD_DT'], ignore_index=True)
+    print(f"{len(actual)} restored rows, {expected['TGT_QTY_R'].isna().sum()} missing")
+    pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
+    # seasonal series are extended to the month of the new history end
+    assert set(expected['PRODUCT_ID']) >= {0, 1} and (expected['PERIOD_DT'] == month_start).any()
+    assert not state.duplicated(KEYS + ['PERIOD_DT']).any()
+
+    # the previous run read from and the next one written to storage datasets, earlier months are kept
+    incremental_run(paths['output_path'], paths['state_path'], **paths)
+    stored = pd.concat([read_table(paths['output_path']), read_table(paths['seasonal_path'])])
+    pd.testing.assert_frame_equal(stored[cols].sort_values(KEYS + ['PERIOD_DT'], ignore_index=True),
+                                  actual, check_dtype=False)
+    pd.testing.assert_frame_equal(read_table(paths['state_path']), state, check_dtype=False)
+    try:
+        incremental_run(paths['output_path'], paths['state_path'], output_path=paths['output_path'])
+        assert False
+    except ValueError:
+        pass
+
+    print("incremental demand restoration test complete")
+
+
+def test_add_stock_data_and_promo_flag():
+
+    print("promo attribution test started")
+
+    T1 = generate_daily_history()
+    T1['PERIOD_END_DT'] = pd.Timestamp('2024-03-31')
+    T1['PROMO_FLG'] = np.random.choice([0, 1], p=[0.5, 0.5], size=len(T1))
+    T1['PROMO_ID'] = np.where(T1['PROMO_FLG'] == 1, np.random.choice([1, 2], size=len(T1)), np.nan)
+    STOCK = T1[KEYS[:2] + ['PERIOD_DT']].sample(frac=0.9).assign(STOCK_QTY=lambda df: np.random.uniform(0, 50, len(df)))
+    STOCK['PERIOD_DT'] = STOCK['PERIOD_DT'].dt.strftime('%Y-%m-%d')
+    # two windows of every promo per series
+    PROMO = T1[KEYS].drop_duplicates().merge(pd.DataFrame({'PROMO_ID': [1, 1, 2]}), how='cross')
+    PROMO['PERIOD_START_DT'] = pd.Timestamp('2024-01-05') + pd.to_timedelta(np.random.randint(0, 40, len(PROMO)), unit='D')
+    PROMO['PERIOD_END_DT'] = PROMO['PERIOD_START_DT'] + pd.to_timedelta(np.random.randint(0, 10, len(PROMO)), unit='D')
+    PROMO['PROMO_PRICE'] = np.random.uniform(1, 10, len(PROMO))
+    PROMO = PROMO.sample(frac=1)
+
+    T3 = add_stock_data_and_promo_flag(T1, STOCK.copy(), PROMO)
+    T2 = T1.merge(STOCK.assign(PERIOD_DT=pd.to_datetime(STOCK['PERIOD_DT'])), on=KEYS[:2] + ['PERIOD_DT'])
+    print(f"{len(T3)} rows, {T3['PROMO_PRICE'].notna().sum()} in a promo window")
+    pd.testing.assert_frame_equal(T3[T2.columns], T2)
+
+    # reference: windows covering each row
+    merged = T2.reset_index().merge(PROMO, on=KEYS + ['PROMO_ID'], suffixes=['', '_promo'])
+    merged = merged[(merged['PERIOD_DT'] >= merged['PERIOD_START_DT']) & (merged['PERIOD_DT'] <= merged['PERIOD_END_DT_promo'])]
+    assert set(merged['index']) == set(np.flatnonzero(T3['PROMO_PRICE'].notna()))
+    assert ((T3['PERIOD_DT'] >= T3['PERIOD_START_DT']) & (T3['PERIOD_DT'] <= T3['PERIOD_END_DT_promo'])).sum() == merged['index'].nunique()
+
+    # only the promo window columns are added, no step reads per series promo statistics
+    assert T3.columns.tolist() == T2.columns.tolist() + ['PERIOD_START_DT', 'PERIOD_END_DT_promo', 'PROMO_PRICE']
+
+    print("promo attribution test complete")
+
+
+def test_dense_demand():
+
+    print("dense demand test started")
+
+    T3 = generate_daily_history(missing=0.1)
+    T3['TGT_QTY'] = np.round(T3['TGT_QTY'])
+    T3['STOCK_QTY'] = np.random.randint(0, 20, len(T3)).astype(float)
+    T3['PROMO_FLG'] = np.random.choice([0, 1], p=[0.8, 0.2], size=len(T3))
+    T3 = T3.drop(columns='DEFICIT_FLG1')
+
+    # long <-> dense round trip
+    dense = DenseDemand.from_long(T3, flags=['PROMO_FLG'])
+    T3_sorted = T3.sort_values(KEYS + ['PERIOD_DT'], ignore_index=True)
+    df_long = dense.to_long()
+    pd.testing.assert_frame_equal(df_long, T3_sorted, check_dtype=False)
+    print(f"dense {dense.shape}, {dense.nbytes / len(T3):.1f} bytes per series-day, "
+          f"long {T3.memory_usage(deep=True).sum() / len(T3):.1f}")
+    assert T3.memory_usage(deep=True).sum() > 5 * dense.nbytes
+    flags = np.random.random((3, 13)) < 0.5
+    assert np.array_equal(unpack_flags(pack_flags(flags), 13), flags)
+
+    # same flags, statistics and restored demand as the long steps, missing TGT_QTY included
+    DR_PARAMETERS = {'DR_PERIOD_LENGTH': 14, 'MIN_SALES_QTY_DAY': 200, 'DEF_INV_TRSHD': 5,
+                     'DEF_QTY_TRSHD': 30, 'MIN_ND_DAYS': 5}
+    T41 = primiry_deficit_flg_def(T3.copy(), DR_PARAMETERS)
+    T42 = secondary_deficit_flg_def(T41, datetime.datetime(2024, 1, 1), datetime.datetime(2024, 2, 29), 0, 80, DR_PARAMETERS)
+    T43 = demand_restoration_on_stock_def(T42, DR_PARAMETERS).sort_values(KEYS + ['PERIOD_DT'], ignore_index=True)
+
+    df_dense = restore_demand(dense, DR_PARAMETERS, 80).to_long()
+    for col in ['CLOSED_FLG', 'DEFICIT_FLG1', 'DEFICIT_FLG2']:
+        assert np.array_equal(df_dense[col], T43[col]), col
+    # the long steps fill a missing window mean with 0 and std with 1
+    df_dense = df_dense.fillna({'mean': 0, 'std': 1})
+    for col in ['mean', 'std', 'COUNT_NONDEFECIT_DAYS', 'TGT_QTY', 'TGT_QTY_R']:
+        assert np.allclose(df_dense[col], T43[col], rtol=1e-5, equal_nan=True), col
+    print(f"restored {(df_dense['TGT_QTY_R'] != df_dense['TGT_QTY']).sum()} of {len(df_dense)} series-days")
+
+    stats = rolling_stats(dense, 7)
+    assert stats['mean'].dtype == np.float32 and stats['mean'].shape == dense.shape
+
+    print("dense demand test complete")
+
+
+def test_history_extending():
+
+    print("history extending test started")
+
+    T43 = generate_daily_history(num_series=20, num_days=400)
+    # product 0 ended two years before the history end, product 1 has two months of history
+    T43.loc[T43['PRODUCT_ID'] == 0, 'PERIOD_DT'] -= pd.Timedelta(days=730)
+    T43['PERIOD_END_DT'] = T43['PERIOD_DT']
+    T43['TGT_QTY_R'] = T43['TGT_QTY']
+    T43 = T43[~((T43['PRODUCT_ID'] == 1) & (T43['PERIOD_DT'] < '2024-12-01'))]
+    PRODUCT_ATTR = pd.DataFrame({'PRODUCT_ID': [0, 1, 2, 3], 'PRODUCT_ATTR_NAME': 'SEASONAL', 'PRODUCT_ATTR_VALUE': 'Y'})
+    SEASONAL_FLAG_CONFIG = pd.DataFrame({'PRODUCT_ATTR_NAME': ['SEASONAL'], 'PRODUCT_ATTR_VALUE': ['Y']})
+    DR_PARAMETERS = {'MIN_PROLONG_HIST_MONTH': 3, 'MAX_PROLONG_HIST_MONTH': 24}
+    IB_HIST_END_DT = datetime.datetime(2025, 1, 15)
+
+    df = history_extending(T43, PRODUCT_ATTR, SEASONAL_FLAG_CONFIG, DR_PARAMETERS, IB_HIST_END_DT)
+    extended = df[df['PRODUCT_ID'].isin([0, 1, 2, 3])]
+    print(f"{extended[KEYS].drop_duplicates().shape[0]} series extended to {len(extended)} rows")
+
+    # only products 2 and 3 qualify, 24 month starts up to January 2025 filled with the median
+    assert set(extended['PRODUCT_ID']) == {2, 3}
+    assert len(df[~df['PRODUCT_ID'].isin([0, 1, 2, 3])]) == (~T43['PRODUCT_ID'].isin([0, 1, 2, 3])).sum()
+    for key, group in extended.groupby(KEYS):
+        assert group['PERIOD_DT'].tolist() == list(pd.date_range('2023-02-01', '2025-01-01', freq='MS'))
+        series = T43[(T43[KEYS] == key).all(axis=1)]
+        assert (group['TGT_QTY_R'] == series['TGT_QTY_R'].median()).all()
+
+    # same inputs give the same output on any day
+    pd.testing.assert_frame_equal(df, history_extending(T43, PRODUCT_ATTR, SEASONAL_FLAG_CONFIG, DR_PARAMETERS, IB_HIST_END_DT))
+
+    print("history extending test complete")
+
+
+def _partition_totals(cube, rows):
+    """per-series TGT_QTY_R sums read by a worker from the attached cube"""
+    return cube.series.iloc[rows].index.to_numpy(), np.nansum(cube.values['TGT_QTY_R'][rows], axis=1)
+
+
+def test_demand_cube():
+
+    print("demand cube test started")
+
+    T3 = generate_daily_history(num_series=40)
+    T3['STOCK_QTY'] = np.random.randint(0, 20, len(T3)).astype(float)
+    T3['PROMO_FLG'] = np.random.choice([0, 1], p=[0.8, 0.2], size=len(T3))
+    DR_PARAMETERS = {'DR_PERIOD_LENGTH': 14, 'MIN_SALES_QTY_DAY': 200, 'DEF_INV_TRSHD': 5,
+                     'DEF_QTY_TRSHD': 30, 'MIN_ND_DAYS': 5}
+
+    path = tempfile.mkdtemp() + '/restored_demand'
+    restored = restore_demand(DenseDemand.from_long(T3, flags=['PROMO_FLG']), DR_PARAMETERS, 80)
+    save_cube(restored, path)
+
+    # memory-mapped round trip
+    cube = open_cube(path)
+    assert isinstance(cube.values['TGT_QTY_R'], np.memmap) and not cube.values['TGT_QTY_R'].flags.writeable
+    pd.testing.assert_frame_equal(cube.to_long(), restored.to_long())
+    assert isinstance(cube.take(slice(0, 10)).values['TGT_QTY'], np.memmap)
+
+    # sidecar key index, float keys match and unknown series are -1
+    keys = cube.series.sample(frac=1).astype(float)
+    assert (cube.rows(keys) == keys.index.to_numpy()).all()
+    assert cube.rows(pd.DataFrame({'PRODUCT_ID': [99], 'LOCATION_ID': [0], 'CUSTOMER_ID': [1], 'DISTR_CHANNEL_ID': [1]})).tolist() == [-1]
+
+    # one open cube per process, reopened when rewritten
+    assert attach_cube(path) is attach_cube(path)
+    save_cube(restored.take(slice(0, 5)), path)
+    assert attach_cube(path).shape[0] == 5
+    save_cube(restored, path)
+
+    # workers read the attached cube
+    results = map_cube(_partition_totals, path, n_workers=2, n_partitions=3)
+    totals = np.zeros(len(cube.series))
+    for rows, sums in results:
+        totals[rows] = sums
+    assert np.allclose(totals, np.nansum(restored.values['TGT_QTY_R'], axis=1))
+
+    # restoration of a sales cube partitioned by location equals the single process one
+    save_cube(DenseDemand.from_long(T3, flags=['PROMO_FLG']), path)
+    df_parallel = parallel_restore_demand(path, DR_PARAMETERS, 80, n_workers=2)
+    pd.testing.assert_frame_equal(df_parallel, restored.to_long())
+    print(f"{len(df_parallel)} series-days restored from {path}")
+
+    print("demand cube test complete")
+
+
+if __name__ == '__main__':
+    test_rolling_deficit_stats()
+    test_secondary_deficit_flg_def()
+    test_incremental_rolling_state()
+    test_incremental_demand_restoration()
+    test_add_stock_data_and_promo_flag()
+    test_dense_demand()
+    test_history_extending()
+    test_demand_cube()
+
+    df = generate_daily_history()
+    write_table(build_rolling_state(df, datetime.datetime(2024, 2, 29), 10, {'DR_PERIOD_LENGTH': 14}), 'rolling_state_output')
+    print("\nrolling state saved to rolling_state_output")
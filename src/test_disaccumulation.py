@@ -0,0 +1,126 @@
+import pandas as pd
+import numpy as np
+import logging
+from disaccumulation import Disaccumulation, logging_progress
+from storage import write_table
+
+
+def generate_aggregated_forecast(num_rows=20):
+
+    df = pd.DataFrame({
+        'PRODUCT_LVL_ID6': np.arange(600001, 600001 + num_rows),
+        'LOCATION_LVL_ID8': np.arange(800001, 800001 + num_rows),
+        'PERIOD_DT': pd.date_range(start='2024-01-01', periods=num_rows, freq='MS') + pd.Timedelta('1D'),
+        'PERIOD_END_DT': pd.date_range(start='2024-02-01', periods=num_rows, freq='MS'),
+        'VF_FORECAST_VALUE': np.random.uniform(0, 100, num_rows),
+        'ML_FORECAST_VALUE': np.random.uniform(0, 100, num_rows),
+        'HYBRID_FORECAST_VALUE': np.random.uniform(0, 100, num_rows)
+    })
+
+    return df
+
+
+def test_split_forecasts():
+
+    print("disaccumulation test started")
+
+    df_input = generate_aggregated_forecast()
+
+    for out_time_lvl in ['D', 'W', 'W-WED', 'M']:
+        df_output = Disaccumulation(df_input, out_time_lvl).split_forecasts()
+        print(f"\n{out_time_lvl} {len(df_output)} records")
+        print(df_output[['PRODUCT_LVL_ID6', 'PERIOD_DT', 'PERIOD_END_DT', 'HYBRID_FORECAST_VALUE']].head(3).to_string(index=False))
+
+        periods = df_output['PERIOD_DT'].dt.to_period(out_time_lvl)
+        assert (periods == df_output['PERIOD_END_DT'].dt.to_period(out_time_lvl)).all()
+
+        days = (df_output['PERIOD_END_DT'] - df_output['PERIOD_DT']).dt.days + 1
+        total_days = (df_input['PERIOD_END_DT'] - df_input['PERIOD_DT']).dt.days + 1
+        assert (days.groupby(df_output['PRODUCT_LVL_ID6']).sum().to_numpy() == total_days.to_numpy()).all()
+
+        for col in ['VF_FORECAST_VALUE', 'ML_FORECAST_VALUE', 'HYBRID_FORECAST_VALUE']:
+            totals = df_output.groupby('PRODUCT_LVL_ID6')[col].sum().to_numpy()
+            assert np.allclose(totals, df_input[col].to_numpy())
+
+    print("\ndisaccumulation test complete")
+
+
+def test_iter_split_forecasts():
+
+    print("streaming disaccumulation test started")
+
+    df_input = generate_aggregated_forecast()
+
+    df_full = Disaccumulation(df_input, 'D').split_forecasts()
+    chunks = list(Disaccumulation(df_input, 'D').iter_split_forecasts(chunk_size=100))
+
+    print(f"{len(chunks)} chunks, sizes {[len(chunk) for chunk in chunks]}")
+    assert max(len(chunk) for chunk in chunks) <= 100 + 31
+    pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), df_full)
+
+    print("streaming disaccumulation test complete")
+
+
+def test_forecast_cols():
+
+    print("custom forecast columns test started")
+
+    df_input = generate_aggregated_forecast()
+    df_input['TS_FORECAST_VALUE'] = np.random.uniform(0, 100, len(df_input))
+
+    df_output = Disaccumulation(df_input, 'W', forecast_cols=['TS_FORECAST_VALUE', 'NO_SUCH_VALUE']).split_forecasts()
+    totals = df_output.groupby('PRODUCT_LVL_ID6')['TS_FORECAST_VALUE'].sum().to_numpy()
+    assert np.allclose(totals, df_input['TS_FORECAST_VALUE'].to_numpy())
+    # columns not listed are repeated per period, not split
+    first_rows = df_output.drop_duplicates('PRODUCT_LVL_ID6')
+    assert np.array_equal(first_rows['ML_FORECAST_VALUE'].to_numpy(), df_input['ML_FORECAST_VALUE'].to_numpy())
+
+    df_daily = Disaccumulation(df_input, 'D').split_forecasts()
+    for out_time_lvl in ['D', 'W', 'M']:
+        assert Disaccumulation(df_daily, out_time_lvl).check_granulatiry()
+    assert not Disaccumulation(df_input, 'M').check_granulatiry()
+    df_monthly = Disaccumulation(df_input, 'M').split_forecasts()
+    assert Disaccumulation(df_monthly, 'M').check_granulatiry()
+    assert not Disaccumulation(df_monthly, 'W').check_granulatiry()
+
+    print("custom forecast columns test complete")
+
+
+def test_progress():
+
+    print("progress callback test started")
+
+    df_input = generate_aggregated_forecast()
+    reports = []
+
+    def collect(stage, metrics):
+        reports.append((stage, metrics))
+
+    df_output = Disaccumulation(df_input, 'D', progress=collect).split_forecasts()
+    print([stage for stage, _ in reports])
+    assert [stage for stage, _ in reports] == ['check_granularity', 'change_granularity', 'share_forecast', 'split_forecasts']
+    assert reports[-1][1]['rows_in'] == len(df_input)
+    assert reports[-1][1]['rows_out'] == len(df_output)
+    assert all(metrics['elapsed'] >= 0 for _, metrics in reports)
+
+    reports.clear()
+    chunks = list(Disaccumulation(df_input, 'D', progress=collect).iter_split_forecasts(chunk_size=100))
+    chunk_reports = [metrics for stage, metrics in reports if stage == 'chunk']
+    assert len(chunk_reports) == len(chunks)
+    assert sum(metrics['rows_in'] for metrics in chunk_reports) == len(df_input)
+    assert reports[-1][0] == 'split_forecasts'
+    assert reports[-1][1]['chunks'] == len(chunks)
+    assert reports[-1][1]['rows_out'] == len(df_output)
+
+    logging.basicConfig(level=logging.INFO)
+    Disaccumulation(df_input, 'M', progress=logging_progress()).split_forecasts()
+
+    print("progress callback test complete")
+
+
+if __name__ == '__main__':
+    test_split_forecasts()
+    test_iter_split_forecasts()
+    test_forecast_cols()
+    test_progress()
+    write_table(Disaccumulation(generate_aggregated_forecast(), 'D').split_forecasts(), 'disaccumulated_forecast_output', product_lvl=6)
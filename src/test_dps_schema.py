@@ -0,0 +1,111 @@
+import os
+import shutil
+import tempfile
+import pandas as pd
+from dps_schema import DPS_TABLES, CACHE_DIR, load_table, iter_table, parse_dates, SAS_DTTM_FORMAT, SHORT_DATE_FORMAT
+
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+
+
+def copy_data():
+    data_path = os.path.join(tempfile.mkdtemp(), 'data')
+    shutil.copytree(DATA_PATH, data_path, ignore=shutil.ignore_patterns(CACHE_DIR))
+    return data_path
+
+
+def test_parse_dates():
+
+    print("dps date parsing test started")
+
+    df = pd.DataFrame({
+        'OPEN_DTTM': ['08MAR2015:17:08:41', '01JUL2021:14:31:07', None],
+        'CLOSE_DTTM': ['01JAN5999:00:00:00', '31DEC2021:00:00:00', None],
+        'PERIOD_DT': ['10-Nov-19', '3-Nov-19', '28-Feb-21']
+    })
+    df = parse_dates(df, {'OPEN_DTTM': SAS_DTTM_FORMAT, 'CLOSE_DTTM': SAS_DTTM_FORMAT, 'PERIOD_DT': SHORT_DATE_FORMAT})
+    print(df.to_string(index=False))
+
+    assert df['OPEN_DTTM'].iloc[0] == pd.Timestamp('2015-03-08 17:08:41')
+    assert pd.isna(df['CLOSE_DTTM'].iloc[0])
+    assert df['CLOSE_DTTM'].iloc[1] == pd.Timestamp('2021-12-31')
+    assert list(df['PERIOD_DT']) == [pd.Timestamp('2019-11-10'), pd.Timestamp('2019-11-03'), pd.Timestamp('2021-02-28')]
+
+    print("dps date parsing test complete")
+
+
+def test_load_tables():
+
+    print("dps table loading test started")
+
+    data_path = copy_data()
+
+    for table_name, schema in DPS_TABLES.items():
+        df = load_table(table_name, data_path)
+        print(f"{table_name} {df.shape}")
+        assert list(df.columns) == list(schema['columns'])
+        for col, dtype in schema['columns'].items():
+            if dtype == 'datetime':
+                assert str(df[col].dtype) == 'datetime64[us]', (table_name, col)
+            elif not df.empty:
+                assert str(df[col].dtype) == dtype, (table_name, col, df[col].dtype)
+        assert set(schema['keys']) <= set(schema['columns'])
+
+    print("dps table loading test complete")
+
+
+def test_sidecar_cache():
+
+    print("dps sidecar cache test started")
+
+    data_path = copy_data()
+    cache_path = os.path.join(data_path, CACHE_DIR, 'DPS_STOCK.parquet')
+
+    df = load_table('DPS_STOCK', data_path)
+    assert os.path.exists(cache_path)
+    cache_mtime = os.stat(cache_path).st_mtime_ns
+
+    pd.testing.assert_frame_equal(load_table('DPS_STOCK', data_path), df)
+    assert os.stat(cache_path).st_mtime_ns == cache_mtime
+    projected = load_table('DPS_STOCK', data_path, columns=['PRODUCT_ID', 'STOCK_QTY'])
+    pd.testing.assert_frame_equal(projected, df[['PRODUCT_ID', 'STOCK_QTY']])
+
+    # a changed csv invalidates the sidecar
+    csv_path = os.path.join(data_path, 'DPS_STOCK.csv')
+    with open(csv_path) as file:
+        lines = file.readlines()
+    with open(csv_path, 'w') as file:
+        file.writelines(lines[:-1])
+    assert len(load_table('DPS_STOCK', data_path)) == len(df) - 1
+
+    print("dps sidecar cache test complete")
+
+
+def test_iter_table():
+
+    print("dps chunked reading test started")
+
+    data_path = copy_data()
+    columns = ['PRODUCT_ID', 'LOCATION_ID', 'PERIOD_START_DT', 'PRICE_TYPE', 'PRICE']
+
+    # from the csv before the sidecar exists, then from the sidecar
+    for source in ['csv', 'sidecar']:
+        chunks = list(iter_table('DPS_PRICE', data_path, columns, chunk_size=5000))
+        df = load_table('DPS_PRICE', data_path, columns)
+        print(f"{source} {len(chunks)} chunks")
+        assert max(len(chunk) for chunk in chunks) <= 5000
+        # categories are those of the chunk
+        for chunk in chunks:
+            assert list(chunk.columns) == columns and isinstance(chunk['PRICE_TYPE'].dtype, pd.CategoricalDtype)
+            assert chunk.drop(columns='PRICE_TYPE').dtypes.equals(df.drop(columns='PRICE_TYPE').dtypes)
+        streamed = pd.concat(chunks, ignore_index=True).astype({'PRICE_TYPE': str})
+        pd.testing.assert_frame_equal(streamed, df.astype({'PRICE_TYPE': str}))
+
+    print("dps chunked reading test complete")
+
+
+if __name__ == '__main__':
+    test_parse_dates()
+    test_load_tables()
+    test_sidecar_cache()
+    test_iter_table()
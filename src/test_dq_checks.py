@@ -0,0 +1,219 @@
+import os
+import sys
+import tempfile
+import importlib.util
+import pandas as pd
+import numpy as np
+
+
+spec = importlib.util.spec_from_file_location('dq_checks', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dq checks.py'))
+dq_checks = importlib.util.module_from_spec(spec)
+# registered so that process pool workers can unpickle its functions
+sys.modules['dq_checks'] = dq_checks
+spec.loader.exec_module(dq_checks)
+
+
+def generate_dq_data(num_products=20, num_days=10):
+
+    data_path = tempfile.mkdtemp() + '/'
+    dates = pd.date_range('2024-01-01', periods=num_days).strftime('%Y-%m-%d')
+
+    sales = pd.DataFrame({
+        'PRODUCT_ID': np.repeat(np.arange(num_products), num_days),
+        'LOCATION_ID': 1,
+        'PERIOD_DT': np.tile(dates, num_products),
+        'SALES_QTY': np.random.randint(-5, 100, num_products * num_days)
+    })
+    # products 15+ have no stock, product 0 has stock on its first day only
+    stock = sales[(sales['PRODUCT_ID'] < 15) & ((sales['PRODUCT_ID'] > 0) | (sales['PERIOD_DT'] == dates[0]))]
+    stock = stock.drop(columns='SALES_QTY').assign(STOCK_QTY=np.random.randint(-5, 100, len(stock)))
+    price = pd.DataFrame({'PRODUCT_ID': np.arange(num_products + 5), 'PRICE': np.random.uniform(-1, 10, num_products + 5)})
+    product = pd.DataFrame({'PRODUCT_LVL_ID1': 1, 'PRODUCT_ID': np.arange(num_products + 5)})
+
+    for name, df in [('SALES', sales), ('STOCK', stock), ('PRICE', price), ('PRODUCT', product)]:
+        df.to_csv(data_path + name + '.csv', index=False)
+
+    return data_path
+
+
+def make_dq(data_path):
+
+    return dq_checks.DQ(
+        check_id=1, check_name='input dq', client='test',
+        input_tables={
+            'val_range': [('SALES', 'SALES_QTY'), ('PRICE', 'PRICE')],
+            'cross_consistency': ['SALES', 'STOCK', 'PRICE'],
+            'time_cross_consistency': [['SALES', 'STOCK']]
+        },
+        th_values={'val_range': 0, 'time_cross_consistency': 0},
+        lvl_data={'PRODUCT': 'PRODUCT'},
+        data_path=data_path
+    )
+
+
+def test_plan():
+
+    print("dq plan test started")
+
+    dq = make_dq(generate_dq_data())
+    plan = dq.plan()
+    print(plan)
+
+    assert plan['SALES'] == ['PRODUCT_ID', 'LOCATION_ID', 'PERIOD_DT', 'SALES_QTY']
+    assert plan['STOCK'] == ['PRODUCT_ID', 'LOCATION_ID', 'PERIOD_DT']
+    assert plan['PRICE'] == ['PRODUCT_ID', 'PRICE']
+
+    print("dq plan test complete")
+
+
+def test_single_scan():
+
+    print("dq single scan test started")
+
+    data_path = generate_dq_data()
+    dq = make_dq(data_path)
+
+    reads = []
+    read_table = dq.read_table
+    dq.read_table = lambda table_name, columns=None: reads.append(table_name) or read_table(table_name, columns)
+    dq.check()
+    print(f"reads {reads}")
+    assert sorted(reads) == ['PRICE', 'SALES', 'STOCK']
+
+    # same output as running the checks one by one on full tables
+    dq_single = make_dq(data_path)
+    dq_single.check_val_range(dq_single.input_tables['val_range'], dq_single.th_values['val_range'])
+    dq_single.check_cross_consistency(dq_single.input_tables['cross_consistency'])
+    dq_single.check_time_cross_consistency(dq_single.input_tables['time_cross_consistency'], 0)
+    dq_single.format_output(dq_single.lvl_data)
+
+    output = dq.data_quality_output
+    print(output['WARNING_TYPE'].value_counts().to_string())
+    pd.testing.assert_frame_equal(output, dq_single.data_quality_output[output.columns])
+    assert (output['WARNING_TYPE'] == 'val_range').sum() > 0
+    assert dq.results == []
+
+    print("dq single scan test complete")
+
+
+def test_cross_consistency_keys():
+
+    print("dq cross consistency keys test started")
+
+    data_path = generate_dq_data()
+    pd.DataFrame({'WEEK': [1, 2], 'DAY_OF_WEEK': [1, 2]}).to_csv(data_path + 'CALENDAR.csv', index=False)
+    dq = make_dq(data_path)
+    tables = ['SALES', 'CALENDAR', 'STOCK', 'PRICE']
+    output = dq.check_cross_consistency(tables)
+    print(output.groupby('INPUT_TABLE').size().to_string())
+
+    # a pair without common id columns (SALES && CALENDAR) is skipped, the next pairs are still checked
+    for df1_name, df2_name in [('SALES', 'STOCK'), ('PRICE', 'SALES'), ('PRICE', 'STOCK')]:
+        df1, df2 = dq.table(df1_name), dq.table(df2_name)
+        cols = [col for col in df1.columns if col in df2.columns and 'ID' in col]
+        merged = df1.drop_duplicates(cols).merge(df2.drop_duplicates(cols), on=cols, how='left', indicator=True)
+        expected = merged[merged['_merge'] == 'left_only'][cols]
+        result = output[output['INPUT_TABLE'] == df1_name + ' && ' + df2_name][cols]
+        assert len(expected) > 0
+        pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+    assert not output['INPUT_TABLE'].str.contains('CALENDAR').any()
+
+    # equal keys hash equally whatever the column dtypes
+    keys = pd.DataFrame({'PRODUCT_ID': [1, 2, None], 'LOCATION_ID': ['a', 'b', None]})
+    hashes = dq_checks.key_hashes(keys, ['PRODUCT_ID', 'LOCATION_ID'])
+    for product_dtype, location_dtype in [('Int32', 'category'), ('float32', 'object')]:
+        other = keys.astype({'PRODUCT_ID': product_dtype, 'LOCATION_ID': location_dtype})
+        assert np.array_equal(dq_checks.key_hashes(other, ['PRODUCT_ID', 'LOCATION_ID']), hashes)
+
+    print("dq cross consistency keys test complete")
+
+
+def test_parallel_run():
+
+    print("dq parallel run test started")
+
+    data_path = generate_dq_data()
+    dq_serial = make_dq(data_path)
+    dq_serial.check()
+
+    for executor in ['thread', 'process']:
+        dq = make_dq(data_path)
+        output, report = dq.run(n_workers=2, executor=executor, track_memory=True)
+        print(executor)
+        print(report.to_string(index=False))
+        pd.testing.assert_frame_equal(output, dq_serial.data_quality_output)
+
+        # one row per val_range column, cross_consistency pair and time_cross_consistency pair
+        assert report['CHECK'].tolist() == ['val_range'] * 2 + ['cross_consistency'] * 6 + ['time_cross_consistency']
+        assert report['VIOLATIONS'].sum() == len(output)
+        assert (report.loc[report['CHECK'] == 'val_range', 'ROWS_SCANNED'].to_numpy() == [200, 25]).all()
+        assert (report['WALL_TIME'] >= 0).all() and (report['PEAK_MEMORY'] > 0).all()
+        assert report.attrs['WALL_TIME'] >= report.attrs['LOAD_TIME']
+
+    output, report = make_dq(data_path).run(n_workers=1)
+    pd.testing.assert_frame_equal(output, dq_serial.data_quality_output)
+    assert report['PEAK_MEMORY'].isna().all()
+
+    print("dq parallel run test complete")
+
+
+def test_fast_mode():
+
+    print("dq fast mode test started")
+
+    data_path = generate_dq_data()
+    _, report = make_dq(data_path).run(n_workers=1)
+
+    # without limits and sampling the counts are those of the full checks, streamed or not
+    for chunk_size in [None, 30]:
+        fast = make_dq(data_path).check_fast(chunk_size=chunk_size)
+        print(fast.to_string(index=False))
+        assert fast['VIOLATIONS'].tolist() == report['VIOLATIONS'].tolist()
+        assert fast['ROWS_SCANNED'].tolist() == report['ROWS_SCANNED'].tolist()
+        assert not fast['EARLY_EXIT'].any() and (fast['VIOLATION_RATE_MARGIN'].fillna(0) == 0).all()
+        assert (fast['BREACHED'] == (fast['VIOLATIONS'] > 0)).all()
+
+    # a check stops at its limit, the remaining pairs of that check are skipped
+    fast = make_dq(data_path).check_fast(limits={'val_range': 1, 'cross_consistency': 2}, chunk_size=30)
+    print(fast.to_string(index=False))
+    val_range = fast[fast['CHECK'] == 'val_range']
+    assert len(val_range) == 1 and val_range['EARLY_EXIT'].all() and val_range['ROWS_SCANNED'].iloc[0] < 200
+    # whole chunks are checked, so a check can go past its limit within the last chunk
+    cross = fast[fast['CHECK'] == 'cross_consistency']
+    assert len(cross) == 1 and cross['VIOLATIONS'].iloc[0] >= 2 and cross['EARLY_EXIT'].all()
+    assert val_range['BREACHED'].all() and cross['BREACHED'].all()
+    # a check under its limit is not breached
+    fast = make_dq(data_path).check_fast(limits=10 ** 6)
+    assert not fast['BREACHED'].any() and not fast['EARLY_EXIT'].any()
+    time_cross = report.loc[report['CHECK'] == 'time_cross_consistency', 'VIOLATIONS'].tolist()
+    assert fast.loc[fast['CHECK'] == 'time_cross_consistency', 'VIOLATIONS'].tolist() == time_cross
+
+    # the same product series are sampled in every table
+    full = make_dq(data_path).check_fast(sample_frac=1.0)
+    assert full['VIOLATIONS'].tolist() == report['VIOLATIONS'].tolist()
+    sampled = make_dq(data_path).check_fast(sample_frac=0.5, chunk_size=30)
+    print(sampled.to_string(index=False))
+    assert (sampled['CHECKED'] <= full['CHECKED']).all() and sampled['CHECKED'].sum() < full['CHECKED'].sum()
+    assert sampled['VIOLATION_RATE'].between(0, 1).all() and (sampled['VIOLATION_RATE_MARGIN'].dropna() >= 0).all()
+    # sampling does not save reading the tables
+    assert sampled['ROWS_SCANNED'].tolist() == full['ROWS_SCANNED'].tolist()
+    pd.testing.assert_frame_equal(sampled, make_dq(data_path).check_fast(sample_frac=0.5))
+    # with sampling the limit applies to the estimated violations: 5 sampled ones estimate 10
+    sampled = make_dq(data_path).check_fast(limits={'val_range': 10}, sample_frac=0.5)
+    val_range = sampled[sampled['CHECK'] == 'val_range']
+    assert val_range['BREACHED'].any() == (val_range['VIOLATIONS'].sum() >= 5)
+
+    # the margin of the rate estimate is 0 without sampling and grows with the spread between series
+    assert dq_checks.rate_margin([10, 10], [1, 9], None) == 0
+    assert 0 < dq_checks.rate_margin([10, 10, 10], [4, 5, 6], 0.5) < dq_checks.rate_margin([10, 10, 10], [0, 5, 10], 0.5)
+    assert np.isnan(dq_checks.rate_margin([10], [1], 0.5))
+
+    print("dq fast mode test complete")
+
+
+if __name__ == '__main__':
+    test_plan()
+    test_single_scan()
+    test_cross_consistency_keys()
+    test_parallel_run()
+    test_fast_mode()
@@ -0,0 +1,149 @@
+import pandas as pd
+import numpy as np
+import os
+from forecast_flag import time_interval_utility, generate_input_unfolding, unfold_aggregated_data
+from intervals import interval_union
+from hierarchy import HierarchyIndex
+
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+
+
+def generate_lifecycle_intervals(num_keys=50, num_intervals=400):
+
+    start_dt = pd.Timestamp('2024-01-01') + pd.to_timedelta(np.random.randint(0, 365, num_intervals), unit='D')
+    df = pd.DataFrame({
+        'product_id': np.random.randint(0, num_keys, num_intervals),
+        'location_id': np.random.randint(0, 2, num_intervals),
+        'start_dt': start_dt,
+        'end_dt': start_dt + pd.to_timedelta(np.random.randint(0, 20, num_intervals), unit='D')
+    })
+    return df.sample(frac=1).reset_index(drop=True)
+
+
+def union_loop(df, keys, distance_tolerance=0):
+    """reference: intervals of every key merged one by one"""
+    rows = []
+    for key, group in df.groupby(keys):
+        islands = []
+        for start_dt, end_dt in group.sort_values('start_dt')[['start_dt', 'end_dt']].itertuples(index=False):
+            if islands and start_dt <= islands[-1][1] + pd.Timedelta(days=1 + distance_tolerance):
+                islands[-1][1] = max(islands[-1][1], end_dt)
+            else:
+                islands.append([start_dt, end_dt])
+        rows += [list(key) + island for island in islands]
+    return pd.DataFrame(rows, columns=keys + ['start_dt', 'end_dt'])
+
+
+def test_interval_union():
+
+    print("interval union test started")
+
+    df = generate_lifecycle_intervals()
+    keys = ['product_id', 'location_id']
+
+    for distance_tolerance in [0, 3]:
+        df_union = interval_union(df, keys, distance_tolerance=distance_tolerance)
+        print(f"tolerance {distance_tolerance}: {len(df)} intervals merged into {len(df_union)}")
+        pd.testing.assert_frame_equal(df_union, union_loop(df, keys, distance_tolerance))
+
+    # adjacent days are merged, a one day gap is not
+    df_small = pd.DataFrame({
+        'product_id': [1, 1, 1, 2],
+        'start_dt': pd.to_datetime(['2024-01-01', '2024-01-06', '2024-01-12', '2024-01-01']),
+        'end_dt': pd.to_datetime(['2024-01-05', '2024-01-10', '2024-01-15', '2024-01-31'])
+    })
+    df_union = interval_union(df_small, 'product_id')
+    assert df_union['start_dt'].tolist() == list(pd.to_datetime(['2024-01-01', '2024-01-12', '2024-01-01']))
+    assert df_union['end_dt'].tolist() == list(pd.to_datetime(['2024-01-10', '2024-01-15', '2024-01-31']))
+
+    # month granularity widens every interval to whole months
+    df_month = interval_union(df_small, 'product_id', granularity='M')
+    assert len(df_month) == 2 and (df_month['end_dt'] == pd.Timestamp('2024-01-31')).all()
+
+    print("interval union test complete")
+
+
+def test_time_interval_utility():
+
+    print("time interval utility test started")
+
+    df = generate_lifecycle_intervals()
+    df.loc[0, 'end_dt'] = pd.NaT
+
+    # every group is merged, not only the first one
+    df_dates = time_interval_utility(df, 'W', 0, 'product_id')
+    print(df_dates.head().to_string(index=False))
+    assert df_dates['product_id'].nunique() == df.dropna()['product_id'].nunique()
+    assert (df_dates['start_dt'].dt.dayofweek == 0).all() and (df_dates['end_dt'].dt.dayofweek == 6).all()
+    gaps = df_dates['start_dt'] - df_dates.groupby('product_id')['end_dt'].shift()
+    assert (gaps.dropna() > pd.Timedelta(days=1)).all()
+
+    print("time interval utility test complete")
+
+
+def test_unfold_aggregated_data():
+
+    print("unfolding test started")
+
+    mpInTable, mpInProduct, mpInLocation, mpInCustomer, mpInDistrChannel = generate_input_unfolding(200)
+    # two members per product node and an unknown product
+    mpInProduct = pd.concat([mpInProduct, mpInProduct.assign(PRODUCT_ID=mpInProduct['PRODUCT_ID'] + 1000)]).sample(frac=1)
+    mpInTable.loc[3, 'product_lvl_id'] = -1
+
+    df_merged = mpInTable.merge(mpInProduct, on=["product_lvl_id"], how="left")
+    df_merged = df_merged.merge(mpInLocation, on=["location_lvl_id"], how="left")
+    df_merged = df_merged.merge(mpInCustomer, on=["customer_lvl_id"], how="left")
+    df_merged = df_merged.merge(mpInDistrChannel, on=["distr_channel_lvl_id"], how="left")
+
+    df_unfolded = unfold_aggregated_data(mpInTable, mpInProduct, mpInLocation, mpInCustomer, mpInDistrChannel)
+    print(f"{len(mpInTable)} rows unfolded to {len(df_unfolded)}")
+    pd.testing.assert_frame_equal(df_unfolded, df_merged)
+
+    # only the needed columns, quadruples kept by a semi-join
+    mpInProduct['product_id'] = mpInProduct['PRODUCT_ID']
+    mpInCustomer['customer_id'] = mpInCustomer['customer_lvl_id']
+    mpInDistrChannel['distr_channel_id'] = mpInDistrChannel['distr_channel_lvl_id']
+    hierarchies = [mpInProduct, mpInLocation, mpInCustomer, mpInDistrChannel]
+    columns = {'product_lvl_id': ['product_id'], 'location_lvl_id': ['location_id'],
+               'customer_lvl_id': ['customer_id'], 'distr_channel_lvl_id': ['distr_channel_id']}
+    df_ids = unfold_aggregated_data(mpInTable, *hierarchies, columns=columns)
+    assert list(df_ids.columns) == list(mpInTable.columns) + ['product_id', 'location_id', 'customer_id', 'distr_channel_id']
+
+    # float keys match the int ones, duplicate quadruples do not repeat rows
+    quadruples = df_ids.iloc[::3, 4:].astype(float)
+    quadruples = pd.concat([quadruples, quadruples.head(5)])
+    df_kept = unfold_aggregated_data(mpInTable, *hierarchies, mpInQuadruple=quadruples, columns=columns)
+    pd.testing.assert_frame_equal(df_kept, df_ids.iloc[::3].reset_index(drop=True))
+
+    print("unfolding test complete")
+
+
+def test_dps_hierarchy_index():
+
+    print("dps hierarchy index test started")
+
+    product = HierarchyIndex.from_dps('PRODUCT', DATA_PATH)
+    members = product.members
+    lvl_ids = pd.concat([members[col] for col in product.lvl_cols]).dropna().unique()
+    print(f"{len(members)} products, {len(lvl_ids)} nodes on {len(product.lvl_cols)} levels")
+
+    rows, member_rows = product.gather(lvl_ids)
+    for i, lvl_id in enumerate(lvl_ids):
+        expected = np.flatnonzero((members[product.lvl_cols] == lvl_id).any(axis=1).to_numpy())
+        assert member_rows[rows == i].tolist() == expected.tolist()
+
+    # top node has every product, a product id unfolds to itself
+    top = pd.DataFrame({'PRODUCT_LVL_ID': [members['PRODUCT_LVL_ID1'].iloc[0], members['PRODUCT_ID'].iloc[5]]})
+    df_unfolded = product.unfold(top, 'PRODUCT_LVL_ID', ['PRODUCT_ID'])
+    assert len(df_unfolded) == len(members) + 1
+    assert df_unfolded['PRODUCT_ID'].iloc[-1] == members['PRODUCT_ID'].iloc[5]
+
+    print("dps hierarchy index test complete")
+
+
+if __name__ == '__main__':
+    test_interval_union()
+    test_time_interval_utility()
+    test_unfold_aggregated_data()
+    test_dps_hierarchy_index()
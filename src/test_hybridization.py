@@ -1,7 +1,9 @@
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
-from hybridization import hybridization, IB_ZERO_DEMAND_THRESHOLD
+from hybridization import hybridization, IB_ZERO_DEMAND_THRESHOLD, HYBRIDIZATION_RULES
+from storage import write_table
+from synthetic import reconciled_forecast
 
 
 def generate_reconciled_forecast_data(
@@ -11,34 +13,8 @@ def generate_reconciled_forecast_data(
     num_locations: int = 3
 ) -> pd.DataFrame:
     
-    dates = pd.date_range(start=start_date, end=end_date, freq='D')
-    products = [f'PROD_{i:03d}' for i in range(1, num_products + 1)]
-    locations = [f'LOC_{i:03d}' for i in range(1, num_locations + 1)]
-    
-    records = []
-    
-    for date in dates:
-        for product in products:
-            for location in locations:
-                record = {
-                    'PRODUCT_LVL_ID': product,
-                    'LOCATION_LVL_ID': location,
-                    'CUSTOMER_LVL_ID': f'CUST_{np.random.randint(1, 100):03d}',
-                    'DISTR_CHANNEL_LVL_ID': f'CH_{np.random.randint(1, 5):01d}',
-                    'PERIOD_DT': date,
-                    'PERIOD_END_DT': date + timedelta(days=1),
-                    'TS_FORECAST_VALUE_REC': abs(np.random.normal(100, 30)),
-                    'ML_FORECAST_VALUE': abs(np.random.normal(100, 30)),
-                    'SEGMENT_NAME': np.random.choice([
-                        'Regular', 'Short', 'Retired', 'Low Volume', None
-                    ], p=[0.5, 0.15, 0.15, 0.15, 0.05]),
-                    'DEMAND_TYPE': np.random.choice(['regular', 'promo'], p=[0.7, 0.3]),
-                    'ASSORTMENT_TYPE': np.random.choice(['old', 'new'], p=[0.8, 0.2])
-                }
-                
-                records.append(record)
-    
-    df = pd.DataFrame(records)
+    num_periods = len(pd.date_range(start=start_date, end=end_date, freq='D'))
+    df = reconciled_forecast(num_products * num_locations, num_periods, start=start_date, num_products=num_products)
     
     df.loc[0, 'SEGMENT_NAME'] = 'Retired'
     df.loc[0, 'TS_FORECAST_VALUE_REC'] = 0.005
@@ -233,6 +209,58 @@ def show_detailed_examples():
             print(f"  ensemble value {row['ENSEMBLE_FORECAST_VALUE']:.3f}")
 
 
+def test_rule_outputs():
+    
+    print("\nrule outputs test")
+    
+    df_input = pd.DataFrame({
+        'TS_FORECAST_VALUE_REC': [80.0, 60.0, 0.005, 0.005, 75.0, np.nan, 45.0, np.nan],
+        'ML_FORECAST_VALUE': [120.0, 95.0, 50.0, 50.0, 85.0, 55.0, np.nan, np.nan],
+        'SEGMENT_NAME': ['Regular', 'Short', 'Retired', 'Regular', 'Regular', 'Regular', None, 'Regular'],
+        'DEMAND_TYPE': ['PROMO', 'regular', 'promo', 'regular', 'regular', 'regular', 'regular', 'regular'],
+        'ASSORTMENT_TYPE': ['old', 'old', 'old', 'old', 'old', 'old', 'old', 'old']
+    })
+    
+    df_output = hybridization(df_input)
+    print(df_output[['FORECAST_SOURCE', 'HYBRID_FORECAST_VALUE', 'ENSEMBLE_FORECAST_VALUE']].to_string())
+    
+    assert df_output['FORECAST_SOURCE'].tolist() == ['ml', 'ml', 'ts', 'ensemble', 'ensemble', 'ensemble', 'ensemble', 'ensemble']
+    expected_hybrid = [120.0, 95.0, 0.005, 0.005, 80.0, 55.0, 45.0, np.nan]
+    expected_ensemble = [np.nan, np.nan, np.nan, 25.0025, 80.0, 55.0, 45.0, np.nan]
+    assert np.allclose(df_output['HYBRID_FORECAST_VALUE'], expected_hybrid, equal_nan=True)
+    assert np.allclose(df_output['ENSEMBLE_FORECAST_VALUE'], expected_ensemble, equal_nan=True)
+    
+    print("rule outputs test complete")
+
+
+def test_custom_rules():
+    
+    print("\ncustom rules test")
+    
+    df_input = pd.DataFrame({
+        'DISTR_CHANNEL_LVL_ID': ['CH1', 'CH2', 'CH2', 'CH2'],
+        'TS_FORECAST_VALUE_REC': [80.0, 60.0, 0.005, 40.0],
+        'ML_FORECAST_VALUE': [120.0, 100.0, 50.0, np.nan],
+        'SEGMENT_NAME': ['Regular', 'Regular', 'Retired', 'Regular'],
+        'DEMAND_TYPE': ['regular', 'regular', 'regular', 'regular'],
+        'ASSORTMENT_TYPE': ['old', 'old', 'old', 'old']
+    })
+    
+    channel_rule = {
+        'conditions': [('DISTR_CHANNEL_LVL_ID', '==', 'ch2'), ('SEGMENT_NAME', '!=', 'retired')],
+        'source': 'ensemble',
+        'weights': {'ts': 0.25, 'ml': 0.75},
+        'ensemble': True
+    }
+    df_output = hybridization(df_input, rules=[channel_rule] + HYBRIDIZATION_RULES)
+    print(df_output[['DISTR_CHANNEL_LVL_ID', 'FORECAST_SOURCE', 'HYBRID_FORECAST_VALUE']].to_string())
+    
+    assert df_output['FORECAST_SOURCE'].tolist() == ['ensemble', 'ensemble', 'ts', 'ensemble']
+    assert np.allclose(df_output['HYBRID_FORECAST_VALUE'], [100.0, 90.0, 0.005, 40.0])
+    
+    print("custom rules test complete")
+
+
 def test_mid_term_hybrid_forecast():
     
     print("\nmid-term test")
@@ -326,13 +354,15 @@ def test_mid_term_hybrid_forecast():
 if __name__ == '__main__':
     df_result = test_hybridization()
     show_detailed_examples()
+    test_rule_outputs()
+    test_custom_rules()
     df_mid_term = test_mid_term_hybrid_forecast()
     
-    output_file = 'hybrid_forecast_output.csv'
-    df_result.to_csv(output_file, index=False)
+    output_file = 'hybrid_forecast_output'
+    write_table(df_result, output_file)
     print(f"\nresults saved to {output_file}")
     
-    output_file_mid = 'mid_term_hybrid_forecast_output.csv'
-    df_mid_term.to_csv(output_file_mid, index=False)
+    output_file_mid = 'mid_term_hybrid_forecast_output'
+    write_table(df_mid_term, output_file_mid)
     print(f"mid-term saved to {output_file_mid}")
 
@@ -1,58 +1,17 @@
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
-from reconciliation import reconciliation
+from reconciliation import reconciliation, parallel_reconciliation, prorate, reconciliation_ratio, _series_partitions
+from intervals import overlap_pairs
+from time_levels import period_days, period_end_dt
+from storage import write_table
+from synthetic import forecasts
 
 
-def generate_test_data():
-    
-    dates = pd.date_range(start='2024-01-01', end='2024-01-31', freq='D')
-    
-    ts_data = []
-    ml_data = []
-    
-    for date in dates:
-        for prod in ['P001', 'P002', 'P003']:
-            for loc in ['L001', 'L002']:
-                ts_data.append({
-                    'PRODUCT_LVL_ID': prod,
-                    'LOCATION_LVL_ID': loc,
-                    'CUSTOMER_LVL_ID': 'C001',
-                    'DISTR_CHANNEL_LVL_ID': 'CH1',
-                    'PERIOD_DT': date,
-                    'PERIOD_END_DT': date,
-                    'FORECAST_VALUE': np.random.uniform(50, 150)
-                })
-                
-                ml_data.append({
-                    'PRODUCT_LVL_ID': prod,
-                    'LOCATION_LVL_ID': loc,
-                    'CUSTOMER_LVL_ID': 'C001',
-                    'DISTR_CHANNEL_LVL_ID': 'CH1',
-                    'PERIOD_DT': date,
-                    'PERIOD_END_DT': date,
-                    'FORECAST_VALUE': np.random.uniform(60, 140),
-                    'DEMAND_TYPE': np.random.choice(['promo', 'regular']),
-                    'ASSORTMENT_TYPE': np.random.choice(['new', 'old'])
-                })
-    
-    df_ts = pd.DataFrame(ts_data)
-    df_ml = pd.DataFrame(ml_data)
-    
-    segments_data = []
-    for prod in ['P001', 'P002', 'P003']:
-        for loc in ['L001', 'L002']:
-            segments_data.append({
-                'product_lvl_id': prod,
-                'location_lvl_id': loc,
-                'customer_lvl_id': 'C001',
-                'distr_channel_lvl_id': 'CH1',
-                'SEGMENT_NAME': np.random.choice(['Regular', 'Short', 'Retired', 'Low Volume'])
-            })
-    
-    df_segments = pd.DataFrame(segments_data)
-    
-    return df_ts, df_ml, df_segments
+def generate_test_data(seed=None):
+    
+    # 3 products x 2 locations, daily forecasts for January 2024
+    return forecasts(6, 31, start='2024-01-01', num_products=3, seed=seed)
 
 
 def test_reconciliation():
@@ -88,8 +47,103 @@ def test_reconciliation():
     return df_result
 
 
+def test_interval_join():
+    
+    print("interval join test started")
+    
+    df_ts, df_ml, _ = generate_test_data()
+    df_ts = df_ts.sample(frac=1, random_state=0).reset_index(drop=True)
+    df_ts['PERIOD_END_DT'] = df_ts['PERIOD_DT'] + timedelta(days=6)
+    keys = ['PRODUCT_LVL_ID', 'LOCATION_LVL_ID', 'CUSTOMER_LVL_ID', 'DISTR_CHANNEL_LVL_ID']
+    
+    ml_idx, ts_idx = overlap_pairs(df_ml, df_ts, keys)
+    
+    df_cross = df_ml.reset_index().merge(df_ts.reset_index(), how='cross', suffixes=('_ml', '_ts'))
+    df_cross = df_cross[
+        (df_cross['PERIOD_DT_ml'] <= df_cross['PERIOD_END_DT_ts']) &
+        (df_cross['PERIOD_END_DT_ml'] >= df_cross['PERIOD_DT_ts'])
+    ]
+    for key in keys:
+        df_cross = df_cross[df_cross[key + '_ml'] == df_cross[key + '_ts']]
+    
+    print(f"pairs {len(ml_idx)} expected {len(df_cross)}")
+    assert ml_idx.tolist() == df_cross['index_ml'].tolist()
+    assert ts_idx.tolist() == df_cross['index_ts'].tolist()
+    
+    print("interval join test complete")
+
+
+def test_period_calendar():
+    
+    print("period calendar test started")
+    
+    period_dt = pd.Series(pd.to_datetime(['2024-01-01', '2024-02-01', '2023-02-01', '2024-04-15']))
+    
+    assert period_days('MONTH', period_dt).tolist() == [31, 29, 28, 30]
+    assert period_days('WEEK.2', period_dt).tolist() == [7, 7, 7, 7]
+    assert period_days('DAY', period_dt).tolist() == [1, 1, 1, 1]
+    
+    end_dt = period_end_dt('MONTH', period_dt)
+    print(end_dt.tolist())
+    assert end_dt.tolist() == list(pd.to_datetime(['2024-01-31', '2024-02-29', '2023-02-28', '2024-05-14']))
+    
+    print("period calendar test complete")
+
+
+def test_ratio_kernels():
+    
+    print("ratio kernels test started")
+    
+    values = prorate([70.0, np.nan, 31.0, 10.0], [3, 5, 31, 4], [7, 7, 31, 0])
+    print(values)
+    assert np.allclose(values, [30.0, np.nan, 31.0, 10.0], equal_nan=True)
+    
+    ratio = reconciliation_ratio([50.0, np.nan, 10.0, 10.0], [100.0, 20.0, 0.0, np.nan])
+    print(ratio)
+    assert ratio.tolist() == [0.5, 1.0, 0.0, 0.0]
+    
+    print("ratio kernels test complete")
+
+
+def test_parallel_reconciliation():
+    
+    print("parallel reconciliation test started")
+    
+    df_ts, df_ml, df_segments = generate_test_data()
+    
+    config = {
+        'IB_HIST_END_DT': datetime(2023, 12, 31),
+        'IB_FC_HORIZ': 90,
+        'delays_config_length': 20
+    }
+    
+    df_single = reconciliation(df_ts, df_ml, df_segments, config)
+    df_parallel = parallel_reconciliation(df_ts, df_ml, df_segments, config, n_workers=2, n_partitions=4)
+    
+    print(f"single {len(df_single)} records, parallel {len(df_parallel)} records")
+    pd.testing.assert_frame_equal(df_single, df_parallel)
+    
+    # no series with both forecasts, nothing for the workers
+    df_ml_other = df_ml.assign(PRODUCT_LVL_ID=df_ml['PRODUCT_LVL_ID'] + 100)
+    pd.testing.assert_frame_equal(parallel_reconciliation(df_ts, df_ml_other, df_segments, config, n_workers=2),
+                                  reconciliation(df_ts, df_ml_other, df_segments, config))
+    
+    # a series keeps its partition when other series are missing, float and int keys match
+    partitions = _series_partitions([df_ts, df_ml], 4)
+    subset = df_ts[df_ts['PRODUCT_LVL_ID'] != df_ts['PRODUCT_LVL_ID'].iloc[0]]
+    assert np.array_equal(_series_partitions([subset], 4)[0], partitions[0][df_ts.index.get_indexer(subset.index)])
+    assert np.array_equal(_series_partitions([df_ts.astype({'PRODUCT_LVL_ID': float})], 4)[0], partitions[0])
+    assert len(np.unique(partitions[0])) > 1
+    
+    print("parallel reconciliation test complete")
+
+
 if __name__ == '__main__':
     df_result = test_reconciliation()
-    df_result.to_csv('reconciled_forecast_output.csv', index=False)
-    print("\nsaved to reconciled_forecast_output.csv")
+    test_interval_join()
+    test_period_calendar()
+    test_ratio_kernels()
+    test_parallel_reconciliation()
+    write_table(df_result, 'reconciled_forecast_output')
+    print("\nsaved to reconciled_forecast_output")
 
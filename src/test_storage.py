@@ -0,0 +1,92 @@
+import tempfile
+import pandas as pd
+from datetime import datetime
+from disaccumulation import Disaccumulation
+from hybridization import hybridization
+from reconciliation import reconciliation
+from storage import write_table, read_table
+from test_disaccumulation import generate_aggregated_forecast
+from test_demand_restoration import generate_daily_history
+from test_reconciliation import generate_test_data
+
+
+def test_storage_roundtrip():
+
+    print("storage roundtrip test started")
+
+    df_output = Disaccumulation(generate_aggregated_forecast(), 'D').split_forecasts()
+    keys = ['PRODUCT_LVL_ID6', 'PERIOD_DT']
+
+    for format in ['parquet', 'arrow']:
+        path = tempfile.mkdtemp() + '/disaccumulated_forecast'
+        write_table(df_output, path, format=format, product_lvl=6)
+        df_read = read_table(path, format=format).sort_values(keys, ignore_index=True)
+        pd.testing.assert_frame_equal(df_read, df_output.sort_values(keys, ignore_index=True))
+
+        # projection and PERIOD_DT pushdown
+        df_horizon = read_table(path, format=format, columns=['PRODUCT_LVL_ID6', 'PERIOD_DT', 'HYBRID_FORECAST_VALUE'],
+                                start='2024-03-10', end='2024-04-05', product_lvl=6)
+        expected = df_output[df_output['PERIOD_DT'].between('2024-03-10', '2024-04-05')]
+        print(f"{format}: {len(df_horizon)} of {len(df_read)} rows in horizon")
+        assert list(df_horizon.columns) == ['PRODUCT_LVL_ID6', 'PERIOD_DT', 'HYBRID_FORECAST_VALUE']
+        assert len(df_horizon) == len(expected)
+        assert len(read_table(path, format=format, product_lvl=5)) == 0
+
+    print("storage roundtrip test complete")
+
+
+def test_restored_demand_roundtrip():
+
+    print("restored demand storage test started")
+
+    df = generate_daily_history()
+    # demand_restoration_algorithm returns periods as dates
+    df['PERIOD_DT'] = df['PERIOD_DT'].dt.date
+    keys = ['PRODUCT_ID', 'LOCATION_ID', 'PERIOD_DT']
+
+    path = tempfile.mkdtemp() + '/restored_demand'
+    write_table(df, path)
+    df_read = read_table(path, start='2024-02-01')
+    print(f"{len(df_read)} of {len(df)} rows since 2024-02-01")
+    expected = df[pd.to_datetime(df['PERIOD_DT']) >= '2024-02-01']
+    pd.testing.assert_frame_equal(df_read.sort_values(keys, ignore_index=True), expected.sort_values(keys, ignore_index=True))
+
+    print("restored demand storage test complete")
+
+
+def test_stage_paths():
+
+    print("stage paths test started")
+
+    path = tempfile.mkdtemp()
+    df_ts, df_ml, df_segments = generate_test_data(seed=3)
+    write_table(df_ts, path + '/ts_forecast')
+    write_table(df_ml, path + '/ml_forecast')
+    config = {'IB_HIST_END_DT': datetime(2024, 1, 10), 'IB_FC_HORIZ': 90, 'delays_config_length': 10,
+              'ts_time_lvl': 'DAY', 'ml_time_lvl': 'DAY'}
+
+    # stages read their inputs from datasets and write their outputs as datasets
+    df_reconciled = reconciliation(path + '/ts_forecast', path + '/ml_forecast', df_segments,
+                                   config, output_path=path + '/reconciled_forecast')
+    df_hybrid = hybridization(path + '/reconciled_forecast', output_path=path + '/hybrid_forecast')
+    df_split = Disaccumulation(generate_aggregated_forecast(), 'D', output_path=path + '/disaccumulated_forecast').split_forecasts()
+
+    # same results as the in-memory stages
+    keys = ['product_lvl_id', 'location_lvl_id', 'customer_lvl_id', 'distr_channel_lvl_id', 'PERIOD_DT']
+    expected = reconciliation(df_ts, df_ml, df_segments, config)
+    print(f"{len(df_reconciled)} reconciled rows read from {len(df_ts[df_ts['PERIOD_DT'] >= '2024-01-10'])} ts rows")
+    pd.testing.assert_frame_equal(df_reconciled.sort_values(keys, ignore_index=True),
+                                  expected.sort_values(keys, ignore_index=True), check_dtype=False)
+    pd.testing.assert_frame_equal(read_table(path + '/hybrid_forecast').sort_values(keys, ignore_index=True),
+                                  df_hybrid.sort_values(keys, ignore_index=True))
+    assert len(read_table(path + '/disaccumulated_forecast')) == len(df_split)
+    df_read = Disaccumulation(path + '/disaccumulated_forecast', 'D').split_forecasts()
+    assert len(df_read) == len(df_split)
+
+    print("stage paths test complete")
+
+
+if __name__ == '__main__':
+    test_storage_roundtrip()
+    test_restored_demand_roundtrip()
+    test_stage_paths()
@@ -0,0 +1,87 @@
+import time
+import numpy as np
+import pandas as pd
+from synthetic import SERIES_KEYS, cartesian, series_keys, hierarchy, forecasts, reconciled_forecast, sales_history
+from hierarchy import HierarchyIndex
+from reconciliation import reconciliation
+from hybridization import hybridization
+
+
+def test_sales_history():
+
+    print("sales history test started")
+
+    start = time.perf_counter()
+    SALES, PROMO, STOCK = sales_history(3000, 120, num_products=100, num_customers=2, seed=7)
+    print(f"{len(SALES)} sales, {len(PROMO)} promos, {len(STOCK)} stock rows in {time.perf_counter() - start:.2f}s")
+    assert len(SALES) == 3000 * 120 and len(SALES[SERIES_KEYS].drop_duplicates()) == 3000
+    assert SALES['PERIOD_DT'].nunique() == 120 and len(STOCK) == 1500 * 120
+
+    # same seed, same tables
+    pd.testing.assert_frame_equal(SALES, sales_history(3000, 120, num_products=100, num_customers=2, seed=7)[0])
+
+    # promo days are inside the window of their PROMO_ID
+    promo_days = SALES[SALES['PROMO_FLG'] == 1].merge(PROMO, on=['PROMO_ID'] + SERIES_KEYS)
+    assert len(promo_days) == SALES['PROMO_FLG'].sum() > 0
+    assert ((promo_days['PERIOD_DT'] >= promo_days['PERIOD_START_DT']) &
+            (promo_days['PERIOD_DT'] <= promo_days['PERIOD_END_DT'])).all()
+    assert SALES.loc[SALES['PROMO_FLG'] == 0, 'PROMO_ID'].isna().all()
+
+    # sales never exceed the stock, some days run out of it
+    first = SALES.merge(STOCK, on=['PRODUCT_ID', 'LOCATION_ID', 'PERIOD_DT'])
+    first = first[first['CUSTOMER_ID'] == 1]
+    assert (first['SALES_QTY'] <= first['STOCK_QTY']).all() and (first['SALES_QTY'] == first['STOCK_QTY']).any()
+
+    print("sales history test complete")
+
+
+def test_forecasts():
+
+    print("forecasts test started")
+
+    ts, ml, segments = forecasts(20, 12, start='2024-01-01', freq='7D', num_products=10, seed=1)
+    assert len(ts) == len(ml) == 240 and len(segments) == 20
+    assert (ts['PERIOD_END_DT'] - ts['PERIOD_DT'] == pd.Timedelta(days=6)).all()
+    assert set(ml['DEMAND_TYPE']) == {'regular', 'promo'} and (ts['FORECAST_VALUE'] > 0).all()
+
+    df = reconciliation(ts, ml, segments, {'IB_HIST_END_DT': pd.Timestamp('2023-12-31'), 'ts_time_lvl': 'DAY', 'ml_time_lvl': 'DAY'})
+    print(f"{len(df)} reconciled rows")
+    assert len(df) == len(ts)
+
+    df = reconciled_forecast(50, 10, seed=2)
+    df_hybrid = hybridization(df)
+    print(df_hybrid['FORECAST_SOURCE'].value_counts().to_dict())
+    assert set(df_hybrid['FORECAST_SOURCE']) == {'ml', 'ts', 'ensemble'}
+    assert df['SEGMENT_NAME'].isna().any()
+
+    print("forecasts test complete")
+
+
+def test_keys_and_hierarchy():
+
+    print("keys and hierarchy test started")
+
+    keys = series_keys(10, num_products=4)
+    assert keys['PRODUCT_ID'].tolist() == [1, 2, 3, 4, 1, 2, 3, 4, 1, 2]
+    assert keys['LOCATION_ID'].tolist() == [1, 1, 1, 1, 2, 2, 2, 2, 3, 3]
+
+    # same rows and order as a chain of cross merges
+    dates = pd.date_range('2024-01-01', periods=3)
+    products = pd.Series([3, 1, 2], dtype='Int32')
+    df_cross = pd.DataFrame({'PERIOD_DT': dates}).merge(products.rename('PRODUCT_ID'), how='cross')
+    df_cross = df_cross.merge(pd.DataFrame({'LOCATION_ID': [7, 8]}), how='cross')
+    pd.testing.assert_frame_equal(pd.DataFrame(cartesian({'PERIOD_DT': dates, 'PRODUCT_ID': products,
+                                                          'LOCATION_ID': np.array([7, 8])})), df_cross)
+
+    members = hierarchy('PRODUCT', 250, (1, 5, 50))
+    index = HierarchyIndex.from_dps('PRODUCT', members=members)
+    rows, member_rows = index.gather([members['PRODUCT_LVL_ID1'].iloc[0], members['PRODUCT_LVL_ID2'].iloc[0], 7])
+    assert np.bincount(rows).tolist() == [250, 50, 1] and member_rows[-1] == 6
+
+    print("keys and hierarchy test complete")
+
+
+if __name__ == '__main__':
+    test_sales_history()
+    test_forecasts()
+    test_keys_and_hierarchy()
@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+
+
+def as_datetime(values):
+    """Datetime Series from values, without re-parsing columns that already are datetime64"""
+    values = pd.Series(values)
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    return pd.to_datetime(values)
+
+
+def _time_lvl_kind(time_lvl):
+    time_lvl = time_lvl.lower()
+    if time_lvl == 'day':
+        return 'day'
+    elif time_lvl.startswith('week'):
+        return 'week'
+    elif time_lvl == 'month':
+        return 'month'
+    return 'day'
+
+
+def period_days(time_lvl, period_dt):
+    """
+    Number of days in the periods starting at period_dt, for a whole column at once
+
+    Parameters
+    ----------
+    time_lvl : str
+        Time level like 'DAY', 'WEEK.2', 'MONTH' (unknown levels are treated as days)
+    period_dt : pd.Series
+        Period start dates
+
+    Returns
+    -------
+    np.ndarray
+        Period lengths in days (int64), 0 where period_dt is missing
+    """
+    period_dt = as_datetime(period_dt)
+    kind = _time_lvl_kind(time_lvl)
+
+    if kind == 'month':
+        days = period_dt.dt.days_in_month.to_numpy(dtype=np.float64, na_value=0)
+        return days.astype(np.int64)
+
+    days = np.full(len(period_dt), 7 if kind == 'week' else 1, dtype=np.int64)
+    days[period_dt.isna().to_numpy()] = 0
+    return days
+
+
+def period_end_dt(time_lvl, period_dt):
+    """
+    Last day of the periods starting at period_dt, for a whole column at once
+
+    Parameters
+    ----------
+    time_lvl : str
+        Time level like 'DAY', 'WEEK.2', 'MONTH'
+    period_dt : pd.Series
+        Period start dates
+
+    Returns
+    -------
+    pd.Series
+        Period end dates (inclusive), aligned with period_dt
+    """
+    period_dt = as_datetime(period_dt)
+    days = period_days(time_lvl, period_dt)
+    return period_dt + pd.to_timedelta(np.maximum(days - 1, 0), unit='D')